@@ -89,6 +89,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.notifications',
             ],
         },
     },
@@ -152,6 +153,12 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per distinct content and reference counted (posts/storage.py, gc_media)
+STORAGES = {
+    'default': {'BACKEND': 'posts.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -166,6 +173,47 @@ EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='Instaclone <noreply@localhost>')
+
+# Home timeline (fan-out on write)
+# Number of recent posts copied into a timeline on follow and on rebuild; older followed posts are read from the posts table
+TIMELINE_BACKFILL_LIMIT = config('TIMELINE_BACKFILL_LIMIT', default=500, cast=int)
+# Authors with more followers than this are merged into feeds at read time instead of fanned out
+TIMELINE_CELEBRITY_THRESHOLD = config('TIMELINE_CELEBRITY_THRESHOLD', default=10000, cast=int)
+
+# Like counter write buffer
+# Coalesce like_count increments in the cache and flush them in one UPDATE per interval.
+# Only takes effect when the default cache is Redis (shared and non-evicting, see
+# posts/counters.py); with LocMem or Memcached likes are written straight to the row.
+COUNTER_BUFFER_ENABLED = config('COUNTER_BUFFER_ENABLED', default=False, cast=bool)
+COUNTER_FLUSH_INTERVAL = config('COUNTER_FLUSH_INTERVAL', default=5, cast=int)  # seconds
+
+# Explore trending scores
+# Dotted path to a callable (likes, comments, created_at, now) -> float, see posts/trending.py
+TRENDING_SCORE_FUNCTION = config('TRENDING_SCORE_FUNCTION', default='posts.trending.hot_score')
+# Posts newer than this are re-scored by rescore_trending
+TRENDING_RESCORE_WINDOW_DAYS = config('TRENDING_RESCORE_WINDOW_DAYS', default=7, cast=int)
+
+# Full-text search: age in days at which a match ranks half as high as a new one
+SEARCH_RECENCY_DAYS = config('SEARCH_RECENCY_DAYS', default=30, cast=int)
+
+# Likes of a post and new followers are folded into one notification while it is younger than this
+NOTIFICATION_GROUP_WINDOW_HOURS = config('NOTIFICATION_GROUP_WINDOW_HOURS', default=24, cast=int)
+
+# Live updates (users/realtime.py): pub/sub backend behind the SSE stream, and its keep-alive interval
+REALTIME_BROKER = config('REALTIME_BROKER', default='users.realtime.InProcessBroker')
+SSE_HEARTBEAT_SECONDS = config('SSE_HEARTBEAT_SECONDS', default=20, cast=int)
+
+# Notifications are emailed in one digest per recipient once the oldest unsent one is this old
+NOTIFICATION_DIGEST_WINDOW_MINUTES = config('NOTIFICATION_DIGEST_WINDOW_MINUTES', default=60, cast=int)
+
+# Notification retention (prune_notifications): read notifications older than this many days are deleted,
+# and every user keeps at most this many of their newest notifications
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=90, cast=int)
+NOTIFICATION_MAX_PER_USER = config('NOTIFICATION_MAX_PER_USER', default=1000, cast=int)
+
+# Widths (px) of the WebP and JPEG copies made of every post image, served to clients as a srcset
+IMAGE_RENDITION_WIDTHS = config('IMAGE_RENDITION_WIDTHS', default='150,320,640,1080', cast=Csv(int))
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark: Explore page latency, like-count aggregate vs. PostScore index.
+
+Builds a throwaway SQLite database with a skewed distribution of likes
+(1M by default) over a few thousand posts, then compares the old Explore
+query, which aggregates the likes table and sorts every post, with reading
+the first page off the precomputed trending score index. The one-off cost
+of a full ``rescore_trending --all`` pass is reported as well.
+
+Usage:
+    python benchmarks/explore_trending.py [--likes 1000000] [--posts 5000] [--reads 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def setup_django(db_path):
+    os.environ['DB_NAME'] = db_path
+    os.environ.setdefault('DEBUG', 'True')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'INSTACLONE.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def insert_users(cursor, count):
+    cursor.executemany(
+        "INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, "
+        "email, is_staff, is_active, date_joined) VALUES (?, '', 0, ?, '', '', '', 0, 1, '2025-01-01')",
+        ((user_id, f'user{user_id}') for user_id in range(1, count + 1))
+    )
+
+
+def insert_posts(cursor, count, authors):
+    cursor.executemany(
+        "INSERT INTO posts_post (id, user_id, image, caption, created_at, updated_at, is_active, like_count, "
+        "comment_count, processing) VALUES (?, ?, '', '', datetime('2025-01-01', ?), '2025-01-01', 1, 0, 0, 0)",
+        ((post_id, post_id % authors + 1, f'+{post_id} minutes') for post_id in range(1, count + 1))
+    )
+
+
+def insert_likes(cursor, posts, users, total):
+    """Zipf-like: post n gets about total / (n * H) likes, capped at the user count"""
+    rng = random.Random(42)
+    harmonic = sum(1 / rank for rank in range(1, posts + 1))
+    order = list(range(1, posts + 1))
+    rng.shuffle(order)
+    inserted = 0
+    for rank, post_id in enumerate(order, start=1):
+        count = min(users, max(1, round(total / (rank * harmonic))))
+        count = min(count, total - inserted)
+        if count <= 0:
+            break
+        cursor.executemany(
+            "INSERT INTO posts_post_likes (post_id, user_id) VALUES (?, ?)",
+            ((post_id, user_id) for user_id in rng.sample(range(1, users + 1), count))
+        )
+        inserted += count
+    return inserted
+
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--likes', type=int, default=1000000)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+
+        from django.db import connection, transaction
+        from django.db.models import Count
+        from posts.models import Post
+        from posts.trending import rescore_recent, trending_posts
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            insert_users(cursor, args.users)
+            insert_posts(cursor, args.posts, authors=100)
+            likes = insert_likes(cursor, args.posts, args.users, args.likes)
+            cursor.execute(
+                "UPDATE posts_post SET like_count = "
+                "(SELECT COUNT(*) FROM posts_post_likes WHERE post_id = posts_post.id)"
+            )
+        print(f'{args.posts} posts, {likes} likes')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            scored = rescore_recent(since=None)
+        print(f'full rescore of {scored} posts: {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        def aggregate_page():
+            return list(Post.objects.filter(is_active=True).annotate(
+                n=Count('likes', distinct=True)
+            ).order_by('-n', '-created_at').values_list('id', flat=True)[:args.page_size])
+
+        def trending_page():
+            return list(trending_posts().values_list('id', flat=True)[:args.page_size])
+
+        print(f'{"query":>22}  {"p50 (ms)":>10}')
+        print(f'{"Count(likes) aggregate":>22}  {median_ms(aggregate_page, args.reads):>10.2f}')
+        print(f'{"PostScore index":>22}  {median_ms(trending_page, args.reads):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
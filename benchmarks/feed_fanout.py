@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark: home feed latency as one author's follower count grows.
+
+Builds a throwaway SQLite database, gives a reader 50 regular followees with
+fanned-out posts plus one author whose follower count grows from 10 to 1M,
+and measures both the cost of that author publishing a post and the latency
+of reading the reader's first feed page at every step.
+
+Usage:
+    python benchmarks/feed_fanout.py [--max-followers 1000000] [--reads 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def setup_django(db_path):
+    os.environ['DB_NAME'] = db_path
+    os.environ.setdefault('DEBUG', 'True')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'INSTACLONE.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def insert_users(cursor, start, count):
+    cursor.executemany(
+        "INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, "
+        "email, is_staff, is_active, date_joined) VALUES (?, '', 0, ?, '', '', '', 0, 1, '2025-01-01')",
+        ((user_id, f'user{user_id}') for user_id in range(start, start + count))
+    )
+
+
+def insert_followers(cursor, following_id, start, count):
+    cursor.executemany(
+        "INSERT INTO posts_follow (follower_id, following_id, created_at) VALUES (?, ?, '2025-01-01')",
+        ((follower_id, following_id) for follower_id in range(start, start + count))
+    )
+
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-followers', type=int, default=1000000)
+    parser.add_argument('--reads', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection, transaction
+        from posts.models import Post, Follow
+        from posts.timeline import HomeTimeline, update_celebrity_status
+        from users.models import UserProfile
+
+        reader = User.objects.create(username='reader')
+        author = User.objects.create(username='author')
+        UserProfile.objects.create(user=author)
+        regulars = [User.objects.create(username=f'regular{i}') for i in range(50)]
+        for regular in regulars:
+            Follow.objects.create(follower=reader, following=regular)
+            for i in range(20):
+                Post.objects.create(user=regular, caption=f'post {i}')
+        Follow.objects.create(follower=reader, following=author)
+
+        print(f'celebrity threshold: {settings.TIMELINE_CELEBRITY_THRESHOLD} followers')
+        print(f'{"followers":>10}  {"mode":>8}  {"post (ms)":>10}  {"feed p50 (ms)":>14}')
+
+        next_user_id = User.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        followers = 1
+        steps = [n for n in (10, 100, 1000, 10000, 100000, 1000000) if n <= args.max_followers]
+        for target in steps:
+            with transaction.atomic(), connection.cursor() as cursor:
+                insert_users(cursor, next_user_id, target - followers)
+                insert_followers(cursor, author.id, next_user_id, target - followers)
+            next_user_id += target - followers
+            followers = target
+            # The raw inserts bypass the follow signals that keep the counter
+            UserProfile.objects.filter(user=author).update(followers_count=followers)
+            celebrity = update_celebrity_status(author.id)
+
+            started = time.perf_counter()
+            with transaction.atomic():
+                Post.objects.create(user=author, caption=f'at {target} followers')
+            post_ms = (time.perf_counter() - started) * 1000
+
+            feed = HomeTimeline(reader, queryset=Post.objects.select_related('user'))
+            feed_ms = median_ms(lambda: feed[0:args.page_size], args.reads)
+            mode = 'read' if celebrity else 'write'
+            print(f'{target:>10}  {mode:>8}  {post_ms:>10.2f}  {feed_ms:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Benchmark: idle SSE connections per worker and event fan-out latency.
+
+Drives the project's ASGI application in-process, the way an ASGI server
+would, with a growing number of authenticated clients all watching the same
+post on ``/api/users/notifications/stream/``. At every step it reports the
+memory held per idle connection, the CPU the worker burns while every client
+sits idle, and how long a like-count event published from a worker thread
+takes to reach the first, median, 99th percentile and last client.
+
+No network or server process is involved, so the numbers isolate the cost of
+the view, the middleware stack and the in-process broker.
+
+Usage:
+    python benchmarks/sse_fanout.py [--max-connections 5000] [--rounds 20] [--idle-seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def setup_django(db_path):
+    os.environ['DB_NAME'] = db_path
+    os.environ.setdefault('DEBUG', 'True')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'INSTACLONE.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def insert_users(cursor, start, count):
+    cursor.executemany(
+        "INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, "
+        "email, is_staff, is_active, date_joined) VALUES (?, '', 0, ?, '', '', '', 0, 1, '2025-01-01')",
+        ((user_id, f'user{user_id}') for user_id in range(start, start + count))
+    )
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux)"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Client:
+    """One SSE connection driven through the ASGI callable"""
+
+    def __init__(self, app, token, post_id):
+        self.app = app
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': '/api/users/notifications/stream/',
+            'raw_path': b'/api/users/notifications/stream/',
+            'query_string': f'posts={post_id}'.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        self.requested = False
+        self.disconnected = asyncio.Event()
+        self.status = None
+        self.waiting_for = None
+        self.arrived = None
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message.get('body', b'').startswith(b'event: like_count') and self.waiting_for is not None:
+            self.arrived.set_result(time.perf_counter())
+            self.waiting_for = None
+
+    def expect(self):
+        self.arrived = asyncio.get_running_loop().create_future()
+        self.waiting_for = True
+        return self.arrived
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.app(self.scope, self.receive, self.send))
+
+    async def close(self):
+        self.disconnected.set()
+        await self.task
+
+
+async def wait_for_connections(broker, count, timeout=300):
+    deadline = time.perf_counter() + timeout
+    while broker.connection_count() < count:
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f'only {broker.connection_count()} of {count} clients subscribed')
+        await asyncio.sleep(0.05)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(args):
+    from django.contrib.auth.models import User
+    from django.core.asgi import get_asgi_application
+    from django.db import connection, transaction
+    from rest_framework_simplejwt.tokens import AccessToken
+    from posts.models import Post
+    from users.realtime import get_broker, post_channel
+
+    app = get_asgi_application()
+    broker = get_broker()
+    author = await User.objects.acreate(username='author')
+    post = await Post.objects.acreate(user=author, caption='live')
+    message = {'event': 'like_count', 'data': {'post_id': post.id, 'total_likes': 1}}
+
+    def create_users(start, count):
+        with transaction.atomic(), connection.cursor() as cursor:
+            insert_users(cursor, start, count)
+
+    print(f'{"clients":>8}  {"KiB/conn":>9}  {"idle CPU %":>10}  '
+          f'{"first (ms)":>10}  {"p50 (ms)":>9}  {"p99 (ms)":>9}  {"last (ms)":>10}')
+    clients = []
+    next_user_id = 1000
+    steps = [n for n in (100, 1000, 2500, 5000, 10000, 20000) if n <= args.max_connections]
+    for target in steps:
+        new = target - len(clients)
+        await asyncio.to_thread(create_users, next_user_id, new)
+        baseline = rss_bytes()
+        for user_id in range(next_user_id, next_user_id + new):
+            client = Client(app, str(AccessToken.for_user(User(id=user_id))), post.id)
+            client.start()
+            clients.append(client)
+        next_user_id += new
+        await wait_for_connections(broker, len(clients))
+        per_connection = (rss_bytes() - baseline) / new / 1024
+        rejected = sum(1 for client in clients if client.status not in (None, 200))
+        if rejected:
+            raise RuntimeError(f'{rejected} clients were refused')
+
+        cpu_started = time.process_time()
+        await asyncio.sleep(args.idle_seconds)
+        idle_cpu = (time.process_time() - cpu_started) / args.idle_seconds * 100
+
+        firsts, medians, p99s, lasts = [], [], [], []
+        for _ in range(args.rounds):
+            arrivals = [client.expect() for client in clients]
+            published = time.perf_counter()
+            # Published from a worker thread, like a sync view handling a like
+            await asyncio.to_thread(broker.publish, post_channel(post.id), message)
+            latencies = [(arrival - published) * 1000 for arrival in await asyncio.gather(*arrivals)]
+            firsts.append(min(latencies))
+            medians.append(statistics.median(latencies))
+            p99s.append(percentile(latencies, 0.99))
+            lasts.append(max(latencies))
+        print(f'{target:>8}  {per_connection:>9.1f}  {idle_cpu:>10.2f}  {statistics.median(firsts):>10.2f}  '
+              f'{statistics.median(medians):>9.2f}  {statistics.median(p99s):>9.2f}  {statistics.median(lasts):>10.2f}')
+
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-connections', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--idle-seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Post, Comment, Follow
+from .models import Post, Comment, Follow, Hashtag, ImageJob, MediaBlob
 
 
 @admin.register(Post)
@@ -41,25 +41,29 @@ class PostAdmin(admin.ModelAdmin):
     caption_preview.short_description = 'Caption'
     
     def image_thumbnail(self, obj):
-        """Show image thumbnail"""
+        """Show image thumbnail, from the smallest rendition once there is one"""
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', obj.image.url)
+            renditions = [rendition for rendition in obj.renditions.all() if rendition.format == 'jpeg']
+            url = min(renditions, key=lambda rendition: rendition.width).file.url if renditions else obj.image.url
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', url)
         return '(No image)'
     image_thumbnail.short_description = 'Image'
     
     def likes_count(self, obj):
         """Show likes count"""
-        return obj.total_likes()
+        return obj.like_count
     likes_count.short_description = 'Likes'
+    likes_count.admin_order_field = 'like_count'
     
     def comments_count(self, obj):
         """Show comments count"""
-        return obj.comments.filter(is_active=True).count()
+        return obj.comment_count
     comments_count.short_description = 'Comments'
+    comments_count.admin_order_field = 'comment_count'
     
     def get_queryset(self, request):
         """Optimize queryset with select_related"""
-        return super().get_queryset(request).select_related('user').prefetch_related('likes', 'comments')
+        return super().get_queryset(request).select_related('user').prefetch_related('renditions')
 
 
 @admin.register(Comment)
@@ -106,3 +110,35 @@ class FollowAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queryset with select_related"""
         return super().get_queryset(request).select_related('follower', 'following')
+
+
+@admin.register(Hashtag)
+class HashtagAdmin(admin.ModelAdmin):
+    """Admin configuration for Hashtag model"""
+    
+    list_display = ('name', 'post_count', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('post_count', 'created_at')
+    list_per_page = 50
+    ordering = ('-post_count',)
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    """Admin configuration for queued and failed image jobs"""
+    
+    list_display = ('id', 'kind', 'object_id', 'status', 'attempts', 'created_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'object_id', 'attempts', 'error', 'claimed_at', 'created_at')
+    list_per_page = 50
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    """Admin configuration for stored uploads and their reference counts"""
+    
+    list_display = ('name', 'size', 'ref_count', 'last_used_at', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'size', 'ref_count', 'last_used_at', 'created_at')
+    ordering = ('-created_at',)
+    list_per_page = 50
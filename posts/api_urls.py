@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .api_views import (
     PostViewSet, FeedView, ExploreView, CommentViewSet,
-    FollowViewSet, SearchAPIView, UserPostsView
+    FollowViewSet, SearchAPIView, UserPostsView, TagFeedView
 )
 
 # Router for ViewSets
@@ -16,6 +16,9 @@ urlpatterns = [
     path('feed/', FeedView.as_view(), name='api-feed'),
     path('explore/', ExploreView.as_view(), name='api-explore'),
     
+    # Hashtag feed
+    path('tags/<str:tag>/', TagFeedView.as_view(), name='api-tag-feed'),
+    
     # Search
     path('search/', SearchAPIView.as_view(), name='api-search'),
     
@@ -1,24 +1,40 @@
 from rest_framework import generics, viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth.models import User
-from django.db.models import Q, Prefetch, Count
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from .models import Post, Comment, Follow
+from .models import Post, Comment, Follow, Hashtag
+from .timeline import HomeTimeline
+from .trending import trending_posts
+from .hashtags import normalize, tagged_posts
+from .filters import PostSearchFilter, PostOrderingFilter
+from .search import search_posts
+from users.typeahead import search_names
+from .pagination import KeysetPagination
 from .serializers import (
     PostSerializer, PostCreateSerializer, FeedPostSerializer,
-    CommentSerializer, FollowSerializer, SearchSerializer, UserBasicSerializer
+    CommentSerializer, FollowSerializer, SearchSerializer, UserBasicSerializer,
+    HashtagSerializer
 )
 from users.serializers import UserSearchSerializer
 
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(KeysetPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
 
+class CommentResultsSetPagination(StandardResultsSetPagination):
+    ordering = ('created_at', 'id')
+
+
+# Public ``?ordering=`` names of the post listings, see PostOrderingFilter
+POST_ORDERING_FIELDS = ['created_at', 'total_likes', 'total_comments']
+
+
 class PostViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing posts
@@ -26,15 +42,10 @@ class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.filter(is_active=True).select_related(
         'user', 'user__profile'
     ).prefetch_related(
-        'likes', 
         Prefetch('comments', queryset=Comment.objects.filter(is_active=True).select_related('user'))
-    ).annotate(
-        total_likes=Count('likes', distinct=True),
-        total_comments=Count('comments', filter=Q(comments__is_active=True), distinct=True)
     )
     pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['caption', 'user__username']
+    filter_backends = [PostSearchFilter, filters.OrderingFilter]
     ordering_fields = ['created_at']
     ordering = ['-created_at']
     
@@ -60,20 +71,27 @@ class PostViewSet(viewsets.ModelViewSet):
         instance.is_active = False
         instance.save()
     
-    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    @action(detail=True, methods=['post', 'put', 'delete'], permission_classes=[permissions.IsAuthenticated])
     def like(self, request, pk=None):
-        """Like or unlike a post"""
-        post = self.get_object()
+        """
+        Like a post (PUT), unlike it (DELETE) or toggle the like (POST).
+
+        PUT and DELETE are idempotent: repeating them leaves the like as is.
+        """
+        # Only the id is needed; skip the comment prefetch of the default queryset
+        post = get_object_or_404(Post.objects.filter(is_active=True), pk=pk)
         user = request.user
         
-        if user in post.likes.all():
-            post.likes.remove(user)
-            liked = False
-            message = 'Post unliked successfully'
-        else:
-            post.likes.add(user)
-            liked = True
-            message = 'Post liked successfully'
+        with transaction.atomic():  # Commit the notification event with the like
+            if request.method == 'PUT':
+                post.add_like(user)
+                liked = True
+            elif request.method == 'DELETE':
+                post.remove_like(user)
+                liked = False
+            else:
+                liked = post.toggle_like(user)
+        message = 'Post liked successfully' if liked else 'Post unliked successfully'
         
         return Response({
             'liked': liked,
@@ -85,9 +103,9 @@ class PostViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         """Get comments for a post"""
         post = self.get_object()
-        comments = post.comments.filter(is_active=True).select_related('user').order_by('created_at')
+        comments = post.comments.filter(is_active=True).select_related('user')
         
-        paginator = StandardResultsSetPagination()
+        paginator = CommentResultsSetPagination()
         page = paginator.paginate_queryset(comments, request)
         
         serializer = CommentSerializer(page, many=True, context={'request': request})
@@ -100,7 +118,8 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer = CommentSerializer(data=request.data, context={'request': request})
         
         if serializer.is_valid():
-            serializer.save(post=post, user=request.user)
+            with transaction.atomic():  # Commit the notification event with the comment
+                serializer.save(post=post, user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -113,24 +132,16 @@ class FeedView(generics.ListAPIView):
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    filter_backends = []
+    
     def get_queryset(self):
-        user = self.request.user
-        following_users = user.following.values_list('following', flat=True)
-        
-        # Get posts from followed users and own posts
-        followed_posts = Post.objects.filter(
-            Q(user__in=following_users) | Q(user=user),
-            is_active=True
-        ).select_related(
-            'user', 'user__profile'
-        ).prefetch_related(
-            'likes'
-        ).annotate(
-            total_likes=Count('likes', distinct=True),
-            total_comments=Count('comments', filter=Q(comments__is_active=True), distinct=True)
-        ).order_by('-created_at')
-        
-        return followed_posts
+        # Posts from followed users and own posts, merged from the timeline, followed celebrities
+        # and the posts older than the timeline backfill
+        return HomeTimeline(
+            self.request.user,
+            queryset=Post.objects.select_related('user', 'user__profile'),
+            include_backlog=True
+        )
 
 
 class ExploreView(generics.ListAPIView):
@@ -140,16 +151,35 @@ class ExploreView(generics.ListAPIView):
     serializer_class = FeedPostSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.AllowAny]
+    filter_backends = [PostOrderingFilter]
+    ordering_fields = POST_ORDERING_FIELDS
+    keyset_ordering = ('-score__score', '-id')
     
     def get_queryset(self):
-        return Post.objects.filter(
-            is_active=True
-        ).select_related(
-            'user', 'user__profile'
-        ).annotate(
-            total_likes=Count('likes', distinct=True),
-            total_comments=Count('comments', filter=Q(comments__is_active=True), distinct=True)
-        ).order_by('-total_likes', '-created_at')
+        # Pre-sorted range of the trending score index, see posts.trending
+        return trending_posts().select_related('user', 'user__profile')
+
+
+class TagFeedView(generics.ListAPIView):
+    """
+    API view for the posts tagged with a hashtag, newest first
+    """
+    serializer_class = FeedPostSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [permissions.AllowAny]
+    filter_backends = [PostOrderingFilter]
+    ordering_fields = POST_ORDERING_FIELDS
+    keyset_ordering = ('-tagged_at', '-id')
+    
+    def get_queryset(self):
+        self.hashtag = get_object_or_404(Hashtag, name=normalize(self.kwargs['tag']))
+        # Range of the (hashtag, -created_at) index, see posts.hashtags
+        return tagged_posts(self.hashtag).select_related('user', 'user__profile')
+    
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = {'hashtag': HashtagSerializer(self.hashtag).data, **response.data}
+        return response
 
 
 class CommentViewSet(viewsets.ModelViewSet):
@@ -158,6 +188,8 @@ class CommentViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommentResultsSetPagination
+    ordering_fields = ['created_at']
     
     def get_queryset(self):
         return Comment.objects.filter(
@@ -165,7 +197,8 @@ class CommentViewSet(viewsets.ModelViewSet):
         ).select_related('user', 'post')
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():  # Commit the notification event with the comment
+            serializer.save(user=self.request.user)
     
     def perform_destroy(self, instance):
         # Only allow deletion of own comments
@@ -184,6 +217,8 @@ class FollowViewSet(viewsets.ModelViewSet):
     """
     serializer_class = FollowSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    ordering_fields = ['created_at']
     http_method_names = ['get', 'post', 'delete']
     
     def get_queryset(self):
@@ -284,23 +319,17 @@ class SearchAPIView(generics.GenericAPIView):
                 'total_results': 0
             })
         
-        # Search users
-        users_queryset = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        ).select_related('profile')[:10]
+        # Users whose names start with the query, most followed first, then substring matches
+        users_queryset = search_names(query, limit=10)
         
-        # Search posts
-        posts_queryset = Post.objects.filter(
-            Q(caption__icontains=query),
-            is_active=True
-        ).select_related(
-            'user', 'user__profile'
-        ).prefetch_related('likes', 'comments').annotate(
-            total_likes=Count('likes', distinct=True),
-            total_comments=Count('comments', filter=Q(comments__is_active=True), distinct=True)
-        ).order_by('-created_at')[:10]
+        # Search posts, ranked by relevance and recency
+        posts_queryset = search_posts(
+            query,
+            queryset=Post.objects.select_related('user', 'user__profile').prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.filter(is_active=True).select_related('user'))
+            ),
+            limit=10
+        )
         
         # Serialize results
         users_serializer = UserSearchSerializer(
@@ -329,6 +358,8 @@ class UserPostsView(generics.ListAPIView):
     serializer_class = PostSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.AllowAny]
+    filter_backends = [PostOrderingFilter]
+    ordering_fields = POST_ORDERING_FIELDS
     
     def get_queryset(self):
         username = self.kwargs.get('username')
@@ -339,7 +370,4 @@ class UserPostsView(generics.ListAPIView):
             is_active=True
         ).select_related(
             'user', 'user__profile'
-        ).prefetch_related('likes', 'comments').annotate(
-            total_likes=Count('likes', distinct=True),
-            total_comments=Count('comments', filter=Q(comments__is_active=True), distinct=True)
-        ).order_by('-created_at')
\ No newline at end of file
+        ).prefetch_related('comments')
\ No newline at end of file
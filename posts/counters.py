@@ -0,0 +1,232 @@
+"""
+Denormalized engagement counters on Post.
+
+``like_count`` and ``comment_count`` are adjusted with atomic ``F()``
+updates whenever a like or an active comment is added or removed, so read
+paths never need to count the likes or comments tables.
+
+With ``COUNTER_BUFFER_ENABLED`` like increments are not written straight to
+the post row. They are accumulated in the cache by a CounterBuffer and
+applied in one batched UPDATE per ``COUNTER_FLUSH_INTERVAL``, so a viral post
+no longer serializes every like on its row lock. ``Post.total_likes()`` adds
+the pending delta to the stored value. Buffered deltas only exist in the
+cache, so the buffer is only used when the cache is shared by every worker
+and does not evict keys (``DURABLE_CACHE_BACKENDS``, i.e. Redis); with any
+other backend, such as the default LocMemCache, likes are written straight
+through.
+
+``reconcile_post_counters`` recomputes both counters from the source tables
+to repair drift left by bulk updates that bypass signals.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Post, Comment
+from . import trending
+
+FLUSH_BATCH_SIZE = 500
+COUNTER_FIELDS = ('like_count', 'comment_count')
+
+# Cache backends shared across processes that keep keys without a timeout
+DURABLE_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django_redis.cache.RedisCache',
+)
+
+
+def buffer_enabled():
+    """Whether like deltas go through the buffer: requested and backed by a durable cache"""
+    if not getattr(settings, 'COUNTER_BUFFER_ENABLED', False):
+        return False
+    return settings.CACHES.get(buffer.cache_alias, {}).get('BACKEND') in DURABLE_CACHE_BACKENDS
+
+
+def get_flush_interval():
+    """Seconds between buffered counter flushes"""
+    return getattr(settings, 'COUNTER_FLUSH_INTERVAL', 5)
+
+
+class CounterBuffer:
+    """
+    Per-post counter deltas held in the Django cache, shared by all workers.
+
+    Deltas are written to the current *epoch*. A flush applies the previous
+    epoch, which has not accepted writes for at least one interval, and then
+    opens a new one; so nothing is read and reset while another worker may
+    still be adding to it. Every key touched in an epoch is recorded in a
+    numbered dirty log so a flush only visits posts that actually changed.
+
+    The current epoch and the last flushed one are kept together in one
+    ``state`` key. ``pending()`` only reads epochs after the flushed one, so
+    the single write that records a flush hides every delta it applied; the
+    keys themselves are deleted afterwards.
+
+    Flushing happens opportunistically on the first write after each
+    interval; ``flush_counters`` drains the buffer from cron or on deploy.
+    """
+    key_prefix = 'post-counters'
+
+    def __init__(self, fields=('like_count',), cache_alias='default'):
+        self.fields = fields
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, *parts):
+        return ':'.join([self.key_prefix, *map(str, parts)])
+
+    def state(self):
+        """(epoch accepting writes, last epoch applied to the database)"""
+        state = self.cache.get(self._key('state'))
+        if state is None:
+            self.cache.add(self._key('state'), (1, 0), None)
+            state = self.cache.get(self._key('state'), (1, 0))
+        return state
+
+    def epoch(self):
+        return self.state()[0]
+
+    def _add_or_incr(self, key, delta):
+        """Add ``delta`` to ``key``, creating it when missing; True when this call created it"""
+        while True:
+            if self.cache.add(key, delta, None):
+                return True
+            try:
+                self.cache.incr(key, delta)
+                return False
+            except ValueError:
+                continue  # Deleted between add() and incr(), e.g. by a flush; create it again
+
+    def add(self, post_id, field, delta):
+        """Buffer ``delta`` for ``field`` on one post"""
+        epoch = self.epoch()
+        if self._add_or_incr(self._key(epoch, field, post_id), delta):
+            # First write to this counter in this epoch: record it in the dirty log
+            self._add_or_incr(self._key(epoch, 'dirty'), 0)
+            slot = self.cache.incr(self._key(epoch, 'dirty'))
+            self.cache.set(self._key(epoch, 'dirty', slot), (field, post_id), None)
+        self.maybe_flush()
+
+    def pending(self, post_id, field):
+        """Buffered delta not yet written to the post row"""
+        epoch, flushed = self.state()
+        keys = [self._key(e, field, post_id) for e in (epoch - 1, epoch) if e > flushed]
+        return sum(self.cache.get_many(keys).values())
+
+    def maybe_flush(self):
+        if self.cache.add(self._key('flush-due'), 1, get_flush_interval()):
+            self.flush()
+
+    def flush(self, include_current=False):
+        """
+        Apply buffered deltas to the database; returns the number of posts updated.
+
+        ``include_current`` also drains the epoch currently accepting writes,
+        for use when no more writes are expected (tests, shutdown).
+        """
+        lock = self._key('flush-lock')
+        if not self.cache.add(lock, 1, 60):
+            return 0
+        try:
+            epoch, flushed = self.state()
+            if include_current:
+                # Stop writes to the current epoch before reading it
+                self.cache.set(self._key('state'), (epoch + 1, flushed), None)
+                epochs = [epoch - 1, epoch]
+            else:
+                epochs = [epoch - 1]
+            epochs = [e for e in epochs if e > flushed]
+            by_post = {}
+            drained_keys = []
+            for e in epochs:
+                drained_keys.extend(self._collect(e, by_post))
+            post_ids = list(by_post)
+            for start in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+                self._apply({post_id: by_post[post_id] for post_id in post_ids[start:start + FLUSH_BATCH_SIZE]})
+            # One write opens the next epoch and stops pending() counting what was just applied
+            self.cache.set(self._key('state'), (epoch + 1, max(epochs, default=flushed)), None)
+            self.cache.delete_many(drained_keys)
+            return len(post_ids)
+        finally:
+            self.cache.delete(lock)
+
+    def _collect(self, epoch, by_post):
+        """Merge an epoch's deltas into ``by_post``; returns the cache keys it used"""
+        dirty = self.cache.get(self._key(epoch, 'dirty'), 0)
+        slots = [self._key(epoch, 'dirty', slot) for slot in range(1, dirty + 1)]
+        entries = list(self.cache.get_many(slots).values())
+        delta_keys = [self._key(epoch, field, post_id) for field, post_id in entries]
+        deltas = self.cache.get_many(delta_keys)
+        for (field, post_id), key in zip(entries, delta_keys):
+            if deltas.get(key):
+                post_deltas = by_post.setdefault(post_id, {})
+                post_deltas[field] = post_deltas.get(field, 0) + deltas[key]
+        return slots + delta_keys + [self._key(epoch, 'dirty')]
+
+    def _apply(self, by_post):
+        """One UPDATE adding each post's deltas to its counter columns"""
+        updates = {}
+        for field in self.fields:
+            whens = [
+                When(pk=post_id, then=Value(deltas[field]))
+                for post_id, deltas in by_post.items() if field in deltas
+            ]
+            if whens:
+                updates[field] = F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+        Post.objects.filter(pk__in=list(by_post)).update(**updates)
+        trending.rescore(list(by_post))
+
+
+buffer = CounterBuffer()
+
+
+def adjust(post_ids, field, delta):
+    """Atomically add ``delta`` to a counter column on the given posts"""
+    if not post_ids or not delta:
+        return
+    if buffer_enabled() and field in buffer.fields:
+        post_ids = list(post_ids)
+
+        def buffer_deltas():
+            for post_id in post_ids:
+                buffer.add(post_id, field, delta)
+
+        # Only buffer what was actually committed
+        transaction.on_commit(buffer_deltas)
+        return
+    Post.objects.filter(pk__in=post_ids).update(**{field: F(field) + delta})
+    trending.rescore(post_ids)
+
+
+def pending(post_id, field):
+    """Delta for ``field`` still held in the buffer, 0 when buffering is off"""
+    if post_id is None or not buffer_enabled() or field not in buffer.fields:
+        return 0
+    return buffer.pending(post_id, field)
+
+
+def bump_cached(post, field, delta):
+    """Keep an in-memory Post in step with a counter update already applied in the database"""
+    if buffer_enabled() and field in buffer.fields:
+        # Still buffered; total_likes() picks it up from the cache
+        return
+    if post is not None and delta:
+        setattr(post, field, getattr(post, field) + delta)
+
+
+def _count(queryset):
+    rows = queryset.filter(post_id=OuterRef('pk')).order_by().values('post_id').annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def actual_counts():
+    """Expressions computing each counter from the source tables, for use on Post querysets"""
+    return {
+        'like_count': _count(Post.likes.through.objects.all()),
+        'comment_count': _count(Comment.objects.filter(is_active=True)),
+    }
@@ -0,0 +1,50 @@
+from django.db.models import Q
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.settings import api_settings
+
+from .search import matching_post_ids
+
+
+class PostSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` filter for posts backed by the full-text index instead of
+    ``icontains`` scans. Matches caption and comment text, or any part of
+    the author's username.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return queryset.filter(Q(id__in=matching_post_ids(query)) | Q(user__username__icontains=query))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over captions and comments',
+            'schema': {'type': 'string'},
+        }]
+
+
+class PostOrderingFilter(OrderingFilter):
+    """
+    ``?ordering=`` for post listings that accepts the serialized counter
+    names (``total_likes``, ``total_comments``) and sorts on the stored
+    counters, so no per-request ``Count`` annotation is needed.
+    """
+    field_aliases = {
+        'total_likes': 'like_count',
+        'total_comments': 'comment_count',
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [
+            ('-' if field.startswith('-') else '') + self.field_aliases.get(field.lstrip('-'), field.lstrip('-'))
+            for field in ordering
+        ]
@@ -0,0 +1,168 @@
+"""
+Hashtag index.
+
+``#tags`` are parsed out of captions whenever a post is saved and stored as
+PostHashtag rows carrying a copy of the post's ``created_at``, so a tag feed
+is one range scan over the ``(hashtag, -created_at)`` index instead of a
+``caption__icontains`` scan of every post. Only active posts are indexed;
+``Hashtag.post_count`` follows the index with ``F()`` updates.
+
+``backfill_hashtags`` indexes posts written before this existed and repairs
+the counters.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Post, Hashtag, PostHashtag
+
+HASHTAG_RE = re.compile(r'(?<![\w&#])#(\w+)')
+MAX_TAG_LENGTH = 100
+MAX_TAGS_PER_POST = 30
+INDEX_BATCH_SIZE = 1000
+
+
+def normalize(tag):
+    """Canonical form of a tag: NFKC, case-folded, without the leading '#'"""
+    return unicodedata.normalize('NFKC', tag.lstrip('#')).casefold()[:MAX_TAG_LENGTH]
+
+
+def extract_hashtags(text, limit=MAX_TAGS_PER_POST):
+    """
+    Distinct normalized tags in ``text`` in order of first use, at most
+    ``limit`` of them (None for all). All-digit tags are ignored.
+    """
+    tags = []
+    for match in HASHTAG_RE.finditer(text or ''):
+        tag = normalize(match.group(1))
+        if tag and not tag.isdigit() and tag not in tags:
+            tags.append(tag)
+            if len(tags) == limit:
+                break
+    return tags
+
+
+def _tag_ids(names):
+    """Hashtag ids by name, creating any that do not exist yet"""
+    Hashtag.objects.bulk_create(
+        [Hashtag(name=name) for name in names], batch_size=INDEX_BATCH_SIZE, ignore_conflicts=True
+    )
+    return dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def _adjust_counts(deltas):
+    """Apply per-tag post count changes with one UPDATE per distinct delta"""
+    by_delta = defaultdict(list)
+    for hashtag_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(hashtag_id)
+    for delta, hashtag_ids in by_delta.items():
+        Hashtag.objects.filter(id__in=hashtag_ids).update(post_count=F('post_count') + delta)
+
+
+def sync_posts(posts, created=False):
+    """
+    Bring the hashtag index in line with the captions of ``posts``.
+
+    Runs in one transaction holding the posts' row locks, so concurrent
+    saves of the same post are applied one after the other. Existing rows
+    for the whole batch are read in one query (skipped for freshly created
+    posts), then missing rows are inserted and stale ones deleted in bulk.
+    Tag counts only change by the rows actually inserted or deleted.
+    Returns the number of rows added.
+    """
+    wanted = {post.id: extract_hashtags(post.caption) if post.is_active else [] for post in posts}
+    current = defaultdict(dict)
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            list(Post.objects.select_for_update().filter(id__in=list(wanted)).values_list('id', flat=True))
+        if not created:
+            rows = PostHashtag.objects.filter(post_id__in=list(wanted)).values_list(
+                'id', 'post_id', 'hashtag_id', 'hashtag__name'
+            )
+            for row_id, post_id, hashtag_id, name in rows:
+                current[post_id][name] = (row_id, hashtag_id)
+
+        deltas = defaultdict(int)
+        stale = []
+        for post_id, tags in wanted.items():
+            for name, (row_id, hashtag_id) in current[post_id].items():
+                if name not in tags:
+                    stale.append(row_id)
+                    deltas[hashtag_id] -= 1
+        if stale:
+            PostHashtag.objects.filter(id__in=stale).delete()
+
+        missing = {name for post_id, tags in wanted.items() for name in tags if name not in current[post_id]}
+        links = []
+        if missing:
+            tag_ids = _tag_ids(missing)
+            links = [
+                PostHashtag(hashtag_id=tag_ids[name], post_id=post.id, created_at=post.created_at)
+                for post in posts for name in wanted[post.id] if name not in current[post.id]
+            ]
+            # Rows linked since ``current`` was read (or by a save of a just created post) are not new
+            existing = set(PostHashtag.objects.filter(
+                post_id__in={link.post_id for link in links},
+                hashtag_id__in={link.hashtag_id for link in links}
+            ).values_list('post_id', 'hashtag_id'))
+            links = [link for link in links if (link.post_id, link.hashtag_id) not in existing]
+            PostHashtag.objects.bulk_create(links, batch_size=INDEX_BATCH_SIZE, ignore_conflicts=True)
+            for link in links:
+                deltas[link.hashtag_id] += 1
+
+        _adjust_counts(deltas)
+    return len(links)
+
+
+def remove_post(post):
+    """Drop a post from the index before it is deleted"""
+    hashtag_ids = list(PostHashtag.objects.filter(post_id=post.id).values_list('hashtag_id', flat=True))
+    if hashtag_ids:
+        PostHashtag.objects.filter(post_id=post.id).delete()
+        _adjust_counts({hashtag_id: -1 for hashtag_id in hashtag_ids})
+
+
+def recount(hashtag_ids=None):
+    """Recompute ``post_count`` from the index; returns the number of tags updated"""
+    actual = PostHashtag.objects.filter(
+        hashtag=OuterRef('pk')
+    ).order_by().values('hashtag').annotate(total=Count('*')).values('total')
+    tags = Hashtag.objects.all()
+    if hashtag_ids is not None:
+        tags = tags.filter(id__in=hashtag_ids)
+    return tags.update(post_count=Coalesce(Subquery(actual), 0))
+
+
+def backfill(chunk_size=INDEX_BATCH_SIZE, progress=None):
+    """
+    Index every post in primary-key chunks, then repair the counters.
+    Safe to rerun; returns the number of rows added.
+    """
+    added = 0
+    processed = 0
+    last_id = 0
+    posts = Post.objects.order_by('id').only('id', 'caption', 'is_active', 'created_at')
+    while True:
+        chunk = list(posts.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        added += sync_posts(chunk)
+        processed += len(chunk)
+        last_id = chunk[-1].id
+        if progress:
+            progress(processed)
+    recount()
+    return added
+
+
+def tagged_posts(hashtag):
+    """Active posts tagged with ``hashtag``, newest first, read from the tag index"""
+    return Post.objects.filter(
+        hashtag_links__hashtag=hashtag,
+        is_active=True
+    ).annotate(tagged_at=F('hashtag_links__created_at')).order_by('-tagged_at', '-id')
@@ -0,0 +1,337 @@
+"""
+Background image processing.
+
+Uploads are stored as received and the request returns straight away:
+saving a post or profile with a new image only records an ImageJob in the
+same transaction (and, for posts, sets ``processing``). ``process_images``
+claims jobs in batches and resizes the files in a pool of worker
+processes, so the Pillow work never runs on a request thread and is spread
+over every core.
+
+Post images also get a PostRendition per configured width
+(``IMAGE_RENDITION_WIDTHS``) in WebP and in JPEG, cut from the full-size
+upload before it is shrunk; clients pick one through ``srcset``. Posts that
+share an upload (see posts/storage.py) share its rendition files: a job
+whose image already has renditions copies the rows instead of rendering,
+and jobs in one batch for the same file render it once.
+
+Jobs that fail are retried up to ``MAX_ATTEMPTS`` times and then kept as
+``failed`` with the error; the post is still shown with the original
+upload. Jobs left ``running`` by a worker that died are claimed again after
+``STALE_AFTER``.
+"""
+import os
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Post, PostRendition, ImageJob
+from .storage import is_blob
+
+# Model, file field and bounding box for each kind of job
+IMAGE_TARGETS = {
+    'post': ('posts.Post', 'image', 800),
+    'profile': ('users.UserProfile', 'profile_image', 300),
+}
+JOB_BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)
+
+# Pillow format, file extension and encoder options of each rendition format
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def get_rendition_widths():
+    """Widths of the renditions generated for each post image"""
+    return getattr(settings, 'IMAGE_RENDITION_WIDTHS', [150, 320, 640, 1080])
+
+
+def blob_rendition_dir(name):
+    """Storage directory holding the renditions of the shared upload ``name``"""
+    return f'renditions/{os.path.splitext(name)[0]}'
+
+
+def rendition_dir(post_id, image_name=None):
+    """Storage directory holding a post's renditions, shared with posts of the same upload"""
+    if is_blob(image_name):
+        return blob_rendition_dir(image_name)
+    return f'renditions/posts/{post_id}'
+
+
+def _save_replacing(img, path, *args, **kwargs):
+    """Save ``img`` over ``path`` atomically, so readers never see a partial file"""
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, f'.{filename}.{os.getpid()}.tmp')
+    try:
+        img.save(temp_path, *args, **kwargs)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def resize_image(path, max_size):
+    """
+    Shrink the image at ``path`` in place to fit in ``max_size`` square.
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    with Image.open(path) as img:
+        if img.width <= max_size and img.height <= max_size:
+            return False
+        image_format = img.format
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+        _save_replacing(img, path, image_format)
+    return True
+
+
+def render_post_image(path, max_size, widths, output_dir):
+    """
+    Write a WebP and a JPEG copy of the image at ``path`` into ``output_dir``
+    for each of ``widths`` that does not exceed the image's own width (or a
+    single one at its own width when all do), then shrink the original to
+    ``max_size``. Runs in a worker process; returns (width, height, format,
+    filename, bytes) for every file written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)  # Renditions carry no EXIF, so apply the orientation
+        has_alpha = img.mode in ('RGBA', 'LA') or 'transparency' in img.info
+        source = img.convert('RGBA' if has_alpha else 'RGB')
+    targets = sorted({width for width in widths if width <= source.width}) or [source.width]
+    for width in reversed(targets):
+        height = max(1, round(source.height * width / source.width))
+        # Each size is cut from the previous, larger one, which is cheaper than the full upload
+        source = source.resize((width, height), Image.LANCZOS) if width != source.width else source
+        for name, (pillow_format, extension, options) in RENDITION_FORMATS.items():
+            frame = source
+            if has_alpha and pillow_format == 'JPEG':
+                frame = Image.new('RGB', source.size, 'white')
+                frame.paste(source, mask=source.getchannel('A'))
+            filename = f'{width}w.{extension}'
+            target = os.path.join(output_dir, filename)
+            _save_replacing(frame, target, pillow_format, **options)
+            written.append((width, height, name, filename, os.path.getsize(target)))
+    resize_image(path, max_size)
+    return written
+
+
+def post_renditions(post):
+    """A post's renditions, from ``attach_renditions`` or a prefetch when one was done"""
+    attached = getattr(post, 'rendition_list', None)
+    return attached if attached is not None else list(post.renditions.all())
+
+
+def srcset(renditions, format, build_url=None):
+    """``srcset`` value listing the renditions in ``format``, narrowest first"""
+    return ', '.join(
+        f'{build_url(rendition.file.url) if build_url else rendition.file.url} {rendition.width}w'
+        for rendition in sorted(renditions, key=lambda rendition: rendition.width)
+        if rendition.format == format
+    )
+
+
+def enqueue(kind, object_id):
+    """Queue an uploaded image; call it in the transaction that saves the upload"""
+    return ImageJob.objects.create(kind=kind, object_id=object_id)
+
+
+def enqueue_missing_renditions():
+    """Queue every active post image without renditions, e.g. uploaded before they existed"""
+    queued = ImageJob.objects.filter(kind='post').values('object_id')
+    post_ids = Post.objects.filter(
+        is_active=True, renditions__isnull=True
+    ).exclude(image='').exclude(image__isnull=True).exclude(id__in=queued).values_list('id', flat=True)
+    jobs = ImageJob.objects.bulk_create(
+        [ImageJob(kind='post', object_id=post_id) for post_id in post_ids.iterator()], batch_size=1000
+    )
+    return len(jobs)
+
+
+def claim_jobs(batch_size=JOB_BATCH_SIZE):
+    """Mark the oldest pending (or abandoned) jobs as running and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = ImageJob.objects.filter(
+            Q(status='pending') | Q(status='running', claimed_at__lt=now - STALE_AFTER)
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs[:batch_size])
+        ImageJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status='running', claimed_at=now, attempts=F('attempts') + 1
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def _reuse(written):
+    """Result of a post job whose upload already has renditions, written for another post"""
+    return written
+
+
+def _existing_renditions(post_files, widths):
+    """
+    The (width, height, format, filename, bytes) of the renditions already
+    written for each shared upload in ``post_files`` ({post id: name}),
+    keyed by post id. The original has been shrunk by then, so they are
+    reused rather than rendered again.
+    """
+    names = {name for name in post_files.values() if is_blob(name)}
+    if not names:
+        return {}
+    by_name = {}
+    rows = PostRendition.objects.filter(post__image__in=names).values_list(
+        'post_id', 'post__image', 'width', 'height', 'format', 'file', 'size'
+    ).order_by('post_id', 'format', 'width')
+    for post_id, name, width, height, image_format, file, size in rows:
+        if post_id in post_files and post_files[post_id] == name:
+            continue  # The job's own rows are replaced, not reused
+        owner, written = by_name.setdefault(name, (post_id, []))
+        if owner == post_id:
+            written.append((width, height, image_format, os.path.basename(file), size))
+    existing = {}
+    for post_id, name in post_files.items():
+        if name in by_name:
+            written = by_name[name][1]
+            # Only the configured widths, unless the image is narrower than all of them
+            existing[post_id] = tuple(row for row in written if row[0] in widths) or tuple(written)
+    return existing
+
+
+def _tasks(jobs):
+    """
+    (function, arguments, rendition directory) to run for each job whose
+    object and file still exist; jobs for the same file get equal tasks.
+    """
+    tasks = {}
+    widths = tuple(get_rendition_widths())
+    for kind, (label, field, max_size) in IMAGE_TARGETS.items():
+        object_ids = {job.object_id for job in jobs if job.kind == kind}
+        if not object_ids:
+            continue
+        model = apps.get_model(label)
+        storage = model._meta.get_field(field).storage
+        files = {object_id: name for object_id, name in model.objects.filter(
+            id__in=object_ids
+        ).values_list('id', field) if name}
+        existing = _existing_renditions(files, widths) if kind == 'post' else {}
+        for job in jobs:
+            if job.kind != kind or job.object_id not in files:
+                continue
+            name = files[job.object_id]
+            path = storage.path(name)
+            if kind == 'post':
+                output_dir = rendition_dir(job.object_id, name)
+                if job.object_id in existing:
+                    tasks[job.id] = (_reuse, (existing[job.object_id],), output_dir)
+                else:
+                    tasks[job.id] = (render_post_image, (path, max_size, widths, storage.path(output_dir)), output_dir)
+            else:
+                tasks[job.id] = (resize_image, (path, max_size), None)
+    return tasks
+
+
+def _store_renditions(results):
+    """
+    Replace the rendition rows of each post in ``results`` ({post id:
+    (rendition directory, written)}) with the files just written. Files left
+    over from widths no longer configured are deleted unless another post
+    still uses them.
+    """
+    if not results:
+        return
+    stale = PostRendition.objects.filter(post_id__in=list(results))
+    current = {f'{directory}/{row[3]}' for directory, written in results.values() for row in written}
+    storage = PostRendition._meta.get_field('file').storage
+    leftover = set(stale.values_list('file', flat=True)) - current
+    shared = set(PostRendition.objects.filter(file__in=leftover).exclude(
+        post_id__in=list(results)
+    ).values_list('file', flat=True))
+    for name in leftover - shared:
+        storage.delete(name)
+    stale.delete()
+    PostRendition.objects.bulk_create([
+        PostRendition(
+            post_id=post_id, width=width, height=height, format=name,
+            file=f'{directory}/{filename}', size=size
+        )
+        for post_id, (directory, written) in results.items()
+        for width, height, name, filename, size in written
+    ])
+
+
+def _run_now(fn, *args):
+    """Call ``fn`` on this thread, wrapped in a Future like ``Executor.submit``"""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+
+def process_jobs(batch_size=JOB_BATCH_SIZE, executor=None):
+    """
+    Claim a batch of jobs and resize their images on ``executor`` (a
+    ``ProcessPoolExecutor``), or on this thread when it is None. Returns the
+    number of jobs claimed.
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0
+
+    submit = executor.submit if executor is not None else _run_now
+    futures = {}
+    directories = {}
+    submitted = {}
+    for job_id, (function, args, directory) in _tasks(jobs).items():
+        if (function, args) not in submitted:  # Jobs for one shared file run it once
+            run = _run_now if function is _reuse else submit
+            submitted[function, args] = run(function, *args)
+        futures[job_id] = submitted[function, args]
+        directories[job_id] = directory
+
+    finished = []
+    given_up = []
+    renditions = {}
+    for job in jobs:
+        future = futures.get(job.id)
+        if future is None:  # Object or file deleted meanwhile
+            finished.append(job)
+            continue
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            raise  # Let the worker restart; its jobs are claimed again once stale
+        except Exception as exc:
+            if job.attempts < MAX_ATTEMPTS:
+                ImageJob.objects.filter(id=job.id).update(status='pending', error=repr(exc))
+            else:
+                ImageJob.objects.filter(id=job.id).update(status='failed', error=repr(exc))
+                given_up.append(job)  # Served as uploaded
+        else:
+            finished.append(job)
+            if job.kind == 'post':
+                renditions[job.object_id] = (directories[job.id], result)
+
+    _store_renditions(renditions)
+    ImageJob.objects.filter(id__in=[job.id for job in finished]).delete()
+    Post.objects.filter(
+        id__in=[job.object_id for job in finished + given_up if job.kind == 'post']
+    ).exclude(
+        # A newer upload of the same post is still queued
+        id__in=ImageJob.objects.filter(kind='post', status__in=['pending', 'running']).values('object_id')
+    ).update(processing=False)
+    return len(jobs)
@@ -0,0 +1,97 @@
+"""
+Viewer-state loaders.
+
+Per-viewer flags such as "has the viewer liked this post" are resolved for a
+whole page of posts with one ``IN`` query, instead of one EXISTS query (or a
+full likers prefetch) per post. Views put the result in the template context;
+API list serializers put it in the serializer context through
+ViewerStateListSerializer.
+
+The same goes for page-wide data that is not viewer specific, such as the
+few most recent comments shown under each post in the feed or the image
+renditions behind each post's ``srcset``.
+"""
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, Comment, PostRendition
+
+RECENT_COMMENTS_LIMIT = 3
+
+
+def liked_post_ids(user, post_ids):
+    """The subset of ``post_ids`` that ``user`` has liked"""
+    post_ids = list(post_ids)
+    if not post_ids or user is None or not user.is_authenticated:
+        return set()
+    return set(Post.likes.through.objects.filter(
+        user_id=user.pk,
+        post_id__in=post_ids
+    ).values_list('post_id', flat=True))
+
+
+def viewer_state(user, posts):
+    """Template context describing the viewer's relation to a page of posts"""
+    return {'liked_post_ids': liked_post_ids(user, [post.id for post in posts])}
+
+
+def recent_comments(post_ids, limit=RECENT_COMMENTS_LIMIT):
+    """
+    The ``limit`` newest active comments of each post, newest first, keyed by post id.
+
+    One query for the whole page: a ``ROW_NUMBER() OVER (PARTITION BY post_id)``
+    window where the database supports it, otherwise a correlated ``LIMIT``
+    subquery per post. Commenters and their profiles are joined in.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    comments = Comment.objects.filter(
+        post_id__in=post_ids,
+        is_active=True
+    ).select_related('user', 'user__profile')
+
+    if connection.features.supports_over_clause:
+        comments = comments.annotate(rank=Window(
+            RowNumber(),
+            partition_by=F('post_id'),
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )).filter(rank__lte=limit)
+    else:
+        newest = Comment.objects.filter(
+            post_id=OuterRef('post_id'),
+            is_active=True
+        ).order_by('-created_at', '-id').values('id')[:limit]
+        comments = comments.filter(id__in=Subquery(newest))
+
+    by_post = {post_id: [] for post_id in post_ids}
+    for comment in comments.order_by('post_id', '-created_at', '-id'):
+        by_post[comment.post_id].append(comment)
+    return by_post
+
+
+def attach_recent_comments(posts, limit=RECENT_COMMENTS_LIMIT):
+    """Set ``recent_comments`` (newest first) on each post of a page"""
+    by_post = recent_comments([post.id for post in posts], limit)
+    for post in posts:
+        post.recent_comments = by_post.get(post.id, [])
+    return posts
+
+
+def renditions(posts):
+    """Image renditions of each post of a page, keyed by post id; posts without an image are skipped"""
+    post_ids = [post.id for post in posts if post.image]
+    by_post = {post_id: [] for post_id in post_ids}
+    if post_ids:
+        for rendition in PostRendition.objects.filter(post_id__in=post_ids):
+            by_post[rendition.post_id].append(rendition)
+    return by_post
+
+
+def attach_renditions(posts):
+    """Set ``rendition_list`` on each post of a page, for the ``post_picture`` tag"""
+    by_post = renditions(posts)
+    for post in posts:
+        post.rendition_list = by_post.get(post.id, [])
+    return posts
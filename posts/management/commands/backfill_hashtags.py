@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.hashtags import backfill
+
+
+class Command(BaseCommand):
+    help = 'Index hashtags of existing posts and recompute per-tag post counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Posts parsed per batch')
+
+    def handle(self, *args, **options):
+        added = backfill(
+            chunk_size=options['chunk_size'],
+            progress=lambda count: self.stdout.write(f'Processed {count} posts...')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Added {added} hashtag index rows'))
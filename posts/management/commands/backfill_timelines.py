@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from posts.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from posts and follow relationships'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Only rebuild this user (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users loaded per query')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        rebuilt = 0
+        entries = 0
+        last_id = 0
+        while True:
+            chunk = list(users.filter(id__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            for user in chunk:
+                entries += rebuild_timeline(user)
+                rebuilt += 1
+            last_id = chunk[-1].id
+            self.stdout.write(f'Rebuilt {rebuilt} timelines...')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines with {entries} entries'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import buffer, buffer_enabled
+
+
+class Command(BaseCommand):
+    help = 'Write buffered like counter increments to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='include_current',
+            help='Also drain the epoch currently accepting writes (use when traffic is stopped, e.g. on deploy)'
+        )
+
+    def handle(self, *args, **options):
+        if not buffer_enabled():
+            self.stdout.write('Counter buffer is disabled, nothing to flush')
+            return
+        updated = buffer.flush(include_current=options['include_current'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed buffered counters for {updated} posts'))
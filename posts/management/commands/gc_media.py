@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.storage import GC_GRACE_PERIOD, collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = 'Delete stored uploads no post or profile references any more, with their renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=float, default=GC_GRACE_PERIOD.total_seconds() / 60,
+                            help='Keep unreferenced uploads used more recently than this')
+        parser.add_argument('--recount', action='store_true',
+                            help='First recompute every reference count from the posts and profiles')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting it')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'Recounted references of {recount()} uploads')
+
+        def report(removed, freed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{removed} uploads, {freed} bytes so far')
+
+        removed, freed = collect_garbage(
+            grace_period=timedelta(minutes=options['grace_minutes']),
+            dry_run=options['dry_run'],
+            progress=report
+        )
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} uploads ({freed} bytes)'))
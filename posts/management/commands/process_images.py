@@ -0,0 +1,36 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.images import JOB_BATCH_SIZE, enqueue_missing_renditions, process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Resize uploaded post and profile images in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=JOB_BATCH_SIZE, help='Jobs claimed at a time')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Work off the queue and exit instead of polling')
+        parser.add_argument('--backfill', action='store_true', help='First queue post images that have no renditions yet')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        processed = 0
+        if options['backfill']:
+            self.stdout.write(f'Queued {enqueue_missing_renditions()} post images without renditions')
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            try:
+                while True:
+                    claimed = process_jobs(batch_size=batch_size, executor=executor)
+                    processed += claimed
+                    if claimed < batch_size:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} image jobs'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for post captions and comments'
+
+    def handle(self, *args, **options):
+        backend = 'FTS5' if search.fts_available() else 'inverted index'
+        rows = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {backend} search index with {rows} rows'))
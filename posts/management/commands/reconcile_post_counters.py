@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from posts import counters, trending
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like and comment counts on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Posts checked per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted posts without fixing them')
+
+    def handle(self, *args, **options):
+        if counters.buffer_enabled() and not options['dry_run']:
+            # Buffered likes are not in the rows yet; apply them so they are not counted twice
+            counters.buffer.flush(include_current=True)
+
+        expressions = counters.actual_counts()
+        checked_annotations = {f'actual_{field}': expression for field, expression in expressions.items()}
+        drifted_filter = Q()
+        for field in counters.COUNTER_FIELDS:
+            drifted_filter |= ~Q(**{field: F(f'actual_{field}')})
+
+        checked = 0
+        repaired = 0
+        last_id = 0
+        while True:
+            chunk = list(Post.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not chunk:
+                break
+            drifted = list(Post.objects.filter(
+                pk__gte=chunk[0], pk__lte=chunk[-1]
+            ).annotate(**checked_annotations).filter(drifted_filter).values_list('pk', flat=True))
+            if drifted and not options['dry_run']:
+                # Recount inside the UPDATE so concurrent likes are not overwritten with stale values
+                Post.objects.filter(pk__in=drifted).update(**expressions)
+                trending.rescore(drifted)
+            checked += len(chunk)
+            repaired += len(drifted)
+            last_id = chunk[-1]
+            self.stdout.write(f'Checked {checked} posts...')
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {repaired} drifted posts out of {checked}'))
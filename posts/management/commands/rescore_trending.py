@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.trending import get_rescore_window, rescore_recent
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending scores used by Explore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Rescore posts from the last N days (default: TRENDING_RESCORE_WINDOW_DAYS)')
+        parser.add_argument('--all', action='store_true', help='Rescore every active post, e.g. after changing the formula')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Posts scored per query')
+
+    def handle(self, *args, **options):
+        since = None
+        if not options['all']:
+            since = timezone.now() - timedelta(days=options['days'] or get_rescore_window())
+
+        scored = rescore_recent(
+            since=since,
+            chunk_size=options['chunk_size'],
+            progress=lambda count: self.stdout.write(f'Scored {count} posts...')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Scored {scored} posts'))
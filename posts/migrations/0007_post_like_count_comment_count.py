@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Like = Post.likes.through
+
+    likes = Like.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id').annotate(n=Count('*')).values('n')
+    comments = Comment.objects.filter(
+        post_id=OuterRef('pk'), is_active=True
+    ).order_by().values('post_id').annotate(n=Count('*')).values('n')
+    Post.objects.update(
+        like_count=Coalesce(Subquery(likes), Value(0)),
+        comment_count=Coalesce(Subquery(comments), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_celebrityauthor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
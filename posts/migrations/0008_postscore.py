@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+def populate_scores(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostScore = apps.get_model('posts', 'PostScore')
+    score = import_string(getattr(settings, 'TRENDING_SCORE_FUNCTION', 'posts.trending.hot_score'))
+    now = timezone.now()
+    rows = Post.objects.filter(is_active=True).values_list('id', 'like_count', 'comment_count', 'created_at')
+    PostScore.objects.bulk_create(
+        (PostScore(post_id=post_id, score=score(likes, comments, created_at, now), updated_at=now)
+         for post_id, likes, comments, created_at in rows.iterator(chunk_size=1000)),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.post')),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-post'], name='posts_posts_score_765881_idx')],
+            },
+        ),
+        migrations.RunPython(populate_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:15
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+# rowid is id * 2 for a caption and id * 2 + 1 for a comment, so triggers can
+# address either row directly.
+FTS_SQL = [
+    """CREATE VIRTUAL TABLE posts_search USING fts5(
+        caption, comment, post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post WHEN new.is_active BEGIN
+        INSERT INTO posts_search (rowid, caption, comment, post_id) VALUES (new.id * 2, new.caption, '', new.id);
+    END""",
+    """CREATE TRIGGER posts_search_post_update AFTER UPDATE OF caption, is_active ON posts_post BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+        INSERT INTO posts_search (rowid, caption, comment, post_id)
+            SELECT new.id * 2, new.caption, '', new.id WHERE new.is_active;
+    END""",
+    """CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END""",
+    """CREATE TRIGGER posts_search_comment_insert AFTER INSERT ON posts_comment WHEN new.is_active BEGIN
+        INSERT INTO posts_search (rowid, caption, comment, post_id) VALUES (new.id * 2 + 1, '', new.content, new.post_id);
+    END""",
+    """CREATE TRIGGER posts_search_comment_update AFTER UPDATE OF content, is_active ON posts_comment BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO posts_search (rowid, caption, comment, post_id)
+            SELECT new.id * 2 + 1, '', new.content, new.post_id WHERE new.is_active;
+    END""",
+    """CREATE TRIGGER posts_search_comment_delete AFTER DELETE ON posts_comment BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END""",
+    """INSERT INTO posts_search (rowid, caption, comment, post_id)
+        SELECT id * 2, caption, '', id FROM posts_post WHERE is_active""",
+    """INSERT INTO posts_search (rowid, caption, comment, post_id)
+        SELECT id * 2 + 1, '', content, post_id FROM posts_comment WHERE is_active""",
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_comment_insert',
+    'DROP TRIGGER IF EXISTS posts_search_comment_update',
+    'DROP TRIGGER IF EXISTS posts_search_comment_delete',
+    'DROP TABLE IF EXISTS posts_search',
+]
+
+
+def create_fts(apps, schema_editor):
+    """SQLite only; without FTS5 compiled in, the SearchPosting index is used instead"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(FTS_SQL[0])
+        except OperationalError:
+            return
+        for statement in FTS_SQL[1:]:
+            cursor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_FTS_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_postscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.comment')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'post'], name='posts_searc_term_218a6d_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
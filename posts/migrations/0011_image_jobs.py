@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:59
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('posts.migrations.0009_search_index')
+POST_TRIGGERS = ['posts_search_post_insert', 'posts_search_post_update', 'posts_search_post_delete']
+
+
+def restore_search_triggers(apps, schema_editor):
+    """SQLite rebuilds posts_post to add a column, which drops the FTS5 triggers on it"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_search'")
+        if cursor.fetchone() is None:
+            return
+        for name in POST_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        for statement in search_index.FTS_SQL:
+            if any(f'CREATE TRIGGER {name} ' in statement for name in POST_TRIGGERS):
+                cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_hashtags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='processing',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post image'), ('profile', 'Profile image')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='posts_image_status_c9b91b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='posts.post')),
+            ],
+            options={
+                'ordering': ['post', 'format', 'width'],
+                'unique_together': {('post', 'format', 'width')},
+            },
+        ),
+    ]
@@ -1,8 +1,8 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
-from PIL import Image
+from contextlib import nullcontext
 import os
 
 def validate_image_size(image):
@@ -32,6 +32,9 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name="liked_posts", blank=True)
     is_active = models.BooleanField(default=True)  # For soft delete
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)  # Active comments only
+    processing = models.BooleanField(default=False, editable=False)  # Uploaded image not yet resized, see posts/images.py
 
     class Meta:
         ordering = ['-created_at']
@@ -41,25 +44,91 @@ class Post(models.Model):
             models.Index(fields=['is_active', '-created_at']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored is_active flag and image so changes can be detected on save"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
     def clean(self):
         """Model validation"""
         if not self.image and not self.caption:
             raise ValidationError('Post must have either an image or caption.')
 
     def save(self, *args, **kwargs):
-        """Override save to resize images"""
-        super().save(*args, **kwargs)
-        
-        if self.image:
-            # Resize image if too large
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size, Image.LANCZOS)
-                img.save(self.image.path)
+        """Override save to index hashtags, count image references and queue new uploads for resizing"""
+        from . import hashtags, images, storage
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        image_uploaded = bool(self.image) and not self.image._committed
+        if image_uploaded:
+            self.processing = True
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'processing'}
+        image_saved = update_fields is None or 'image' in update_fields
+        loaded_image = getattr(self, '_loaded_image', None)
+        image_changed = image_saved and (image_uploaded or (self.image.name or None) != (loaded_image or None))
+        with transaction.atomic() if image_changed else nullcontext():
+            super().save(*args, **kwargs)
+            if image_changed:
+                storage.replace_reference(loaded_image, self.image.name)
+            if image_uploaded:
+                images.enqueue('post', self.pk)
+        if image_saved:
+            self._loaded_image = self.image.name
+        self._loaded_is_active = self.is_active  # post_save handlers have seen the change
+        if update_fields is None or {'caption', 'is_active'} & set(update_fields):
+            hashtags.sync_posts([self], created=adding)
 
     def total_likes(self):
-        return self.likes.count()
+        """Stored like count plus any increments still waiting in the counter buffer"""
+        from .counters import pending
+        return self.like_count + pending(self.pk, 'like_count')
+
+    def add_like(self, user):
+        """
+        Like the post as ``user``; returns False if they already liked it.
+
+        A single INSERT into the likes table, with the unique constraint
+        deciding idempotency, so the cost does not depend on how many users
+        already like the post. Only that INSERT runs in the savepoint whose
+        IntegrityError means "already liked"; the notification is queued after
+        it, in the caller's transaction, and delivered later by the outbox worker.
+        """
+        from users.notifications import create_like_notification
+        from users.realtime import publish_like_count
+        from . import counters
+        try:
+            with transaction.atomic():
+                Post.likes.through.objects.create(post_id=self.pk, user_id=user.pk)
+        except IntegrityError:
+            return False
+        create_like_notification(self, user)
+        counters.adjust([self.pk], 'like_count', 1)
+        counters.bump_cached(self, 'like_count', 1)
+        publish_like_count(self)
+        return True
+
+    def remove_like(self, user):
+        """Remove ``user``'s like with a single DELETE; returns False if there was none"""
+        from users.realtime import publish_like_count
+        from . import counters
+        deleted, _ = Post.likes.through.objects.filter(post_id=self.pk, user_id=user.pk).delete()
+        if not deleted:
+            return False
+        counters.adjust([self.pk], 'like_count', -1)
+        counters.bump_cached(self, 'like_count', -1)
+        publish_like_count(self)
+        return True
+
+    def toggle_like(self, user):
+        """Like the post, or unlike it if already liked; returns whether it is now liked"""
+        if self.add_like(user):
+            return True
+        self.remove_like(user)
+        return False
 
     def is_liked_by(self, user):
         """Check if post is liked by specific user"""
@@ -89,6 +158,17 @@ class Comment(models.Model):
             models.Index(fields=['user', '-created_at']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored is_active flag so moderation can be detected on save"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_is_active = self.is_active  # post_save handlers have seen the change
+
     def __str__(self):
         return f"{self.user.username} on {self.post.user.username}'s post: {self.content[:30]}..."
 
@@ -113,3 +193,169 @@ class Follow(models.Model):
 
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
+
+
+class TimelineEntry(models.Model):
+    """Materialized home timeline row, written by fan-out when a post is created"""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # Copy of post.created_at so reads never join on Post
+
+    class Meta:
+        ordering = ['-created_at', '-post_id']
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post']),
+            models.Index(fields=['owner', 'author']),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} <- post {self.post_id}"
+
+
+class CelebrityAuthor(models.Model):
+    """Author whose posts are merged into feeds at read time instead of fanned out"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='celebrity')
+    promoted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} (fan-out on read)"
+
+
+class PostScore(models.Model):
+    """Precomputed trending score of an active post, read pre-sorted by Explore"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post']),
+        ]
+
+    def __str__(self):
+        return f"post {self.post_id}: {self.score:.4f}"
+
+
+class SearchPosting(models.Model):
+    """
+    Inverted index row: ``term`` occurs ``weight`` times in a post's caption
+    (``comment`` is null) or in one of its comments. Only used on databases
+    without SQLite FTS5, see posts/search.py.
+    """
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> post {self.post_id}"
+
+
+class Hashtag(models.Model):
+    """A ``#tag`` used in at least one caption, with a running count of active posts"""
+    name = models.CharField(max_length=100, unique=True)  # Normalized, without the leading '#'
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class PostHashtag(models.Model):
+    """Hashtag index row for an active post, written when the caption is saved"""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='post_links')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='hashtag_links')
+    created_at = models.DateTimeField()  # Copy of post.created_at so tag feeds read one index range
+
+    class Meta:
+        unique_together = ('hashtag', 'post')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at', '-post']),
+        ]
+
+    def __str__(self):
+        return f"#{self.hashtag.name} -> post {self.post_id}"
+
+
+class PostRendition(models.Model):
+    """Resized copy of a post image in one width and format, written by process_images"""
+
+    FORMATS = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='renditions')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMATS)
+    file = models.FileField(max_length=255)
+    size = models.PositiveIntegerField()  # Bytes
+
+    class Meta:
+        ordering = ['post', 'format', 'width']
+        unique_together = ('post', 'format', 'width')
+
+    def __str__(self):
+        return f"post {self.post_id} {self.width}w {self.format}"
+
+
+class ImageJob(models.Model):
+    """
+    Uploaded image waiting to be resized, written in the same transaction as
+    the upload and worked off by ``process_images`` (see posts/images.py).
+    """
+
+    KINDS = [
+        ('post', 'Post image'),
+        ('profile', 'Profile image'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.PositiveIntegerField()  # Post or UserProfile
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    """
+    One stored upload, named after the hash of its content and shared by
+    every post or profile that uploaded the same bytes (see posts/storage.py).
+    """
+
+    name = models.CharField(max_length=255, unique=True)  # Storage name under MEDIA_ROOT
+    size = models.PositiveBigIntegerField()  # Bytes as uploaded
+    ref_count = models.IntegerField(default=0)  # Post and profile images pointing at it
+    last_used_at = models.DateTimeField()  # Last upload or reference change, for the gc_media grace period
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
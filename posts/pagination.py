@@ -0,0 +1,222 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the ordering values of the last row seen rather than
+by an offset, so every page is an index range scan of ``page_size + 1`` rows
+and the table is never counted. Cursors are opaque base64 tokens.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    """JSON scalar for a position value; related objects are stored by primary key"""
+    if isinstance(value, models.Model):
+        return _encode_value(value.pk)
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)  # Dates, decimals, UUIDs; parsed back by the field on decode
+
+
+def _decode_value(value, field):
+    """Position value from a cursor, coerced by the field it is compared against"""
+    if isinstance(value, dict):
+        value = value['dt']
+        if field is None:
+            return parse_datetime(value)
+    if not isinstance(value, (str, int, float, bool)):
+        raise TypeError(f'Unexpected cursor value {value!r}')
+    return value if field is None else field.to_python(value)
+
+
+def position_field(queryset, name):
+    """
+    Model field (or annotation output field) an ordering term compares,
+    following ``__`` relations; None when it cannot be resolved.
+    """
+    name = name.lstrip('-')
+    query = getattr(queryset, 'query', None)
+    try:
+        if query is not None and name in query.annotations:
+            return query.annotations[name].output_field
+        model = getattr(queryset, 'model', None)
+        field = None
+        for part in name.split('__'):
+            if model is None:
+                return None
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            model = field.related_model
+        return field
+    except (FieldDoesNotExist, FieldError):
+        return None
+
+
+def keyset_filter(ordering, position, reverse=False):
+    """Q object selecting rows strictly after ``position`` in ``ordering``"""
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        step = Q(**{f'{name}__{lookup}': position[index]})
+        for previous, value in zip(ordering[:index], position[:index]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def invert_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the full ordering tuple, by default
+    (``created_at``, ``id``) newest first.
+
+    The ordering comes from the view's OrderingFilter when one is active,
+    then from ``view.keyset_ordering``, then from ``ordering``; ``id`` is
+    appended as a tie-breaker so every cursor identifies exactly one row.
+
+    Objects that are not querysets can be paginated by implementing
+    ``keyset_slice(position, reverse, limit)`` and exposing the ``model``
+    whose fields the ordering names.
+
+    Cursor values are coerced by the field they are compared against, so a
+    tampered cursor is a 404 rather than an error from the database layer.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = None
+    max_page_size = None
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    return min(page_size, self.max_page_size) if self.max_page_size else page_size
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = getattr(view, 'keyset_ordering', None) or self.ordering
+        ordering = list(ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = list(data['p'])
+            if len(values) != len(self.ordering_fields):
+                raise NotFound(self.invalid_cursor_message)
+            position = [_decode_value(value, field) for value, field in zip(values, self.position_fields)]
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, item, reverse):
+        position = [_encode_value(self.get_value(item, field)) for field in self.ordering_fields]
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        url = self.base_url
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_value(self, item, field):
+        value = item
+        for attr in field.lstrip('-').split('__'):
+            value = value.get(attr) if isinstance(value, dict) else getattr(value, attr)
+        return value
+
+    def fetch(self, queryset, position, reverse, limit):
+        """Rows after ``position`` in traversal order"""
+        if hasattr(queryset, 'keyset_slice'):
+            return list(queryset.keyset_slice(position, reverse, limit))
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering_fields, position, reverse))
+        ordering = invert_ordering(self.ordering_fields) if reverse else self.ordering_fields
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering_fields = self.get_ordering(request, queryset, view)
+        self.position_fields = [position_field(queryset, field) for field in self.ordering_fields]
+
+        position, reverse = self.decode_cursor(request)
+        results = self.fetch(queryset, position, reverse, self.page_size + 1)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,238 @@
+"""
+Full-text search over post captions and comments.
+
+On SQLite with FTS5 the text lives in the ``posts_search`` virtual table,
+kept in sync by triggers on ``posts_post`` and ``posts_comment`` (see
+migration 0009). Other databases use an inverted index of SearchPosting
+rows maintained from signals. Both are queried through the same interface:
+
+* ``search_posts(query)``: the best matches ranked by relevance and recency
+* ``matching_post_ids(query)``: an expression for ``id__in`` filters
+
+Queries are split into words; every word must match, and the last one
+matches as a prefix so results keep up with the user typing.
+``rebuild_search_index`` repopulates either index from scratch.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Post, Comment, SearchPosting
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_QUERY_TERMS = 8
+MAX_TERM_LENGTH = 64
+CAPTION_WEIGHT = 2
+CANDIDATE_POOL = 200
+FTS_ROWS_PER_POST = 5  # Matching rows read per candidate, a post can match in several comments
+INDEX_BATCH_SIZE = 1000
+FTS_TABLE = 'posts_search'
+
+
+def get_recency_days():
+    """Age in days at which a match is worth half as much as a brand new one"""
+    return getattr(settings, 'SEARCH_RECENCY_DAYS', 30)
+
+
+def tokenize(text):
+    """Lowercased words without diacritics, matching FTS5's unicode61 tokenizer"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [term[:MAX_TERM_LENGTH] for term in TOKEN_RE.findall(text.lower())]
+
+
+class FTS5Index:
+    """SQLite FTS5 virtual table maintained by triggers"""
+
+    def match_expression(self, terms):
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def matching_ids(self, terms):
+        return RawSQL(
+            f'SELECT post_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [self.match_expression(terms)]
+        )
+
+    def candidates(self, terms, limit):
+        """(post_id, relevance) pairs, most relevant first; captions weigh double"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT post_id, bm25({FTS_TABLE}, {CAPTION_WEIGHT}.0, 1.0) AS rank '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+                [self.match_expression(terms), limit * FTS_ROWS_PER_POST]
+            )
+            # bm25() is negative, lower is better; a post's best row (caption or comment) decides its rank
+            best = {}
+            for post_id, rank in cursor.fetchall():
+                best.setdefault(post_id, -rank)
+        return list(best.items())[:limit]
+
+    def index_post(self, post):
+        pass  # Triggers keep the table in sync
+
+    def index_comment(self, comment):
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, caption, comment, post_id) '
+                'SELECT id * 2, caption, \'\', id FROM posts_post WHERE is_active'
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, caption, comment, post_id) '
+                'SELECT id * 2 + 1, \'\', content, post_id FROM posts_comment WHERE is_active'
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+
+class InvertedIndex:
+    """Term -> post postings stored in SearchPosting, for databases without FTS5"""
+
+    def _split(self, terms):
+        """
+        (exact terms, prefix term); the prefix is None when an exact term
+        already starts with it, since the same posting would satisfy both
+        """
+        exact, prefix = terms[:-1], terms[-1]
+        if any(term.startswith(prefix) for term in exact):
+            prefix = None
+        return exact, prefix
+
+    def _term_filter(self, exact, prefix):
+        condition = Q(term__in=exact)
+        if prefix is not None:
+            condition |= Q(term=prefix) | Q(term__startswith=prefix)
+        return condition
+
+    def _matches(self, terms):
+        """Post ids whose postings cover every query term"""
+        exact, prefix = self._split(terms)
+        # Number each query term so a post matches only when all of them are covered
+        cases = [When(term=term, then=Value(position)) for position, term in enumerate(exact)]
+        if prefix is not None:
+            cases.append(When(term__startswith=prefix, then=Value(len(exact))))
+        return SearchPosting.objects.filter(self._term_filter(exact, prefix)).values('post_id').annotate(
+            matched=Count(Case(*cases), distinct=True),
+            relevance=Sum('weight')
+        ).filter(matched=len(cases))
+
+    def matching_ids(self, terms):
+        return self._matches(terms).values('post_id')
+
+    def candidates(self, terms, limit):
+        rows = self._matches(terms).order_by('-relevance')[:limit]
+        return [(row['post_id'], row['relevance']) for row in rows]
+
+    def _postings(self, text, post_id, comment_id=None, weight=1):
+        return [
+            SearchPosting(term=term, post_id=post_id, comment_id=comment_id, weight=count * weight)
+            for term, count in Counter(tokenize(text)).items()
+        ]
+
+    def index_post(self, post):
+        SearchPosting.objects.filter(post_id=post.id, comment__isnull=True).delete()
+        if post.is_active:
+            SearchPosting.objects.bulk_create(self._postings(post.caption, post.id, weight=CAPTION_WEIGHT))
+
+    def index_comment(self, comment):
+        SearchPosting.objects.filter(comment_id=comment.id).delete()
+        if comment.is_active:
+            SearchPosting.objects.bulk_create(self._postings(comment.content, comment.post_id, comment.id))
+
+    def rebuild(self):
+        SearchPosting.objects.all().delete()
+        written = 0
+        batch = []
+        posts = Post.objects.filter(is_active=True).values_list('id', 'caption')
+        for post_id, caption in posts.iterator(chunk_size=INDEX_BATCH_SIZE):
+            batch.extend(self._postings(caption, post_id, weight=CAPTION_WEIGHT))
+            if len(batch) >= INDEX_BATCH_SIZE:
+                written += len(SearchPosting.objects.bulk_create(batch))
+                batch = []
+        comments = Comment.objects.filter(is_active=True).values_list('id', 'post_id', 'content')
+        for comment_id, post_id, content in comments.iterator(chunk_size=INDEX_BATCH_SIZE):
+            batch.extend(self._postings(content, post_id, comment_id))
+            if len(batch) >= INDEX_BATCH_SIZE:
+                written += len(SearchPosting.objects.bulk_create(batch))
+                batch = []
+        written += len(SearchPosting.objects.bulk_create(batch))
+        return written
+
+
+_fts_tables = {}
+
+
+def fts_available():
+    """Whether the FTS5 table was created for the current database"""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def get_index():
+    return FTS5Index() if fts_available() else InvertedIndex()
+
+
+def _query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def matching_post_ids(query):
+    """Expression selecting the ids of posts matching ``query``, for ``id__in`` filters"""
+    terms = _query_terms(query)
+    if not terms:
+        return Post.objects.none().values('id')
+    return get_index().matching_ids(terms)
+
+
+def search_posts(query, queryset=None, limit=10):
+    """
+    Active posts matching ``query``, best first.
+
+    The ``CANDIDATE_POOL`` most relevant matches are re-ranked by relevance
+    discounted for age, so a fresh post beats an equally relevant old one.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    candidates = dict(get_index().candidates(terms, CANDIDATE_POOL))
+    queryset = queryset if queryset is not None else Post.objects.all()
+    posts = list(queryset.filter(id__in=list(candidates), is_active=True).order_by())
+
+    now = timezone.now()
+    recency_days = get_recency_days()
+
+    def rank(post):
+        age_days = max((now - post.created_at).total_seconds(), 0) / 86400
+        return candidates[post.id] / (1 + age_days / recency_days)
+
+    posts.sort(key=lambda post: (rank(post), post.id), reverse=True)
+    return posts[:limit]
+
+
+def index_post(post):
+    get_index().index_post(post)
+
+
+def index_comment(comment):
+    get_index().index_comment(comment)
+
+
+def rebuild():
+    """Repopulate the search index from scratch; returns the number of rows written"""
+    return get_index().rebuild()
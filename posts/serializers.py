@@ -1,9 +1,68 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Post, Comment, Follow
+from .models import Post, Comment, Follow, Hashtag, PostRendition
+from .hashtags import MAX_TAGS_PER_POST, extract_hashtags
+from .images import srcset as rendition_srcset
+from .loaders import liked_post_ids, recent_comments, renditions
 from users.models import UserProfile
 
 
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """
+    List serializer that resolves the viewer's like state and the image
+    renditions for the whole page with one query each and shares them with
+    every item through the context.
+    """
+    
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        self.context.update(self.load_page_state(posts))
+        return super().to_representation(posts)
+    
+    def load_page_state(self, posts):
+        """Context entries computed once for the page"""
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        return {
+            'liked_post_ids': liked_post_ids(user, [post.id for post in posts]),
+            'renditions': renditions(posts),
+        }
+
+
+class FeedPostListSerializer(ViewerStateListSerializer):
+    """Also loads every post's recent comments for the page in one query"""
+    
+    def load_page_state(self, posts):
+        state = super().load_page_state(posts)
+        state['recent_comments'] = recent_comments([post.id for post in posts])
+        return state
+
+
+def _is_liked_by_viewer(serializer, obj):
+    """Viewer's like state, from the page-wide set when a list serializer loaded one"""
+    liked = serializer.context.get('liked_post_ids')
+    if liked is not None:
+        return obj.id in liked
+    request = serializer.context.get('request')
+    if request and request.user.is_authenticated:
+        return obj.is_liked_by(request.user)
+    return False
+
+
+def _image_srcset(serializer, obj):
+    """WebP and JPEG ``srcset`` of the post image, None until its renditions exist"""
+    by_post = serializer.context.get('renditions')
+    if by_post is not None:
+        post_renditions = by_post.get(obj.id, [])
+    else:
+        post_renditions = list(obj.renditions.all()) if obj.image else []
+    if not post_renditions:
+        return None
+    request = serializer.context.get('request')
+    build_url = request.build_absolute_uri if request else None
+    return {name: rendition_srcset(post_renditions, name, build_url) for name, _ in PostRendition.FORMATS}
+
+
 class UserBasicSerializer(serializers.ModelSerializer):
     """Basic user serializer for nested use"""
     profile_image = serializers.SerializerMethodField()
@@ -38,20 +97,22 @@ class CommentSerializer(serializers.ModelSerializer):
 class PostSerializer(serializers.ModelSerializer):
     """Serializer for Post model"""
     user = UserBasicSerializer(read_only=True)
-    total_likes = serializers.SerializerMethodField()
-    total_comments = serializers.SerializerMethodField()
+    total_likes = serializers.IntegerField(read_only=True)
+    total_comments = serializers.IntegerField(source='comment_count', read_only=True)
     is_liked = serializers.SerializerMethodField()
     comments = CommentSerializer(many=True, read_only=True)
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True, format='%Y-%m-%d %H:%M:%S')
     
     class Meta:
         model = Post
         fields = [
-            'id', 'user', 'image', 'caption', 'created_at', 'updated_at',
+            'id', 'user', 'image', 'srcset', 'processing', 'caption', 'created_at', 'updated_at',
             'total_likes', 'total_comments', 'is_liked', 'comments', 'is_active'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
+        list_serializer_class = ViewerStateListSerializer
     
     def get_image(self, obj):
         if obj.image:
@@ -60,17 +121,11 @@ class PostSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
         return None
     
-    def get_total_likes(self, obj):
-        return obj.total_likes()
-    
-    def get_total_comments(self, obj):
-        return obj.comments.filter(is_active=True).count()
+    def get_srcset(self, obj):
+        return _image_srcset(self, obj)
     
     def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.is_liked_by(request.user)
-        return False
+        return _is_liked_by_viewer(self, obj)
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -78,11 +133,20 @@ class PostSerializer(serializers.ModelSerializer):
 
 
 class PostCreateSerializer(serializers.ModelSerializer):
-    """Simplified serializer for creating posts"""
+    """Simplified serializer for creating posts; hashtags are indexed by Post.save"""
+    hashtags = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = ['image', 'caption']
+        fields = ['image', 'caption', 'hashtags']
+    
+    def validate_caption(self, value):
+        if len(extract_hashtags(value, limit=None)) > MAX_TAGS_PER_POST:
+            raise serializers.ValidationError(f'A caption can have at most {MAX_TAGS_PER_POST} hashtags.')
+        return value
+    
+    def get_hashtags(self, obj):
+        return extract_hashtags(obj.caption)
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -120,18 +184,20 @@ class FeedPostSerializer(serializers.ModelSerializer):
     """Optimized serializer for feed posts"""
     user = UserBasicSerializer(read_only=True)
     total_likes = serializers.IntegerField(read_only=True)
-    total_comments = serializers.IntegerField(read_only=True)
+    total_comments = serializers.IntegerField(source='comment_count', read_only=True)
     is_liked = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True, format='%Y-%m-%d %H:%M:%S')
     recent_comments = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = [
-            'id', 'user', 'image', 'caption', 'created_at',
+            'id', 'user', 'image', 'srcset', 'processing', 'caption', 'created_at',
             'total_likes', 'total_comments', 'is_liked', 'recent_comments'
         ]
+        list_serializer_class = FeedPostListSerializer
     
     def get_image(self, obj):
         if obj.image:
@@ -140,15 +206,17 @@ class FeedPostSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
         return None
     
+    def get_srcset(self, obj):
+        return _image_srcset(self, obj)
+    
     def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.is_liked_by(request.user)
-        return False
+        return _is_liked_by_viewer(self, obj)
     
     def get_recent_comments(self, obj):
-        recent_comments = obj.comments.filter(is_active=True).order_by('-created_at')[:3]
-        return CommentSerializer(recent_comments, many=True, context=self.context).data
+        page_comments = self.context.get('recent_comments')
+        if page_comments is None:
+            page_comments = recent_comments([obj.id])
+        return CommentSerializer(page_comments.get(obj.id, []), many=True, context=self.context).data
 
 
 class SearchSerializer(serializers.Serializer):
@@ -156,4 +224,12 @@ class SearchSerializer(serializers.Serializer):
     users = UserBasicSerializer(many=True, read_only=True)
     posts = PostSerializer(many=True, read_only=True)
     query = serializers.CharField(read_only=True)
-    total_results = serializers.IntegerField(read_only=True)
\ No newline at end of file
+    total_results = serializers.IntegerField(read_only=True)
+
+
+class HashtagSerializer(serializers.ModelSerializer):
+    """Serializer for a hashtag and its active post count"""
+    
+    class Meta:
+        model = Hashtag
+        fields = ['name', 'post_count']
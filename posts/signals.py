@@ -0,0 +1,117 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Post, Comment, Follow
+from . import counters, hashtags, search, storage, timeline, trending
+
+
+@receiver(post_save, sender=Post)
+def sync_post_timelines(sender, instance, created, **kwargs):
+    """Fan out new posts and keep timelines in step with soft-deletes"""
+    was_active = None if created else getattr(instance, '_loaded_is_active', None)
+    if instance.is_active != was_active:
+        if instance.is_active:
+            timeline.fan_out_post(instance)
+        elif not created:
+            timeline.remove_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def sync_post_score(sender, instance, created, **kwargs):
+    """Score new and restored posts for Explore, drop soft-deleted ones"""
+    was_active = None if created else getattr(instance, '_loaded_is_active', None)
+    if instance.is_active != was_active:
+        if instance.is_active:
+            trending.rescore([instance.id])
+        elif not created:
+            trending.remove(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post_caption(sender, instance, **kwargs):
+    """Keep the caption search index current (a no-op where FTS5 triggers do it)"""
+    search.index_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def unindex_deleted_post_hashtags(sender, instance, **kwargs):
+    """Keep hashtag post counts right when a post is hard-deleted (saves are handled in Post.save)"""
+    hashtags.remove_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_post_image(sender, instance, **kwargs):
+    """Drop the hard-deleted post's reference to its image blob"""
+    storage.release(getattr(instance, '_loaded_image', instance.image.name))
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_content(sender, instance, **kwargs):
+    """Keep the comment search index current (a no-op where FTS5 triggers do it)"""
+    search.index_comment(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_follow_timeline(sender, instance, created, **kwargs):
+    """Copy the followed user's recent posts into the new follower's timeline"""
+    if created:
+        timeline.add_follow(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_unfollow_timeline(sender, instance, **kwargs):
+    """Remove an unfollowed user's posts from the former follower's timeline"""
+    timeline.remove_follow(instance.follower_id, instance.following_id)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Post.like_count in step with the likes join table"""
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set is what was asked for, not what exists; record the rows actually removed
+        rows = sender.objects.filter(user_id=instance.pk) if reverse else sender.objects.filter(post_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(post_id__in=pk_set) if reverse else rows.filter(user_id__in=pk_set)
+        instance._removed_like_ids = list(rows.values_list('post_id' if reverse else 'user_id', flat=True))
+        return
+
+    if action == 'post_add':
+        changed, delta = list(pk_set), 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop('_removed_like_ids', []), -1
+    else:
+        return
+
+    if reverse:
+        counters.adjust(changed, 'like_count', delta)
+    elif changed:
+        counters.adjust([instance.pk], 'like_count', delta * len(changed))
+        counters.bump_cached(instance, 'like_count', delta * len(changed))
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user_likes(sender, instance, **kwargs):
+    """A deleted user's likes go with the cascade, which does not send m2m_changed"""
+    liked_post_ids = list(Post.likes.through.objects.filter(user_id=instance.pk).values_list('post_id', flat=True))
+    counters.adjust(liked_post_ids, 'like_count', -1)
+
+
+def _adjust_comment_count(comment, delta):
+    counters.adjust([comment.post_id], 'comment_count', delta)
+    if Comment.post.is_cached(comment):
+        counters.bump_cached(comment.post, 'comment_count', delta)
+
+
+@receiver(post_save, sender=Comment)
+def count_comments(sender, instance, created, **kwargs):
+    """Keep Post.comment_count in step with new and moderated comments"""
+    was_active = False if created else getattr(instance, '_loaded_is_active', None)
+    if was_active is not None and instance.is_active != was_active:
+        _adjust_comment_count(instance, 1 if instance.is_active else -1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    """Hard-deleted active comments no longer count"""
+    if getattr(instance, '_loaded_is_active', instance.is_active):
+        _adjust_comment_count(instance, -1)
@@ -0,0 +1,169 @@
+"""
+Content-addressed media storage.
+
+Every upload is hashed (SHA-256) while it is streamed to a temporary file
+and then stored as ``blobs/<namespace>/<aa>/<bb>/<digest><ext>``, where the
+namespace is the first directory of the name the model asked for
+(``posts``, ``profiles``). An identical upload finds the file already there
+and gets the same name back, so reposts and re-uploads share one file and,
+for posts, one set of renditions. Names never collide, so Django never
+invents suffixed copies.
+
+Each blob has a MediaBlob row counting the model fields that point at it:
+``retain`` and ``release`` are called when a post or profile gets a new
+image or is deleted. ``gc_media`` deletes blobs nobody has referenced for a
+grace period, together with their renditions.
+
+The image worker resizes originals in place, so a blob's name is the hash
+of the bytes that were uploaded rather than of what is on disk; that is
+what lets the same upload find it again.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+BLOB_ROOT = 'blobs'
+TEMP_DIR = 'blobs/tmp'
+GC_GRACE_PERIOD = timedelta(hours=1)
+GC_BATCH_SIZE = 500
+
+# Model fields whose files are reference counted
+REFERENCES = [
+    ('posts.Post', 'image'),
+    ('users.UserProfile', 'profile_image'),
+]
+
+
+def _media_blob():
+    return apps.get_model('posts', 'MediaBlob')
+
+
+def blob_name(digest, requested_name):
+    """Storage name of the content with ``digest``, uploaded as ``requested_name``"""
+    namespace = requested_name.replace('\\', '/').split('/', 1)[0] if '/' in requested_name else 'files'
+    extension = os.path.splitext(requested_name)[1].lower()
+    return f'{BLOB_ROOT}/{namespace}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_ROOT}/') and not name.startswith(f'{TEMP_DIR}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct upload once, under its content hash"""
+
+    def get_available_name(self, name, max_length=None):
+        return name  # The final name is only known once the content is hashed
+
+    def _save(self, name, content):
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=temp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            name = blob_name(digest.hexdigest(), name)
+            now = timezone.now()
+            MediaBlob = _media_blob()
+            # Touching the row first waits for a collection of the same blob to commit
+            if MediaBlob.objects.filter(name=name).update(last_used_at=now) and self.exists(name):
+                os.remove(temp_path)
+            else:
+                path = self.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode or 0o644)
+                os.replace(temp_path, path)
+                MediaBlob.objects.update_or_create(name=name, defaults={'size': size, 'last_used_at': now})
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+def _adjust(name, delta):
+    if is_blob(name):
+        _media_blob().objects.filter(name=name).update(ref_count=F('ref_count') + delta, last_used_at=timezone.now())
+
+
+def retain(name):
+    """Count a new reference to the blob ``name``; other names are ignored"""
+    _adjust(name, 1)
+
+
+def release(name):
+    """Drop a reference to the blob ``name``; it is collected by gc_media once unused"""
+    _adjust(name, -1)
+
+
+def replace_reference(old_name, new_name):
+    """Move a model field's reference from ``old_name`` to ``new_name``"""
+    if old_name != new_name:
+        retain(new_name)
+        release(old_name)
+
+
+def recount():
+    """Recompute every blob's reference count from the model fields; returns the number of blobs"""
+    total = Value(0)
+    for label, field in REFERENCES:
+        references = apps.get_model(label).objects.filter(
+            **{field: OuterRef('name')}
+        ).order_by().values(field).annotate(n=Count('*')).values('n')
+        total = total + Coalesce(Subquery(references, output_field=IntegerField()), 0)
+    return _media_blob().objects.update(ref_count=total)
+
+
+def _delete_blob_files(storage, name):
+    from .images import blob_rendition_dir
+    storage.delete(name)
+    if name.startswith(f'{BLOB_ROOT}/posts/'):
+        shutil.rmtree(storage.path(blob_rendition_dir(name)), ignore_errors=True)
+
+
+def collect_garbage(grace_period=GC_GRACE_PERIOD, dry_run=False, storage=None, progress=None):
+    """
+    Delete blobs without references that have not been used for
+    ``grace_period``, with their renditions. Each blob is removed in its own
+    short transaction that re-checks the row, so an upload of the same
+    content arriving meanwhile keeps it. Returns (blobs, bytes) removed.
+    """
+    from django.core.files.storage import default_storage
+    storage = storage or default_storage
+    MediaBlob = _media_blob()
+    cutoff = timezone.now() - grace_period
+    candidates = MediaBlob.objects.filter(ref_count__lte=0, last_used_at__lt=cutoff).order_by('id')
+    removed = freed = 0
+    last_id = 0
+    while True:
+        batch = list(candidates.filter(id__gt=last_id).values_list('id', 'name', 'size')[:GC_BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for blob_id, name, size in batch:
+            if not dry_run:
+                with transaction.atomic():
+                    locked = candidates.select_for_update().filter(id=blob_id)
+                    if not locked.exists():
+                        continue
+                    _delete_blob_files(storage, name)
+                    locked.delete()
+            removed += 1
+            freed += size
+        if progress:
+            progress(removed, freed)
+    return removed, freed
@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html
+
+from posts.images import post_renditions, srcset
 
 register = template.Library()
 
@@ -19,4 +22,19 @@ def truncate_text(text, length=100):
             return str(text)[:length] + "..."
         return str(text)
     except (ValueError, TypeError):
-        return str(text)
\ No newline at end of file
+        return str(text)
+
+@register.simple_tag
+def post_picture(post, sizes='100vw', alt='', css_class=''):
+    """
+    The post image as a <picture> offering its WebP and JPEG renditions
+    through srcset, or a plain <img> of the upload until they exist.
+    """
+    renditions = post_renditions(post)
+    if not renditions:
+        return format_html('<img src="{}" alt="{}" class="{}">', post.image.url, alt, css_class)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        srcset(renditions, 'webp'), sizes, post.image.url, srcset(renditions, 'jpeg'), sizes, alt, css_class
+    )
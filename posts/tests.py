@@ -1,11 +1,24 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
 from PIL import Image
 import io
-from .models import Post, Comment, Follow
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from datetime import timedelta
+from django.utils import timezone
+from .models import Post, Comment, Follow, Hashtag, PostHashtag, ImageJob, PostRendition, MediaBlob
+from . import counters, images, storage
 from users.models import UserProfile
 
 
@@ -284,3 +297,1147 @@ class PostFormTest(TestCase):
         form = PostForm(data={})
         self.assertFalse(form.is_valid())
         self.assertIn('Please provide either a caption or an image for your post.', str(form.errors))
+
+
+class TimelineTest(TestCase):
+    """Test cases for the materialized home timeline"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        UserProfile.objects.create(user=self.author)
+        UserProfile.objects.create(user=self.reader)
+        Follow.objects.create(follower=self.reader, following=self.author)
+    
+    def timeline_ids(self, user):
+        from .timeline import timeline_posts
+        return list(timeline_posts(user).values_list('id', flat=True))
+    
+    def test_post_fans_out_to_followers(self):
+        """Test that a new post lands on the author's and followers' timelines"""
+        post = Post.objects.create(user=self.author, caption='Fresh post')
+        self.assertEqual(self.timeline_ids(self.reader), [post.id])
+        self.assertEqual(self.timeline_ids(self.author), [post.id])
+    
+    def test_soft_delete_removes_entries(self):
+        """Test that soft-deleting a post removes it from timelines"""
+        post = Post.objects.create(user=self.author, caption='Short lived')
+        post = Post.objects.get(id=post.id)
+        post.is_active = False
+        post.save()
+        self.assertEqual(self.timeline_ids(self.reader), [])
+    
+    def test_follow_and_unfollow_update_timeline(self):
+        """Test that following backfills and unfollowing prunes the timeline"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        post = Post.objects.create(user=other, caption='Older post')
+        follow = Follow.objects.create(follower=self.reader, following=other)
+        self.assertEqual(self.timeline_ids(self.reader), [post.id])
+        follow.delete()
+        self.assertEqual(self.timeline_ids(self.reader), [])
+    
+    def test_backfill_command(self):
+        """Test that backfill_timelines rebuilds missing entries"""
+        from .models import TimelineEntry
+        post = Post.objects.create(user=self.author, caption='Backfilled')
+        TimelineEntry.objects.all().delete()
+        call_command('backfill_timelines', stdout=io.StringIO())
+        self.assertEqual(self.timeline_ids(self.reader), [post.id])
+    
+    def test_feed_api_reads_timeline(self):
+        """Test that the feed API returns timeline posts"""
+        post = Post.objects.create(user=self.author, caption='API post')
+        self.client.login(username='reader', password='testpass123')
+        response = self.client.get(reverse('api-feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [post.id])
+
+
+@override_settings(TIMELINE_CELEBRITY_THRESHOLD=1)
+class HybridTimelineTest(TestCase):
+    """Test cases for fan-out on read of celebrity authors"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.celebrity = User.objects.create_user(username='celebrity', password='testpass123')
+        self.regular = User.objects.create_user(username='regular', password='testpass123')
+        self.fan = User.objects.create_user(username='fan', password='testpass123')
+        other_fan = User.objects.create_user(username='otherfan', password='testpass123')
+        for user in (self.celebrity, self.regular, self.fan, other_fan):
+            UserProfile.objects.create(user=user)
+        Follow.objects.create(follower=other_fan, following=self.celebrity)
+        Follow.objects.create(follower=self.fan, following=self.celebrity)
+        Follow.objects.create(follower=self.fan, following=self.regular)
+    
+    def test_celebrity_is_promoted_and_not_fanned_out(self):
+        """Test that authors above the threshold skip fan-out"""
+        from .models import CelebrityAuthor, TimelineEntry
+        self.assertTrue(CelebrityAuthor.objects.filter(user=self.celebrity).exists())
+        self.assertFalse(CelebrityAuthor.objects.filter(user=self.regular).exists())
+        post = Post.objects.create(user=self.celebrity, caption='Big announcement')
+        self.assertEqual(list(TimelineEntry.objects.filter(post=post).values_list('owner', flat=True)), [self.celebrity.id])
+    
+    def test_promotion_reads_the_follower_counter(self):
+        """Test that the threshold check reads UserProfile.followers_count instead of the follows"""
+        from .models import CelebrityAuthor
+        from .timeline import update_celebrity_status
+        with self.assertNumQueries(2):
+            self.assertFalse(update_celebrity_status(self.regular.id))
+        UserProfile.objects.filter(user=self.regular).update(followers_count=5)
+        self.assertTrue(update_celebrity_status(self.regular.id))
+        self.assertTrue(CelebrityAuthor.objects.filter(user=self.regular).exists())
+    
+    def test_feed_merges_celebrity_posts(self):
+        """Test that the feed merges fanned-out and celebrity posts newest first"""
+        from .timeline import HomeTimeline
+        first = Post.objects.create(user=self.regular, caption='First')
+        second = Post.objects.create(user=self.celebrity, caption='Second')
+        third = Post.objects.create(user=self.regular, caption='Third')
+        feed = HomeTimeline(self.fan)
+        self.assertEqual(feed.count(), 3)
+        self.assertEqual([post.id for post in feed[0:3]], [third.id, second.id, first.id])
+        self.assertEqual([post.id for post in feed[1:2]], [second.id])
+        
+        self.client.login(username='fan', password='testpass123')
+        response = self.client.get(reverse('api-feed'))
+        self.assertEqual([item['id'] for item in response.json()['results']], [third.id, second.id, first.id])
+    
+    def test_deep_slices_read_one_slice_per_source(self):
+        """Test that offset slices walk the merged sources a slice at a time"""
+        from .timeline import HomeTimeline
+        posts = [Post.objects.create(user=author, caption=f'Post {i}') for i in range(6) for author in (self.regular, self.celebrity)]
+        expected = [post.id for post in reversed(posts)]
+        feed = HomeTimeline(self.fan)
+        with mock.patch.object(HomeTimeline, '_range', autospec=True, side_effect=HomeTimeline._range) as read:
+            pages = [[post.id for post in feed[start:start + 3]] for start in range(0, 12, 3)]
+        self.assertEqual(sum(pages, []), expected)
+        self.assertTrue(all(call.args[3] <= 3 for call in read.call_args_list))
+        self.assertEqual(feed[12:15], [])
+
+
+class KeysetPaginationTest(TestCase):
+    """Test cases for cursor pagination of API listings"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        UserProfile.objects.create(user=self.user)
+        self.posts = [Post.objects.create(user=self.user, caption=f'Post {i}') for i in range(5)]
+        self.client.login(username='testuser', password='testpass123')
+    
+    def walk(self, url):
+        """Follow next links and return (ids, last response)"""
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        return ids, data
+    
+    def test_pages_cover_all_posts_without_count(self):
+        """Test that next cursors walk every post once, newest first"""
+        ids, last = self.walk(reverse('api-feed') + '?page_size=2')
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertNotIn('count', last)
+    
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2)
+    def test_feed_keeps_posts_older_than_backfill(self):
+        """Test that followed posts never copied into the timeline are still paged, newest first"""
+        from .timeline import rebuild_timeline
+        author = User.objects.create_user(username='prolific', password='testpass123')
+        author_posts = [Post.objects.create(user=author, caption=f'Old {i}') for i in range(4)]
+        Follow.objects.create(follower=self.user, following=author)
+        expected = sorted(self.posts + author_posts, key=lambda post: post.id, reverse=True)
+        ids, _ = self.walk(reverse('api-feed') + '?page_size=2')
+        self.assertEqual(ids, [post.id for post in expected])
+        
+        # A rebuild keeps only the newest posts across all authors
+        rebuild_timeline(self.user)
+        ids, _ = self.walk(reverse('api-feed') + '?page_size=3')
+        self.assertEqual(ids, [post.id for post in expected])
+    
+    def test_explore_pages_by_likes(self):
+        """Test that explore cursors follow the trending score ordering"""
+        self.posts[1].likes.add(self.user)
+        ids, _ = self.walk(reverse('api-explore') + '?page_size=2')
+        expected = [self.posts[1].id] + [post.id for post in reversed(self.posts) if post != self.posts[1]]
+        self.assertEqual(ids, expected)
+    
+    def test_ordering_by_total_likes(self):
+        """Test that ?ordering=total_likes sorts by the stored like counter on every post listing"""
+        liker = User.objects.create_user(username='liker', password='testpass123')
+        self.posts[2].likes.add(self.user, liker)
+        self.posts[4].likes.add(self.user)
+        Post.objects.create(user=liker, caption='#tagged')
+        for post in self.posts:
+            post.caption = f'{post.caption} #tagged'
+            post.save()
+        expected = [self.posts[2].id, self.posts[4].id, self.posts[3].id, self.posts[1].id, self.posts[0].id]
+        for url in (
+            reverse('api-explore'),
+            reverse('api-tag-feed', args=['tagged']),
+            reverse('api-user-posts', kwargs={'username': self.user.username}),
+        ):
+            ids, _ = self.walk(url + '?ordering=-total_likes&page_size=2')
+            self.assertEqual([post_id for post_id in ids if post_id in expected], expected, url)
+    
+    def test_previous_cursor_returns_prior_page(self):
+        """Test that the previous cursor walks back to the first page"""
+        first = self.client.get(reverse('api-feed') + '?page_size=2').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+    
+    def test_comments_are_oldest_first(self):
+        """Test that comment listings paginate in ascending order"""
+        comments = [Comment.objects.create(post=self.posts[0], user=self.user, content=f'c{i}') for i in range(3)]
+        url = reverse('post-comments', kwargs={'pk': self.posts[0].id}) + '?page_size=2'
+        ids, _ = self.walk(url)
+        self.assertEqual(ids, [comment.id for comment in comments])
+    
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = self.client.get(reverse('api-feed') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+    
+    def cursor(self, position):
+        import base64
+        import json
+        return base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+    
+    def test_foreign_key_ordering_is_ignored(self):
+        """Test that ?ordering= on a relation falls back to the default ordering instead of failing"""
+        comments = [Comment.objects.create(post=self.posts[0], user=self.user, content=f'c{i}') for i in range(2)]
+        ids, _ = self.walk(reverse('comment-list') + '?ordering=user&page_size=1')
+        self.assertEqual(ids, [comment.id for comment in comments])
+    
+    def test_cursor_with_malformed_date(self):
+        """Test that a cursor whose date does not parse is rejected"""
+        response = self.client.get(reverse('api-explore'), {'ordering': 'created_at', 'cursor': self.cursor(['notadate', 5])})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_cursor_with_malformed_id(self):
+        """Test that a cursor whose id is not a number is rejected"""
+        created_at = {'dt': self.posts[0].created_at.isoformat()}
+        response = self.client.get(reverse('api-user-posts', kwargs={'username': self.user.username}),
+                                   {'cursor': self.cursor([created_at, 'x'])})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_cursor_with_nested_values(self):
+        """Test that a cursor holding lists instead of scalars is rejected"""
+        for url in (reverse('api-feed'), reverse('comment-list')):
+            response = self.client.get(url, {'cursor': self.cursor([[1], 5])})
+            self.assertEqual(response.status_code, 404, url)
+
+
+class FeedViewPaginationTest(TestCase):
+    """Test cases for the followed-first HTML feed"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.friend = User.objects.create_user(username='friend', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', password='testpass123')
+        for user in (self.user, self.friend, self.stranger):
+            UserProfile.objects.create(user=user)
+        Follow.objects.create(follower=self.user, following=self.friend)
+        self.friend_posts = [Post.objects.create(user=self.friend, caption=f'Friend {i}') for i in range(12)]
+        self.stranger_posts = [Post.objects.create(user=self.stranger, caption=f'Stranger {i}') for i in range(3)]
+        self.client.login(username='reader', password='testpass123')
+    
+    def test_followed_posts_come_first_across_pages(self):
+        """Test that pages list followed posts before everyone else"""
+        first = self.client.get(reverse('feed'))
+        second = self.client.get(reverse('feed'), {'page': 2})
+        ids = [post.id for post in first.context['posts']] + [post.id for post in second.context['posts']]
+        expected = [post.id for post in reversed(self.friend_posts)] + [post.id for post in reversed(self.stranger_posts)]
+        self.assertEqual(ids, expected)
+        self.assertEqual(second.context['posts'].paginator.num_pages, 2)
+    
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2)
+    def test_posts_older_than_backfill_are_kept(self):
+        """Test that followed posts never copied into the timeline still come before everyone else"""
+        author = User.objects.create_user(username='prolific', password='testpass123')
+        UserProfile.objects.create(user=author)
+        author_posts = [Post.objects.create(user=author, caption=f'Old {i}') for i in range(5)]
+        Follow.objects.create(follower=self.user, following=author)
+        self.friend_posts.append(Post.objects.create(user=self.friend, caption='Newest'))
+        
+        ids = []
+        for page in (1, 2, 3):
+            ids.extend(post.id for post in self.client.get(reverse('feed'), {'page': page}).context['posts'])
+        followed = sorted(self.friend_posts + author_posts, key=lambda post: post.id, reverse=True)
+        self.assertEqual(set(ids[:len(followed)]), {post.id for post in followed})
+        self.assertEqual(ids[len(followed):], [post.id for post in reversed(self.stranger_posts)])
+    
+    def test_later_bucket_not_read_for_early_pages(self):
+        """Test that ChainedFeed leaves later buckets unread while earlier ones cover the slice"""
+        from .timeline import ChainedFeed
+        
+        class Unreadable:
+            def count(self):
+                return 100
+            
+            def __getitem__(self, index):
+                raise AssertionError('second bucket was read')
+        
+        feed = ChainedFeed(Post.objects.order_by('-created_at', '-id'), Unreadable())
+        self.assertEqual(len(feed[0:10]), 10)
+        self.assertEqual(feed.count(), 115)
+
+
+class PostCounterTest(TestCase):
+    """Test cases for denormalized like and comment counters"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        UserProfile.objects.create(user=self.user)
+        UserProfile.objects.create(user=self.other)
+        self.post = Post.objects.create(user=self.user, caption='Counted post')
+    
+    def stored(self):
+        return Post.objects.values_list('like_count', 'comment_count').get(id=self.post.id)
+    
+    def test_like_and_unlike_update_counter(self):
+        """Test that likes from either side of the relation adjust like_count"""
+        self.post.likes.add(self.user, self.other)
+        self.post.likes.add(self.user)  # Already liked, no change
+        self.other.liked_posts.remove(self.post)
+        self.post.likes.remove(self.other)  # Not liked any more, no change
+        self.assertEqual(self.stored(), (1, 0))
+        self.post.likes.clear()
+        self.assertEqual(self.stored(), (0, 0))
+    
+    def test_comment_moderation_updates_counter(self):
+        """Test that soft-deleting and restoring comments adjusts comment_count"""
+        comment = Comment.objects.create(post=self.post, user=self.other, content='Nice')
+        Comment.objects.create(post=self.post, user=self.other, content='Hidden', is_active=False)
+        self.assertEqual(self.stored(), (0, 1))
+        
+        comment = Comment.objects.get(id=comment.id)
+        comment.is_active = False
+        comment.save()
+        self.assertEqual(self.stored(), (0, 0))
+        comment.is_active = True
+        comment.save()
+        comment.delete()
+        self.assertEqual(self.stored(), (0, 0))
+    
+    def test_deleting_user_uncounts_their_likes(self):
+        """Test that likes removed by a user deletion cascade are uncounted"""
+        self.post.likes.add(self.user, self.other)
+        self.other.delete()
+        self.assertEqual(self.stored(), (1, 0))
+    
+    def test_reconcile_command_repairs_drift(self):
+        """Test that reconcile_post_counters recomputes drifted counters"""
+        self.post.likes.add(self.other)
+        Comment.objects.create(post=self.post, user=self.other, content='Nice')
+        untouched = Post.objects.create(user=self.other, caption='Correct')
+        Post.objects.filter(id=self.post.id).update(like_count=5, comment_count=0)
+        
+        output = io.StringIO()
+        call_command('reconcile_post_counters', '--dry-run', stdout=output)
+        self.assertIn('Found 1 drifted posts out of 2', output.getvalue())
+        self.assertEqual(self.stored(), (5, 0))
+        call_command('reconcile_post_counters', '--chunk-size', '1', stdout=io.StringIO())
+        self.assertEqual(self.stored(), (1, 1))
+        self.assertEqual(Post.objects.get(id=untouched.id).like_count, 0)
+    
+    def test_views_report_counters(self):
+        """Test that like and comment views return the maintained counts"""
+        self.client.login(username='other', password='testpass123')
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        response = self.client.post(reverse('like_post', kwargs={'post_id': self.post.id}), **ajax)
+        self.assertEqual(response.json()['likes_count'], 1)
+        response = self.client.post(reverse('add_comment', kwargs={'post_id': self.post.id}), {'content': 'Hi'}, **ajax)
+        self.assertEqual(response.json()['comments_count'], 1)
+        response = self.client.post(reverse('post-like', kwargs={'pk': self.post.id}))
+        self.assertEqual(response.json()['total_likes'], 0)
+    
+    def test_counters_read_without_queries(self):
+        """Test that reading counts does not query likes or comments"""
+        self.post.likes.add(self.other)
+        post = Post.objects.get(id=self.post.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(post.total_likes(), 1)
+            self.assertEqual(post.comment_count, 0)
+
+
+@override_settings(COUNTER_BUFFER_ENABLED=True, COUNTER_FLUSH_INTERVAL=3600)
+class CounterBufferTest(TestCase):
+    """Test cases for the write-coalescing like counter buffer"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        # The test cache stands in for Redis
+        durable = mock.patch.object(counters, 'DURABLE_CACHE_BACKENDS', (settings.CACHES['default']['BACKEND'],))
+        durable.start()
+        self.addCleanup(durable.stop)
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='testpass123') for i in range(3)]
+        self.post = Post.objects.create(user=self.author, caption='Viral post')
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def stored_likes(self):
+        return Post.objects.values_list('like_count', flat=True).get(id=self.post.id)
+    
+    def test_likes_are_buffered_and_visible(self):
+        """Test that likes skip the post row but still show in total_likes"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                self.post.likes.add(fan)
+            self.post.likes.remove(self.fans[0])
+        self.assertEqual(self.stored_likes(), 0)
+        self.assertEqual(Post.objects.get(id=self.post.id).total_likes(), 2)
+    
+    def test_flush_applies_deltas_in_one_update(self):
+        """Test that a flush writes every buffered post's counters with a single UPDATE"""
+        other_post = Post.objects.create(user=self.author, caption='Another')
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                self.post.likes.add(fan)
+            other_post.likes.add(self.fans[0])
+        
+        # One counter UPDATE, then the trending rescore of the flushed posts
+        with self.assertNumQueries(3):
+            self.assertEqual(counters.buffer.flush(include_current=True), 2)
+        self.assertEqual(self.stored_likes(), 3)
+        self.assertEqual(Post.objects.get(id=other_post.id).like_count, 1)
+        self.assertEqual(Post.objects.get(id=self.post.id).total_likes(), 3)
+    
+    def test_rolled_back_likes_are_not_buffered(self):
+        """Test that deltas are only buffered once the like is committed"""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.post.likes.add(self.fans[0])
+        self.assertEqual(Post.objects.get(id=self.post.id).total_likes(), 0)
+    
+    def test_evicting_cache_writes_through(self):
+        """Test that likes bypass the buffer when the cache may drop them"""
+        with mock.patch.object(counters, 'DURABLE_CACHE_BACKENDS', ()):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post.likes.add(self.fans[0])
+            self.assertEqual(self.stored_likes(), 1)
+            with self.assertNumQueries(1):
+                self.assertEqual(Post.objects.get(id=self.post.id).total_likes(), 1)
+    
+    def test_evicted_keys_are_recreated(self):
+        """Test that a delta or dirty log lost from the cache does not break later likes"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.likes.add(self.fans[0])
+        counters.buffer.flush(include_current=True)
+        epoch = counters.buffer.epoch()
+        cache.delete_many([counters.buffer._key(epoch, 'like_count', self.post.id), counters.buffer._key(epoch, 'dirty')])
+        real_add = cache.add
+        calls = []
+        
+        def add(key, *args, **kwargs):
+            calls.append(key)
+            # The delta key still looks present to the first add() but is gone by incr()
+            return False if len(calls) == 1 else real_add(key, *args, **kwargs)
+        
+        with mock.patch.object(cache, 'add', side_effect=add):
+            counters.buffer.add(self.post.id, 'like_count', 1)
+        self.assertEqual(counters.buffer.pending(self.post.id, 'like_count'), 1)
+        counters.buffer.flush(include_current=True)
+        self.assertEqual(self.stored_likes(), 2)
+    
+    def test_flushed_deltas_are_not_counted_twice(self):
+        """Test that deltas stop counting as pending as soon as the flush records them"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.likes.add(self.fans[0])
+        with mock.patch.object(cache, 'delete_many'):  # Keys left behind, as if read before cleanup
+            counters.buffer.flush(include_current=True)
+        self.assertEqual(Post.objects.get(id=self.post.id).total_likes(), 1)
+    
+    def test_flush_counters_command(self):
+        """Test the flush_counters management command"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.likes.add(self.fans[0])
+        out = io.StringIO()
+        call_command('flush_counters', '--all', stdout=out)
+        self.assertIn('Flushed buffered counters for 1 posts', out.getvalue())
+        self.assertEqual(self.stored_likes(), 1)
+
+
+class LikeAPITest(TestCase):
+    """Test cases for the idempotent like endpoints"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='liker', password='testpass123')
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(user=self.author, caption='Likeable')
+        self.url = reverse('post-like', kwargs={'pk': self.post.id})
+        self.client.login(username='liker', password='testpass123')
+    
+    def test_put_and_delete_are_idempotent(self):
+        """Test that repeating PUT or DELETE leaves a single like or none"""
+        for _ in range(2):
+            response = self.client.put(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['total_likes'], 1)
+            self.assertTrue(response.json()['liked'])
+        self.assertEqual(self.post.likes.count(), 1)
+        
+        for _ in range(2):
+            response = self.client.delete(self.url)
+            self.assertEqual(response.json()['total_likes'], 0)
+            self.assertFalse(response.json()['liked'])
+        self.assertEqual(Post.objects.get(id=self.post.id).like_count, 0)
+    
+    def test_post_toggles_like(self):
+        """Test that POST still toggles"""
+        self.assertTrue(self.client.post(self.url).json()['liked'])
+        self.assertFalse(self.client.post(self.url).json()['liked'])
+        self.assertFalse(self.post.likes.exists())
+    
+    def test_like_cost_independent_of_likers(self):
+        """Test that liking runs the same queries no matter how many users already like the post"""
+        fans = [User.objects.create_user(username=f'fan{i}', password='testpass123') for i in range(20)]
+        self.post.likes.add(*fans)
+        post = Post.objects.get(id=self.post.id)
+        # Savepoint, like INSERT, savepoint release, notification event INSERT,
+        # the counter UPDATE and the trending rescore
+        with self.assertNumQueries(7):
+            self.assertTrue(post.add_like(self.user))
+        self.assertEqual(post.total_likes(), 21)
+        with self.assertNumQueries(4):
+            self.assertTrue(post.remove_like(self.user))
+    
+    def test_notification_failure_is_not_read_as_already_liked(self):
+        """Test that an integrity error while queueing the notification is raised, not turned into an unlike"""
+        from django.db import IntegrityError
+        with mock.patch('users.notifications.create_like_notification', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.post.toggle_like(self.user)
+        self.assertTrue(self.post.is_liked_by(self.user))
+
+
+class ViewerStateTest(TestCase):
+    """Test cases for page-wide like state resolution"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        UserProfile.objects.create(user=self.reader)
+        UserProfile.objects.create(user=self.author)
+        Follow.objects.create(follower=self.reader, following=self.author)
+        self.posts = [Post.objects.create(user=self.author, caption=f'Post {i}') for i in range(6)]
+        for post in self.posts[::2]:
+            post.add_like(self.reader)
+        self.client.login(username='reader', password='testpass123')
+    
+    def test_api_like_state_is_one_query_per_page(self):
+        """Test that is_liked is correct and costs one likes query for the whole page"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api-feed'), {'page_size': 6})
+        results = response.json()['results']
+        liked = {post.id for post in self.posts[::2]}
+        self.assertEqual({item['id'] for item in results if item['is_liked']}, liked)
+        like_queries = [query for query in queries if 'posts_post_likes' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+    
+    def test_html_feed_gets_liked_ids(self):
+        """Test that the HTML feed receives the liked ids for its page"""
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(response.context['liked_post_ids'], {post.id for post in self.posts[::2]})
+        self.assertContains(response, 'data-liked="true"', count=3)
+
+
+class RecentCommentsLoaderTest(TestCase):
+    """Test cases for the batched recent comments loader"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.commenter = User.objects.create_user(username='commenter', password='testpass123')
+        UserProfile.objects.create(user=self.commenter)
+        self.posts = [Post.objects.create(user=self.author, caption=f'Post {i}') for i in range(3)]
+        self.comments = {
+            post.id: [Comment.objects.create(post=post, user=self.commenter, content=f'{post.id}-{i}') for i in range(5)]
+            for post in self.posts[:2]
+        }
+        Comment.objects.create(post=self.posts[0], user=self.commenter, content='Hidden', is_active=False)
+    
+    def expected(self):
+        expected = {post_id: [c.id for c in reversed(comments)][:3] for post_id, comments in self.comments.items()}
+        expected[self.posts[2].id] = []
+        return expected
+    
+    def load(self):
+        from .loaders import recent_comments
+        with self.assertNumQueries(1):
+            by_post = recent_comments([post.id for post in self.posts])
+            # Commenters and their profiles come from the same query
+            for comments in by_post.values():
+                for comment in comments:
+                    comment.user.profile
+        return {post_id: [c.id for c in comments] for post_id, comments in by_post.items()}
+    
+    def test_window_function_loader(self):
+        """Test that the ROW_NUMBER() path returns the newest active comments per post"""
+        self.assertEqual(self.load(), self.expected())
+    
+    def test_fallback_without_window_functions(self):
+        """Test that the correlated subquery fallback returns the same comments"""
+        with mock.patch.object(connection.features, 'supports_over_clause', False):
+            self.assertEqual(self.load(), self.expected())
+    
+    def test_feed_api_recent_comments(self):
+        """Test that the feed API serves recent comments from the page loader"""
+        viewer = User.objects.create_user(username='viewer', password='testpass123')
+        Follow.objects.create(follower=viewer, following=self.author)
+        self.client.login(username='viewer', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(reverse('api-feed')).json()['results']
+        by_post = {item['id']: [c['id'] for c in item['recent_comments']] for item in results}
+        self.assertEqual(by_post, self.expected())
+        comment_queries = [query for query in queries if 'FROM "posts_comment"' in query['sql']]
+        self.assertEqual(len(comment_queries), 1)
+
+
+class TrendingTest(TestCase):
+    """Test cases for precomputed trending scores"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.fan = User.objects.create_user(username='fan', password='testpass123')
+        self.posts = [Post.objects.create(user=self.author, caption=f'Post {i}') for i in range(3)]
+    
+    def explore_ids(self):
+        return [item['id'] for item in self.client.get(reverse('api-explore')).json()['results']]
+    
+    def test_scores_follow_post_lifecycle(self):
+        """Test that posts are scored on create and dropped on soft-delete"""
+        from .models import PostScore
+        self.assertEqual(PostScore.objects.count(), 3)
+        post = Post.objects.get(id=self.posts[0].id)
+        post.is_active = False
+        post.save()
+        self.assertFalse(PostScore.objects.filter(post_id=post.id).exists())
+        self.assertNotIn(post.id, self.explore_ids())
+    
+    def test_engagement_reorders_explore(self):
+        """Test that likes and comments rescore posts incrementally"""
+        self.posts[0].add_like(self.fan)
+        Comment.objects.create(post=self.posts[1], user=self.fan, content='Nice')
+        self.assertEqual(self.explore_ids(), [self.posts[1].id, self.posts[0].id, self.posts[2].id])
+    
+    def test_explore_reads_score_index(self):
+        """Test that Explore never aggregates the likes table"""
+        with CaptureQueriesContext(connection) as queries:
+            self.explore_ids()
+        self.assertFalse([query for query in queries if 'posts_post_likes' in query['sql']])
+    
+    @override_settings(TRENDING_SCORE_FUNCTION='posts.trending.gravity_score')
+    def test_rescore_command_uses_configured_function(self):
+        """Test that rescore_trending applies the pluggable formula"""
+        from .models import PostScore
+        from .trending import gravity_score
+        out = io.StringIO()
+        call_command('rescore_trending', '--all', stdout=out)
+        self.assertIn('Scored 3 posts', out.getvalue())
+        score = PostScore.objects.select_related('post').get(post_id=self.posts[0].id)
+        self.assertAlmostEqual(score.score, gravity_score(0, 0, score.post.created_at, score.updated_at))
+
+
+class SearchIndexTest(TestCase):
+    """Test cases for full-text caption and comment search"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.old = Post.objects.create(user=self.author, caption='Sunset over the harbour')
+        Post.objects.filter(id=self.old.id).update(created_at=timezone.now() - timedelta(days=60))
+        self.new = Post.objects.create(user=self.author, caption='Another sunset tonight')
+        self.other = Post.objects.create(user=self.author, caption='Breakfast')
+        Comment.objects.create(post=self.other, user=self.author, content='Looks like a sunrise café')
+    
+    def ids(self, query):
+        from .search import search_posts
+        return [post.id for post in search_posts(query)]
+    
+    def assert_search_behaviour(self):
+        self.assertEqual(self.ids('sunset'), [self.new.id, self.old.id])
+        self.assertEqual(self.ids('sunset harb'), [self.old.id])  # Last word is a prefix
+        self.assertEqual(self.ids('sunset sun'), [self.new.id, self.old.id])  # Prefix covered by an earlier word
+        self.assertEqual(self.ids('cafe sunrise'), [self.other.id])  # Comments, diacritics folded
+        self.assertEqual(self.ids('sunset breakfast'), [])
+        
+        post = Post.objects.get(id=self.new.id)
+        post.is_active = False
+        post.save()
+        self.assertEqual(self.ids('sunset'), [self.old.id])
+        
+        post = Post.objects.get(id=self.old.id)
+        post.caption = 'Harbour at dawn'
+        post.save()
+        self.assertEqual(self.ids('sunset'), [])
+    
+    def test_fts5_index(self):
+        """Test search through the SQLite FTS5 table"""
+        from .search import fts_available
+        if not fts_available():
+            self.skipTest('SQLite without FTS5')
+        self.assert_search_behaviour()
+    
+    def test_inverted_index(self):
+        """Test search through the SearchPosting fallback"""
+        with mock.patch('posts.search.fts_available', return_value=False):
+            call_command('rebuild_search_index', stdout=io.StringIO())
+            self.assert_search_behaviour()
+    
+    def test_api_search_filter(self):
+        """Test that ?search= on the posts API uses the index"""
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('post-list'), {'search': 'sunset'})
+        self.assertEqual({item['id'] for item in response.json()['results']}, {self.new.id, self.old.id})
+        response = self.client.get(reverse('post-list'), {'search': 'utho'})
+        self.assertEqual(len(response.json()['results']), 3)  # Part of the author's username
+    
+    def test_rebuild_command(self):
+        """Test that rebuild_search_index repopulates the index"""
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Rebuilt', out.getvalue())
+        self.assertEqual(self.ids('breakfast'), [self.other.id])
+
+
+class HashtagTest(TestCase):
+    """Test cases for hashtag extraction, the tag index and the tag feed"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.client.force_login(self.author)
+    
+    def counts(self):
+        return dict(Hashtag.objects.values_list('name', 'post_count'))
+    
+    def test_extract_hashtags(self):
+        """Test tag parsing and normalization"""
+        from .hashtags import extract_hashtags
+        self.assertEqual(
+            extract_hashtags('#Sunset at the #beach, #sunset again #2024 &#39; mail#fake #Café'),
+            ['sunset', 'beach', 'café']
+        )
+        self.assertEqual(extract_hashtags(' '.join(f'#t{i}' for i in range(40))), [f't{i}' for i in range(30)])
+    
+    def test_index_follows_caption_and_status(self):
+        """Test that saves keep the index and per-tag counters in step"""
+        post = Post.objects.create(user=self.author, caption='#sunset #beach')
+        Post.objects.create(user=self.author, caption='#sunset')
+        self.assertEqual(self.counts(), {'sunset': 2, 'beach': 1})
+        
+        post.caption = '#beach #dawn'
+        post.save()
+        self.assertEqual(self.counts(), {'sunset': 1, 'beach': 1, 'dawn': 1})
+        
+        post.is_active = False
+        post.save()
+        self.assertEqual(self.counts(), {'sunset': 1, 'beach': 0, 'dawn': 0})
+        
+        post.is_active = True
+        post.save(update_fields=['is_active'])
+        self.assertEqual(self.counts(), {'sunset': 1, 'beach': 1, 'dawn': 1})
+        
+        post.delete()
+        self.assertEqual(self.counts(), {'sunset': 1, 'beach': 0, 'dawn': 0})
+    
+    def test_already_linked_tags_are_not_counted_again(self):
+        """Test that syncing a post whose rows already exist leaves the counters alone"""
+        from . import hashtags
+        post = Post.objects.create(user=self.author, caption='#sunset #beach')
+        # As if a concurrent save linked the rows after this one looked
+        self.assertEqual(hashtags.sync_posts([post], created=True), 0)
+        post.caption = '#sunset #beach #dawn'
+        self.assertEqual(hashtags.sync_posts([post], created=True), 1)
+        self.assertEqual(self.counts(), {'sunset': 1, 'beach': 1, 'dawn': 1})
+    
+    def test_create_through_api(self):
+        """Test that created posts report their tags and validate the tag limit"""
+        response = self.client.post(reverse('post-list'), {'caption': 'Hello #World'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['hashtags'], ['world'])
+        self.assertEqual(self.counts(), {'world': 1})
+        
+        caption = ' '.join(f'#t{i}' for i in range(31))
+        response = self.client.post(reverse('post-list'), {'caption': caption})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_tag_feed(self):
+        """Test the cursor-paginated tag feed"""
+        posts = [Post.objects.create(user=self.author, caption=f'#Travel day {i}') for i in range(5)]
+        Post.objects.create(user=self.author, caption='#food')
+        posts[2].is_active = False
+        posts[2].save()
+        
+        url = reverse('api-tag-feed', args=['TRAVEL'])
+        response = self.client.get(url, {'page_size': 2})
+        data = response.json()
+        self.assertEqual(data['hashtag'], {'name': 'travel', 'post_count': 4})
+        seen = [item['id'] for item in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            seen.extend(item['id'] for item in data['results'])
+        self.assertEqual(seen, [posts[4].id, posts[3].id, posts[1].id, posts[0].id])
+        
+        self.assertEqual(self.client.get(reverse('api-tag-feed', args=['missing'])).status_code, 404)
+    
+    def test_backfill_command(self):
+        """Test that backfill_hashtags indexes old posts in chunks and repairs counters"""
+        for i in range(5):
+            Post.objects.create(user=self.author, caption=f'#old #n{i}')
+        PostHashtag.objects.all().delete()
+        Hashtag.objects.update(post_count=7)
+        
+        call_command('backfill_hashtags', '--chunk-size', '2', stdout=io.StringIO())
+        counts = self.counts()
+        self.assertEqual(counts['old'], 5)
+        self.assertEqual(PostHashtag.objects.count(), 10)
+        call_command('backfill_hashtags', stdout=io.StringIO())
+        self.assertEqual(self.counts(), counts)
+
+
+class ImageJobTest(TestCase):
+    """Test cases for background image processing"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='author', password='testpass123')
+    
+    def upload(self, size=(1600, 1200), name='photo.jpg'):
+        image_file = io.BytesIO()
+        Image.new('RGB', size, color='blue').save(image_file, format='JPEG')
+        return SimpleUploadedFile(name, image_file.getvalue(), content_type='image/jpeg')
+    
+    def image_size(self, field_file):
+        with Image.open(field_file.path) as img:
+            return img.size
+    
+    def test_upload_is_queued_not_resized(self):
+        """Test that saving a post stores the raw upload and queues a job"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        self.assertTrue(post.processing)
+        self.assertEqual(self.image_size(post.image), (1600, 1200))
+        job = ImageJob.objects.get()
+        self.assertEqual((job.kind, job.object_id, job.status), ('post', post.id, 'pending'))
+        
+        post.caption = 'Edited'
+        post.save()
+        self.assertEqual(ImageJob.objects.count(), 1)  # Unchanged image is not queued again
+    
+    def test_worker_resizes_and_clears_processing(self):
+        """Test that processing a job resizes the file and finishes the post"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        self.assertEqual(images.process_jobs(), 1)
+        post.refresh_from_db()
+        self.assertFalse(post.processing)
+        self.assertEqual(self.image_size(post.image), (800, 600))
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(images.process_jobs(), 0)
+    
+    def test_process_pool(self):
+        """Test that jobs run in worker processes"""
+        posts = [Post.objects.create(user=self.user, image=self.upload(name=f'photo{i}.jpg')) for i in range(3)]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(images.process_jobs(executor=executor), 3)
+        for post in posts:
+            post.refresh_from_db()
+            self.assertFalse(post.processing)
+            self.assertEqual(self.image_size(post.image), (800, 600))
+    
+    def test_profile_image_is_queued(self):
+        """Test that profile pictures go through the same queue"""
+        profile = UserProfile.objects.create(user=self.user, profile_image=self.upload(size=(900, 900)))
+        self.assertEqual(self.image_size(profile.profile_image), (900, 900))
+        images.process_jobs()
+        self.assertEqual(self.image_size(profile.profile_image), (300, 300))
+    
+    def test_failing_job_gives_up(self):
+        """Test that a broken upload is retried, then kept as failed and the post shown as is"""
+        broken = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        post = Post.objects.create(user=self.user, image=broken)
+        for attempt in range(images.MAX_ATTEMPTS):
+            images.process_jobs()
+            post.refresh_from_db()
+            self.assertEqual(post.processing, attempt < images.MAX_ATTEMPTS - 1)
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('UnidentifiedImageError', job.error)
+        self.assertEqual(images.process_jobs(), 0)
+    
+    def test_abandoned_job_is_reclaimed(self):
+        """Test that jobs left running by a dead worker are picked up again"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        images.claim_jobs()
+        self.assertEqual(images.process_jobs(), 0)
+        ImageJob.objects.update(claimed_at=timezone.now() - images.STALE_AFTER - timedelta(seconds=1))
+        self.assertEqual(images.process_jobs(), 1)
+        post.refresh_from_db()
+        self.assertFalse(post.processing)
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=[150, 320, 640, 1080])
+class PostRenditionTest(TestCase):
+    """Test cases for multi-size WebP/JPEG renditions"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+    
+    def create_post(self, size=(1600, 1200), mode='RGB', image_format='JPEG', name='photo.jpg'):
+        image_file = io.BytesIO()
+        Image.new(mode, size, color=(0, 0, 255, 128)[:len(mode)]).save(image_file, format=image_format)
+        upload = SimpleUploadedFile(name, image_file.getvalue())
+        post = Post.objects.create(user=self.user, image=upload, caption='Photo')
+        images.process_jobs()
+        return post
+    
+    def test_renditions_per_width_and_format(self):
+        """Test that every configured width narrower than the upload gets a WebP and a JPEG file"""
+        post = self.create_post()
+        renditions = list(post.renditions.order_by('format', 'width'))
+        self.assertEqual(
+            [(rendition.format, rendition.width) for rendition in renditions],
+            [('jpeg', width) for width in (150, 320, 640, 1080)] + [('webp', width) for width in (150, 320, 640, 1080)]
+        )
+        for rendition in renditions:
+            with Image.open(rendition.file.path) as img:
+                self.assertEqual(img.format, rendition.format.upper())
+                self.assertEqual(img.size, (rendition.width, rendition.height))
+            self.assertEqual(rendition.size, os.path.getsize(rendition.file.path))
+        self.assertEqual(post.renditions.get(format='webp', width=640).height, 480)
+        post.refresh_from_db()
+        with Image.open(post.image.path) as img:
+            self.assertEqual(img.size, (800, 600))  # Original still capped
+    
+    def test_small_upload_is_not_upscaled(self):
+        """Test that an image narrower than every width gets one rendition at its own size"""
+        post = self.create_post(size=(100, 80))
+        self.assertEqual(sorted(post.renditions.values_list('format', 'width')), [('jpeg', 100), ('webp', 100)])
+    
+    def test_transparent_upload(self):
+        """Test that transparent PNGs keep alpha in WebP and get a flattened JPEG"""
+        post = self.create_post(size=(400, 400), mode='RGBA', image_format='PNG', name='logo.png')
+        with Image.open(post.renditions.get(format='webp', width=320).file.path) as img:
+            self.assertEqual(img.mode, 'RGBA')
+        with Image.open(post.renditions.get(format='jpeg', width=320).file.path) as img:
+            self.assertEqual(img.mode, 'RGB')
+    
+    def test_reprocessing_replaces_renditions(self):
+        """Test that a new upload replaces the rows and removes files of dropped widths"""
+        post = self.create_post()
+        dropped = post.renditions.get(format='webp', width=1080).file.path
+        with override_settings(IMAGE_RENDITION_WIDTHS=[150, 320]):
+            images.enqueue('post', post.id)
+            images.process_jobs()
+        self.assertEqual(sorted(set(post.renditions.values_list('width', flat=True))), [150, 320])
+        self.assertFalse(os.path.exists(dropped))
+    
+    def test_api_srcset(self):
+        """Test that the feed API exposes srcsets loaded with one query for the page"""
+        posts = [self.create_post(name=f'photo{i}.jpg') for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api-feed'))
+        self.assertEqual(len([query for query in queries if 'posts_postrendition' in query['sql']]), 1)
+        item = next(item for item in response.json()['results'] if item['id'] == posts[0].id)
+        self.assertIn(f'/media/{images.rendition_dir(posts[0].id, posts[0].image.name)}/150w.webp 150w', item['srcset']['webp'])
+        self.assertTrue(item['srcset']['jpeg'].endswith('1080w.jpg 1080w'))
+        self.assertTrue(item['srcset']['webp'].startswith('http://testserver/'))
+    
+    def test_api_srcset_empty_while_processing(self):
+        """Test that srcset is null until the post has been processed"""
+        image_file = io.BytesIO()
+        Image.new('RGB', (50, 50)).save(image_file, format='JPEG')
+        post = Post.objects.create(user=self.user, image=SimpleUploadedFile('new.jpg', image_file.getvalue()))
+        response = self.client.get(reverse('api-feed'))
+        item = next(item for item in response.json()['results'] if item['id'] == post.id)
+        self.assertIsNone(item['srcset'])
+        self.assertTrue(item['processing'])
+    
+    def test_templates_use_picture(self):
+        """Test that the feed and profile pages offer the renditions through srcset"""
+        post = self.create_post()
+        for url in (reverse('feed'), reverse('profile', kwargs={'username': self.user.username})):
+            response = self.client.get(url)
+            self.assertContains(response, '<source type="image/webp" srcset="')
+            self.assertContains(response, f'/media/{images.rendition_dir(post.id, post.image.name)}/320w.jpg 320w')
+    
+    def test_backfill_queues_posts_without_renditions(self):
+        """Test that process_images --backfill renders images uploaded before renditions existed"""
+        post = self.create_post()
+        post.renditions.all().delete()
+        Post.objects.create(user=self.user, caption='No image')
+        call_command('process_images', '--backfill', '--once', '--workers', '1', stdout=io.StringIO())
+        self.assertEqual(post.renditions.count(), 6)  # Original was capped at 800px, so no 1080w
+        self.assertFalse(ImageJob.objects.exists())
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=[150, 320])
+class MediaBlobTest(TestCase):
+    """Test cases for content-addressed, reference-counted upload storage"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='author', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+    
+    def upload(self, color='blue', name='photo.jpg', size=(600, 400)):
+        image_file = io.BytesIO()
+        Image.new('RGB', size, color=color).save(image_file, format='JPEG')
+        return SimpleUploadedFile(name, image_file.getvalue(), content_type='image/jpeg')
+    
+    def stored_files(self):
+        blob_dir = os.path.join(self.media_root, storage.BLOB_ROOT)
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(blob_dir) for name in names
+            if not root.startswith(os.path.join(blob_dir, 'tmp'))
+        )
+    
+    def collect(self):
+        MediaBlob.objects.update(last_used_at=timezone.now() - storage.GC_GRACE_PERIOD - timedelta(seconds=1))
+        return storage.collect_garbage()
+    
+    def test_identical_uploads_share_one_file(self):
+        """Test that the same bytes uploaded twice, by different users, are stored once"""
+        first = Post.objects.create(user=self.user, image=self.upload(name='a.jpg'))
+        second = Post.objects.create(user=self.other, image=self.upload(name='b.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('blobs/posts/'))
+        self.assertEqual(self.stored_files(), [first.image.name])
+        blob = MediaBlob.objects.get()
+        self.assertEqual((blob.name, blob.ref_count), (first.image.name, 2))
+        self.assertEqual(blob.size, os.path.getsize(first.image.path))
+    
+    def test_same_filename_different_content(self):
+        """Test that different images uploaded under one filename get their own unsuffixed names"""
+        first = Post.objects.create(user=self.user, image=self.upload('blue'))
+        second = Post.objects.create(user=self.user, image=self.upload('red'))
+        self.assertNotEqual(first.image.name, second.image.name)
+        for post in (first, second):
+            self.assertRegex(post.image.name, r'^blobs/posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(MediaBlob.objects.count(), 2)
+    
+    def test_posts_and_profiles_use_separate_blobs(self):
+        """Test that a profile picture never shares a file with a post, which is resized differently"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        profile = UserProfile.objects.create(user=self.user, profile_image=self.upload())
+        self.assertTrue(profile.profile_image.name.startswith('blobs/profiles/'))
+        self.assertNotEqual(post.image.name, profile.profile_image.name)
+    
+    def test_shared_upload_shares_renditions(self):
+        """Test that a repost reuses the renditions written for the first post"""
+        first = Post.objects.create(user=self.user, image=self.upload())
+        images.process_jobs()
+        second = Post.objects.create(user=self.other, image=self.upload())
+        with mock.patch.object(images, 'render_post_image') as render:
+            images.process_jobs()
+        render.assert_not_called()
+        second.refresh_from_db()
+        self.assertFalse(second.processing)
+        self.assertEqual(
+            sorted(second.renditions.values_list('format', 'width', 'file')),
+            sorted(first.renditions.values_list('format', 'width', 'file'))
+        )
+        self.assertEqual(second.renditions.count(), 4)
+    
+    def test_same_file_in_one_batch_renders_once(self):
+        """Test that jobs for one shared upload claimed together render it a single time"""
+        posts = [Post.objects.create(user=self.user, image=self.upload()) for _ in range(3)]
+        with mock.patch.object(images, 'render_post_image', wraps=images.render_post_image) as render:
+            self.assertEqual(images.process_jobs(), 3)
+        self.assertEqual(render.call_count, 1)
+        for post in posts:
+            self.assertEqual(post.renditions.count(), 4)
+    
+    def test_replacing_and_deleting_release_references(self):
+        """Test that counts follow new uploads, deletes and profile changes"""
+        post = Post.objects.create(user=self.user, image=self.upload('blue'))
+        old_name = post.image.name
+        post.image = self.upload('red')
+        post.save()
+        self.assertEqual(MediaBlob.objects.get(name=old_name).ref_count, 0)
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).ref_count, 1)
+        
+        loaded = Post.objects.get(id=post.id)
+        loaded.caption = 'Edited'
+        loaded.save()
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).ref_count, 1)
+        loaded.delete()
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).ref_count, 0)
+        
+        profile = UserProfile.objects.create(user=self.user, profile_image=self.upload())
+        name = profile.profile_image.name
+        self.user.delete()
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+    
+    def test_gc_removes_unreferenced_blobs(self):
+        """Test that gc_media deletes unreferenced files and renditions after the grace period only"""
+        kept = Post.objects.create(user=self.user, image=self.upload('blue'))
+        dropped = Post.objects.create(user=self.user, image=self.upload('red'))
+        images.process_jobs()
+        dropped_name = dropped.image.name
+        rendition_paths = [rendition.file.path for rendition in dropped.renditions.all()]
+        dropped.delete()
+        
+        self.assertEqual(storage.collect_garbage(), (0, 0))  # Still within the grace period
+        output = io.StringIO()
+        MediaBlob.objects.update(last_used_at=timezone.now() - timedelta(hours=2))
+        call_command('gc_media', '--dry-run', stdout=output)
+        self.assertIn('Would remove 1 uploads', output.getvalue())
+        self.assertTrue(MediaBlob.objects.filter(name=dropped_name).exists())
+        
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertFalse(MediaBlob.objects.filter(name=dropped_name).exists())
+        self.assertEqual(self.stored_files(), [kept.image.name])
+        self.assertFalse(any(os.path.exists(path) for path in rendition_paths))
+        self.assertTrue(all(os.path.exists(rendition.file.path) for rendition in kept.renditions.all()))
+    
+    def test_reupload_after_release_revives_blob(self):
+        """Test that uploading released content again keeps the file and counts it"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        name = post.image.name
+        post.delete()
+        again = Post.objects.create(user=self.user, image=self.upload())
+        self.assertEqual(again.image.name, name)
+        self.assertEqual(self.collect(), (0, 0))
+        self.assertTrue(os.path.exists(again.image.path))
+    
+    def test_recount(self):
+        """Test that recount repairs drifted reference counts"""
+        post = Post.objects.create(user=self.user, image=self.upload())
+        Post.objects.create(user=self.other, image=self.upload())
+        UserProfile.objects.create(user=self.user, profile_image=self.upload())
+        MediaBlob.objects.update(ref_count=7)
+        call_command('gc_media', '--recount', '--grace-minutes', '0', stdout=io.StringIO())
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).ref_count, 2)
+        self.assertEqual(MediaBlob.objects.exclude(name=post.image.name).get().ref_count, 1)
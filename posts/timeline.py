@@ -0,0 +1,334 @@
+"""
+Home timeline store (hybrid fan-out).
+
+Every active post is copied into a TimelineEntry row for its author and for
+each of the author's followers when it is created, so reading a feed is a
+single range scan over the ``(owner, -created_at)`` index instead of a
+``user__in=<following>`` subquery over the whole post table.
+
+Authors with more than ``TIMELINE_CELEBRITY_THRESHOLD`` followers are
+promoted to CelebrityAuthor and are no longer fanned out: their posts are
+merged into each reader's feed at read time with a k-way heap merge of
+per-author recent-post lists, so the cost of posting stays flat no matter
+how many followers they have.
+"""
+import heapq
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import UserProfile
+from .models import Post, Follow, TimelineEntry, CelebrityAuthor
+from .pagination import keyset_filter
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def get_backfill_limit():
+    """Number of posts copied into a timeline on follow or rebuild"""
+    return getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 500)
+
+
+def get_celebrity_threshold():
+    """Follower count above which an author is merged at read time"""
+    return getattr(settings, 'TIMELINE_CELEBRITY_THRESHOLD', 10000)
+
+
+def is_celebrity(user_id):
+    return CelebrityAuthor.objects.filter(user_id=user_id).exists()
+
+
+def update_celebrity_status(user_id):
+    """Promote an author to fan-out on read once they cross the follower threshold.
+
+    Reads the follower counter the follow signals keep on UserProfile, a
+    single-row lookup rather than a walk over the follower index; authors
+    without a profile are never promoted. Promotion is one-way; demote by
+    deleting the CelebrityAuthor row and running ``backfill_timelines``.
+    """
+    if is_celebrity(user_id):
+        return True
+    followers = UserProfile.objects.filter(user_id=user_id).values_list('followers_count', flat=True).first() or 0
+    if followers <= get_celebrity_threshold():
+        return False
+    CelebrityAuthor.objects.get_or_create(user_id=user_id)
+    return True
+
+
+def _bulk_insert(entries):
+    """Insert timeline rows, skipping any that already exist"""
+    TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Push a post onto its author's timeline and, for regular authors, every follower's timeline"""
+    batch = [TimelineEntry(owner_id=post.user_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at)]
+    if is_celebrity(post.user_id):
+        _bulk_insert(batch)
+        return
+
+    follower_ids = Follow.objects.filter(
+        following_id=post.user_id
+    ).values_list('follower_id', flat=True)
+
+    for follower_id in follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(TimelineEntry(
+            owner_id=follower_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at
+        ))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            _bulk_insert(batch)
+            batch = []
+    if batch:
+        _bulk_insert(batch)
+
+
+def remove_post(post):
+    """Drop a soft-deleted post from every timeline"""
+    TimelineEntry.objects.filter(post_id=post.id).delete()
+
+
+def add_follow(follower_id, following_id):
+    """Copy the followed user's recent posts into the follower's timeline"""
+    if update_celebrity_status(following_id):
+        # Merged at read time, nothing to copy
+        return
+
+    recent_posts = Post.objects.filter(
+        user_id=following_id,
+        is_active=True
+    ).order_by('-created_at').values_list('id', 'created_at')[:get_backfill_limit()]
+
+    _bulk_insert([
+        TimelineEntry(owner_id=follower_id, post_id=post_id, author_id=following_id, created_at=created_at)
+        for post_id, created_at in recent_posts
+    ])
+
+
+def remove_follow(follower_id, following_id):
+    """Remove an unfollowed user's posts from the follower's timeline"""
+    TimelineEntry.objects.filter(owner_id=follower_id, author_id=following_id).delete()
+
+
+def rebuild_timeline(user):
+    """
+    Recompute a user's timeline from scratch; returns the number of entries written.
+
+    Only the newest ``TIMELINE_BACKFILL_LIMIT`` posts across all followed
+    authors are copied; feeds read anything older from ``followed_backlog``.
+    """
+    following_ids = Follow.objects.filter(
+        follower=user
+    ).exclude(
+        following__celebrity__isnull=False
+    ).values_list('following_id', flat=True)
+    recent_posts = Post.objects.filter(
+        Q(user_id__in=following_ids) | Q(user=user),
+        is_active=True
+    ).order_by('-created_at').values_list('id', 'user_id', 'created_at')[:get_backfill_limit()]
+
+    entries = [
+        TimelineEntry(owner_id=user.id, post_id=post_id, author_id=author_id, created_at=created_at)
+        for post_id, author_id, created_at in recent_posts
+    ]
+    TimelineEntry.objects.filter(owner=user).delete()
+    _bulk_insert(entries)
+    return len(entries)
+
+
+def timeline_posts(user):
+    """Fanned-out posts on a user's home timeline, newest first"""
+    return Post.objects.filter(
+        timeline_entries__owner=user,
+        is_active=True
+    ).order_by('-timeline_entries__created_at', '-id')
+
+
+def followed_backlog(user, include_own=False):
+    """
+    Posts of the regular authors a user follows (and their own with
+    ``include_own``) that are not on their timeline, i.e. older than what was
+    backfilled; newest first. Celebrity posts are left out, HomeTimeline
+    already merges all of them.
+    """
+    authors = Q(user_id__in=Follow.objects.filter(
+        follower=user,
+        following__celebrity__isnull=True
+    ).values('following_id'))
+    if include_own:
+        authors |= Q(user=user)
+    return Post.objects.filter(
+        authors,
+        is_active=True
+    ).exclude(
+        timeline_entries__owner=user
+    ).order_by('-created_at', '-id')
+
+
+class HomeTimeline:
+    """
+    A user's home feed: their materialized timeline merged with the recent
+    posts of every celebrity they follow and, with ``include_backlog``, the
+    followed posts too old to have been copied into the timeline.
+
+    Behaves like a lazy sequence of posts (``count()`` and slicing), so it can
+    be handed straight to ``Paginator``. Every read takes at most one slice's
+    worth of keys from each source after a keyset position, and only the
+    requested slice is loaded as posts.
+    """
+    model = Post  # Resolves cursor values for KeysetPagination
+
+    def __init__(self, user, queryset=None, include_own=True, include_backlog=False):
+        self.user = user
+        self.queryset = queryset if queryset is not None else Post.objects.all()
+        self.include_own = include_own
+        self.include_backlog = include_backlog
+        self._celebrity_ids = None
+
+    def celebrity_ids(self):
+        """Followed authors whose posts are merged at read time"""
+        if self._celebrity_ids is None:
+            self._celebrity_ids = list(Follow.objects.filter(
+                follower=self.user,
+                following__celebrity__isnull=False
+            ).values_list('following_id', flat=True))
+        return self._celebrity_ids
+
+    def _entry_source(self):
+        entries = TimelineEntry.objects.filter(owner=self.user)
+        if not self.include_own:
+            entries = entries.exclude(author=self.user)
+        # Celebrity posts fanned out before promotion are served by the merge
+        return entries.exclude(author_id__in=self.celebrity_ids())
+
+    def _author_source(self, author_id):
+        return Post.objects.filter(user_id=author_id, is_active=True)
+
+    def _range(self, queryset, id_field, limit, position, reverse):
+        """Up to ``limit`` (created_at, id) keys after ``position``, in traversal order"""
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(['-created_at', f'-{id_field}'], position, reverse))
+        ordering = ('created_at', id_field) if reverse else ('-created_at', f'-{id_field}')
+        return list(queryset.order_by(*ordering).values_list('created_at', id_field)[:limit])
+
+    def keys(self, limit, position=None, reverse=False):
+        """
+        The next ``limit`` (created_at, post_id) keys after ``position``,
+        merged across all sources. Newest first, or oldest first when
+        walking backwards.
+        """
+        sources = [self._range(self._entry_source(), 'post_id', limit, position, reverse)]
+        sources.extend(
+            self._range(self._author_source(author_id), 'id', limit, position, reverse)
+            for author_id in self.celebrity_ids()
+        )
+        if self.include_backlog:
+            sources.append(self._range(followed_backlog(self.user, self.include_own), 'id', limit, position, reverse))
+
+        keys = []
+        seen = set()
+        for key in heapq.merge(*sources, reverse=not reverse):
+            if key[1] in seen:
+                continue
+            seen.add(key[1])
+            keys.append(key)
+            if len(keys) == limit:
+                break
+        return keys
+
+    def position_at(self, offset, step):
+        """
+        Key of the post just before ``offset``, found by walking the merged
+        sources ``step`` keys at a time so that no more than ``step`` rows per
+        source are held at once. None for offset 0, False past the end.
+        """
+        position = None
+        while offset > 0:
+            keys = self.keys(min(step, offset), position)
+            if not keys:
+                return False
+            offset -= len(keys)
+            position = keys[-1]
+        return position
+
+    def keyset_slice(self, position, reverse, limit):
+        """Keyset pagination hook, see posts.pagination.KeysetPagination"""
+        return self.hydrate(self.keys(limit, position, reverse))
+
+    def hydrate(self, keys):
+        """Load posts for the given keys, preserving their order"""
+        posts = self.queryset.filter(id__in=[post_id for _, post_id in keys], is_active=True).order_by()
+        by_id = {post.id: post for post in posts}
+        return [by_id[post_id] for _, post_id in keys if post_id in by_id]
+
+    def count(self):
+        total = self._entry_source().count()
+        celebrity_ids = self.celebrity_ids()
+        if celebrity_ids:
+            total += Post.objects.filter(user_id__in=celebrity_ids, is_active=True).count()
+        if self.include_backlog:
+            total += followed_backlog(self.user, self.include_own).count()
+        return total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = index.stop if index.stop is not None else self.count()
+            if stop <= start:
+                return []
+            if not self.celebrity_ids() and not self.include_backlog:
+                # Nothing to merge: read just this slice off the timeline index
+                keys = list(self._entry_source().order_by('-created_at', '-post_id').values_list(
+                    'created_at', 'post_id'
+                )[start:stop])
+            else:
+                # Offset paging (Paginator): reach the slice one slice-sized keyset step at a time
+                position = self.position_at(start, step=stop - start)
+                keys = [] if position is False else self.keys(stop - start, position)
+            return self.hydrate(keys)
+        return self[index:index + 1][0]
+
+
+class ChainedFeed:
+    """
+    Lazy concatenation of post sources, e.g. "followed first, then everyone else".
+
+    Each bucket only needs ``count()`` and slicing (querysets and HomeTimeline
+    both qualify). Slicing reads only the rows that fall inside the requested
+    range, and a later bucket is not read until the earlier ones are exhausted,
+    so memory per page is bounded by the page size rather than the site size.
+    """
+
+    def __init__(self, *buckets):
+        self.buckets = buckets
+        self._counts = {}
+
+    def bucket_count(self, index):
+        if index not in self._counts:
+            self._counts[index] = self.buckets[index].count()
+        return self._counts[index]
+
+    def count(self):
+        return sum(self.bucket_count(index) for index in range(len(self.buckets)))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        results = []
+        for position, bucket in enumerate(self.buckets):
+            if start >= stop:
+                break
+            size = self.bucket_count(position)
+            if start < size:
+                results.extend(bucket[start:min(stop, size)])
+            start = max(start - size, 0)
+            stop -= size
+        return results
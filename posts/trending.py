@@ -0,0 +1,117 @@
+"""
+Trending scores for Explore.
+
+Every active post has a PostScore row holding a time-decayed engagement
+score, so Explore reads a range of the ``score`` index instead of
+aggregating the likes table and sorting the whole site on every request.
+
+Scores are refreshed incrementally whenever a post's like or comment
+counters are written, and by the ``rescore_trending`` command, which
+re-applies the decay to recent posts. The formula is pluggable through
+``TRENDING_SCORE_FUNCTION``: a dotted path to a callable taking
+``(likes, comments, created_at, now)`` and returning a float.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Post, PostScore
+
+RESCORE_BATCH_SIZE = 1000
+COMMENT_WEIGHT = 2
+
+
+def hot_score(likes, comments, created_at, now):
+    """
+    Logarithmic engagement plus a recency bonus (Reddit "hot" style).
+
+    Every 12.5 hours of age is worth a tenfold increase in engagement. The
+    score never depends on ``now``, so scores written at different times
+    stay comparable and old posts never need rescoring.
+    """
+    engagement = likes + COMMENT_WEIGHT * comments
+    return math.log10(engagement + 1) + created_at.timestamp() / 45000
+
+
+def gravity_score(likes, comments, created_at, now):
+    """
+    Engagement divided by age to the power 1.8 (Hacker News style).
+
+    Decays continuously, so it relies on ``rescore_trending`` running
+    regularly to keep the ordering fresh.
+    """
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return (likes + COMMENT_WEIGHT * comments + 1) / (age_hours + 2) ** 1.8
+
+
+def get_score_function():
+    return import_string(getattr(settings, 'TRENDING_SCORE_FUNCTION', 'posts.trending.hot_score'))
+
+
+def get_rescore_window():
+    """Days of posts re-scored by the periodic pass"""
+    return getattr(settings, 'TRENDING_RESCORE_WINDOW_DAYS', 7)
+
+
+def rescore(post_ids, now=None):
+    """Recompute and upsert the scores of the given posts; returns how many were written"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return 0
+    now = now or timezone.now()
+    score = get_score_function()
+    rows = Post.objects.filter(
+        pk__in=post_ids,
+        is_active=True
+    ).values_list('id', 'like_count', 'comment_count', 'created_at')
+    scores = [
+        PostScore(post_id=post_id, score=score(likes, comments, created_at, now), updated_at=now)
+        for post_id, likes, comments, created_at in rows
+    ]
+    PostScore.objects.bulk_create(
+        scores,
+        batch_size=RESCORE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['score', 'updated_at']
+    )
+    return len(scores)
+
+
+def remove(post):
+    """Drop a soft-deleted post from Explore"""
+    PostScore.objects.filter(post_id=post.id).delete()
+
+
+def rescore_recent(since=None, chunk_size=RESCORE_BATCH_SIZE, progress=None):
+    """
+    Periodic pass: rescore every active post created after ``since``
+    (default: the last ``TRENDING_RESCORE_WINDOW_DAYS`` days, None for all
+    posts) in primary-key chunks. Returns the number of posts scored.
+    """
+    now = timezone.now()
+    posts = Post.objects.filter(is_active=True).order_by('id')
+    if since is not None:
+        posts = posts.filter(created_at__gte=since)
+
+    scored = 0
+    last_id = 0
+    while True:
+        chunk = list(posts.filter(id__gt=last_id).values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            break
+        scored += rescore(chunk, now=now)
+        last_id = chunk[-1]
+        if progress:
+            progress(scored)
+    return scored
+
+
+def trending_posts():
+    """Active posts in trending order, read from the PostScore index"""
+    return Post.objects.filter(
+        is_active=True,
+        score__isnull=False
+    ).select_related('score').order_by('-score__score', '-id')
@@ -4,11 +4,17 @@ from django.contrib import messages
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.http import JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Prefetch
+from django.db import transaction
+from django.db.models import Prefetch
 from django.core.exceptions import ValidationError
 from .models import Post, Comment, Follow
 from django.contrib.auth.models import User
+from users.models import UserProfile
 from .forms import PostForm, CommentForm
+from .timeline import HomeTimeline, ChainedFeed, followed_backlog
+from .loaders import viewer_state, attach_recent_comments, attach_renditions
+from .search import search_posts
+from users.typeahead import search_names
 
 def home_view(request):
     return render(request, "home.html")
@@ -19,16 +25,19 @@ def feed_view(request):
     if request.user.is_authenticated:
         following_users = request.user.following.values_list('following', flat=True)
         
-        # Get followed posts with optimized queries
-        followed_posts = Post.objects.filter(
-            is_active=True, 
-            user__in=following_users
-        ).select_related(
+        # Get followed posts from the home timeline (fanned-out and celebrity posts)
+        followed_posts = HomeTimeline(
+            request.user,
+            queryset=Post.objects.select_related(
+                'user', 'user__profile'
+            ),
+            include_own=False
+        )
+        
+        # Older posts of followed authors that were never copied into the timeline
+        older_followed_posts = followed_backlog(request.user).select_related(
             'user', 'user__profile'
-        ).prefetch_related(
-            'likes',
-            Prefetch('comments', queryset=Comment.objects.filter(is_active=True).select_related('user').order_by('created_at'))
-        ).order_by('-created_at')
+        )
         
         # Get other posts with optimized queries
         other_posts = Post.objects.filter(
@@ -37,19 +46,14 @@ def feed_view(request):
             user__in=following_users
         ).select_related(
             'user', 'user__profile'
-        ).prefetch_related(
-            'likes',
-            Prefetch('comments', queryset=Comment.objects.filter(is_active=True).select_related('user').order_by('created_at'))
-        ).order_by('-created_at')
+        ).order_by('-created_at', '-id')
         
-        posts_list = list(followed_posts) + list(other_posts)
+        # Followed posts first, then everyone else; only the requested page is loaded
+        posts_list = ChainedFeed(followed_posts, older_followed_posts, other_posts)
     else:
         # Get all active posts with optimized queries for non-authenticated users
         posts_list = Post.objects.filter(is_active=True).select_related(
             'user', 'user__profile'
-        ).prefetch_related(
-            'likes',
-            Prefetch('comments', queryset=Comment.objects.filter(is_active=True).select_related('user').order_by('created_at'))
         ).order_by('-created_at')
     
     # Pagination
@@ -63,22 +67,24 @@ def feed_view(request):
     except EmptyPage:
         posts = paginator.page(paginator.num_pages)
     
+    # Two latest comments and the image renditions per card, each loaded for the whole page in one query
+    posts.object_list = attach_renditions(attach_recent_comments(list(posts.object_list), limit=2))
+    
     context = {
         'posts': posts,
         'page_obj': posts,  # For pagination template
+        **viewer_state(request.user, posts),
     }
     return render(request, 'posts/feed.html', context)
 
 def profile(request, username):
     """Enhanced profile view with pagination and optimization"""
     user_obj = get_object_or_404(User, username=username)
+    user_profile, _ = UserProfile.objects.get_or_create(user=user_obj)
     
     # Get user's active posts with optimization
     posts_list = user_obj.posts.filter(is_active=True).select_related(
         'user'
-    ).prefetch_related(
-        'likes',
-        'comments'
     ).order_by('-created_at')
     
     # Pagination
@@ -91,6 +97,7 @@ def profile(request, username):
         posts = paginator.page(1)
     except EmptyPage:
         posts = paginator.page(paginator.num_pages)
+    posts.object_list = attach_renditions(list(posts.object_list))
     
     # Check if current user is following this profile
     is_following = False
@@ -105,9 +112,9 @@ def profile(request, username):
         'posts': posts,
         'page_obj': posts,
         'is_following': is_following,
-        'posts_count': user_obj.posts.filter(is_active=True).count(),
-        'followers_count': user_obj.followers.count(),
-        'following_count': user_obj.following.count(),
+        'posts_count': user_profile.posts_count,
+        'followers_count': user_profile.followers_count,
+        'following_count': user_profile.following_count,
     }
     return render(request, "users/profile.html", context)
 
@@ -142,14 +149,9 @@ def like_post(request, post_id):
     try:
         post = get_object_or_404(Post, id=post_id, is_active=True)
         
-        if request.user in post.likes.all():
-            post.likes.remove(request.user)
-            liked = False
-            action = 'unliked'
-        else:
-            post.likes.add(request.user)
-            liked = True
-            action = 'liked'
+        with transaction.atomic():  # Commit the notification event with the like
+            liked = post.toggle_like(request.user)
+        action = 'liked' if liked else 'unliked'
         
         # Return JSON response for AJAX requests
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -218,7 +220,7 @@ def post_detail(request, post_id):
     try:
         post = get_object_or_404(
             Post.objects.select_related('user', 'user__profile').prefetch_related(
-                'likes',
+                'renditions',
                 Prefetch(
                     'comments',
                     queryset=Comment.objects.filter(is_active=True).select_related('user').order_by('created_at')
@@ -236,7 +238,8 @@ def post_detail(request, post_id):
                     comment = comment_form.save(commit=False)
                     comment.post = post
                     comment.user = request.user
-                    comment.save()
+                    with transaction.atomic():  # Commit the notification event with the comment
+                        comment.save()
                     messages.success(request, 'Comment added successfully!')
                     return redirect('post_detail', post_id=post.id)
                 except Exception as e:
@@ -320,7 +323,8 @@ def add_comment(request, post_id):
             comment = form.save(commit=False)
             comment.post = post
             comment.user = request.user
-            comment.save()
+            with transaction.atomic():  # Commit the notification event with the comment
+                comment.save()
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -331,7 +335,7 @@ def add_comment(request, post_id):
                         'user': comment.user.username,
                         'created_at': comment.created_at.strftime('%B %d, %Y at %I:%M %p')
                     },
-                    'comments_count': post.comments.filter(is_active=True).count()
+                    'comments_count': post.comment_count
                 })
             else:
                 messages.success(request, 'Comment added successfully!')
@@ -364,20 +368,13 @@ def search_users(request):
     posts = []
     
     if query:
-        # Search users - convert to list to avoid slicing issues
-        users_queryset = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        ).select_related('profile')
-        users = list(users_queryset[:10])  # Convert to list immediately
+        # Users whose names start with the query, most followed first, then substring matches
+        users = search_names(query, limit=10)
         
-        # Search posts by caption - convert to list to avoid slicing issues
-        posts_queryset = Post.objects.filter(
-            Q(caption__icontains=query),
-            is_active=True
-        ).select_related('user', 'user__profile').order_by('-created_at')
-        posts = list(posts_queryset[:10])  # Convert to list immediately
+        # Search captions and comments, ranked by relevance and recency
+        posts = attach_renditions(
+            search_posts(query, queryset=Post.objects.select_related('user', 'user__profile'), limit=10)
+        )
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         users_data = [{
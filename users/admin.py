@@ -22,17 +22,21 @@ class CustomUserAdmin(BaseUserAdmin):
     
     def posts_count(self, obj):
         """Show user's posts count"""
-        return obj.posts.filter(is_active=True).count()
+        profile = getattr(obj, 'profile', None)
+        return profile.posts_count if profile else 0
     posts_count.short_description = 'Posts'
+    posts_count.admin_order_field = 'profile__posts_count'
     
     def followers_count(self, obj):
         """Show user's followers count"""
-        return obj.followers.count()
+        profile = getattr(obj, 'profile', None)
+        return profile.followers_count if profile else 0
     followers_count.short_description = 'Followers'
+    followers_count.admin_order_field = 'profile__followers_count'
     
     def get_queryset(self, request):
         """Optimize queryset"""
-        return super().get_queryset(request).select_related('profile').prefetch_related('posts', 'followers')
+        return super().get_queryset(request).select_related('profile')
 
 
 # Unregister the original User admin and register our custom one
@@ -90,17 +94,20 @@ class UserProfileAdmin(admin.ModelAdmin):
         """Show user's posts count"""
         return obj.get_posts_count()
     posts_count.short_description = 'Posts'
+    posts_count.admin_order_field = 'posts_count'
     
     def followers_count(self, obj):
         """Show user's followers count"""
         return obj.get_followers_count()
     followers_count.short_description = 'Followers'
+    followers_count.admin_order_field = 'followers_count'
     
     def following_count(self, obj):
         """Show user's following count"""
         return obj.get_following_count()
     following_count.short_description = 'Following'
+    following_count.admin_order_field = 'following_count'
     
     def get_queryset(self, request):
         """Optimize queryset with select_related"""
-        return super().get_queryset(request).select_related('user').prefetch_related('user__posts', 'user__followers', 'user__following')
+        return super().get_queryset(request).select_related('user')
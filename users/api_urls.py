@@ -1,9 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
+from .realtime import event_stream
 from .api_views import (
     UserRegistrationView, CustomTokenObtainPairView, UserProfileViewSet,
-    UserSearchView, SuggestedUsersView, UserStatsView
+    UserSearchView, UserTypeaheadView, SuggestedUsersView, UserStatsView,
+    NotificationListView, NotificationMarkReadView
 )
 
 # Router for ViewSets
@@ -18,12 +20,18 @@ urlpatterns = [
     
     # User search and suggestions
     path('search/', UserSearchView.as_view(), name='user-search'),
+    path('typeahead/', UserTypeaheadView.as_view(), name='user-typeahead'),
     path('suggested/', SuggestedUsersView.as_view(), name='suggested-users'),
     
     # User statistics
     path('stats/', UserStatsView.as_view(), name='user-stats'),
     path('stats/<str:username>/', UserStatsView.as_view(), name='user-stats-detail'),
     
+    # Notifications
+    path('notifications/', NotificationListView.as_view(), name='notification-list'),
+    path('notifications/mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
+    path('notifications/stream/', event_stream, name='notification-stream'),
+    
     # Profile ViewSet URLs
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,25 +1,47 @@
 from rest_framework import generics, viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from .models import UserProfile
-from posts.models import Follow
+from posts.models import Post, Comment, Follow
+from posts.pagination import KeysetPagination
 from .serializers import (
     UserRegistrationSerializer, UserDetailSerializer, UserProfileSerializer,
     UserUpdateSerializer, PasswordChangeSerializer, UserSearchSerializer,
-    FollowersListSerializer
+    FollowersListSerializer, TypeaheadUserSerializer, NotificationSerializer,
+    NotificationMarkReadSerializer
 )
+from .notifications import get_unread_notification_count, mark_notifications_read
+from . import typeahead
 
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(KeysetPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
 
+class SuggestedUsersPagination(KeysetPagination):
+    """A single page of at most ``page_size`` suggestions, without further cursors"""
+    page_size = 20
+
+    def decode_cursor(self, request):
+        return None, False
+
+    def get_next_link(self):
+        return None
+
+
+def _followers_count(user):
+    """Read a user's follower count from their profile counter"""
+    return UserProfile.objects.filter(user=user).values_list('followers_count', flat=True).first() or 0
+
+
 class UserRegistrationView(generics.CreateAPIView):
     """
     API view for user registration
@@ -170,7 +192,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return Response({
                 'message': f'Successfully followed {user_to_follow.username}',
                 'is_following': True,
-                'followers_count': user_to_follow.followers.count()
+                'followers_count': _followers_count(user_to_follow)
             })
         else:
             return Response(
@@ -192,7 +214,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return Response({
                 'message': f'Successfully unfollowed {user_to_unfollow.username}',
                 'is_following': False,
-                'followers_count': user_to_unfollow.followers.count()
+                'followers_count': _followers_count(user_to_unfollow)
             })
         except Follow.DoesNotExist:
             return Response(
@@ -208,6 +230,8 @@ class UserSearchView(generics.ListAPIView):
     serializer_class = UserSearchSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.AllowAny]
+    ordering_fields = ['username', 'date_joined']
+    keyset_ordering = ('username', 'id')
     
     def get_queryset(self):
         query = self.request.GET.get('q', '').strip()
@@ -217,7 +241,25 @@ class UserSearchView(generics.ListAPIView):
         
         return User.objects.filter(
             username__icontains=query
-        ).select_related('profile').order_by('username')
+        ).select_related('profile')
+
+
+class UserTypeaheadView(generics.GenericAPIView):
+    """
+    API view for search-box autocomplete: users whose username, first, last
+    or full name starts with ``q``, most followed first
+    """
+    serializer_class = TypeaheadUserSerializer
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.GET.get('limit', typeahead.DEFAULT_LIMIT)), typeahead.MAX_LIMIT)
+        except ValueError:
+            limit = typeahead.DEFAULT_LIMIT
+        users = typeahead.typeahead(request.GET.get('q', ''), limit=max(limit, 1))
+        serializer = self.get_serializer(users, many=True)
+        return Response({'results': serializer.data})
 
 
 class SuggestedUsersView(generics.ListAPIView):
@@ -226,17 +268,20 @@ class SuggestedUsersView(generics.ListAPIView):
     """
     serializer_class = UserSearchSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = SuggestedUsersPagination
+    keyset_ordering = ('-suggestion_followers', '-id')
     
     def get_queryset(self):
         user = self.request.user
         following_users = user.following.values_list('following', flat=True)
         
         # Get users that current user is not following
-        # Prioritize users with more followers
+        # Prioritize users with more followers; users without a profile yet have none
         suggested_users = User.objects.exclude(
             id__in=list(following_users) + [user.id]
-        ).select_related('profile').order_by('-followers__count')[:20]
+        ).annotate(
+            suggestion_followers=Coalesce('profile__followers_count', 0)
+        ).select_related('profile')
         
         return suggested_users
 
@@ -253,17 +298,62 @@ class UserStatsView(generics.GenericAPIView):
         else:
             user = request.user
         
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        received = user.posts.filter(is_active=True).aggregate(
+            likes=Sum('like_count'),
+            comments=Sum('comment_count')
+        )
+        
         stats = {
-            'posts_count': user.posts.filter(is_active=True).count(),
-            'followers_count': user.followers.count(),
-            'following_count': user.following.count(),
-            'total_likes_received': sum(
-                post.total_likes() for post in user.posts.filter(is_active=True)
-            ),
-            'total_comments_received': sum(
-                post.comments.filter(is_active=True).count() 
-                for post in user.posts.filter(is_active=True)
-            )
+            'posts_count': profile.posts_count,
+            'followers_count': profile.followers_count,
+            'following_count': profile.following_count,
+            'total_likes_received': received['likes'] or 0,
+            'total_comments_received': received['comments'] or 0
         }
         
-        return Response(stats)
\ No newline at end of file
+        return Response(stats)
+
+
+class NotificationListView(generics.ListAPIView):
+    """
+    API view for the current user's notifications, newest first
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    ordering_fields = ['created_at']
+    
+    def get_queryset(self):
+        # Range of the (recipient, -created_at) index; targets are loaded with one query per content type
+        return self.request.user.notifications.select_related(
+            'sender', 'sender__profile'
+        ).prefetch_related(
+            GenericPrefetch('content_object', [Post.objects.all(), Comment.objects.all()])
+        )
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['unread_count'] = get_unread_notification_count(request.user)
+        return response
+
+
+class NotificationMarkReadView(generics.GenericAPIView):
+    """
+    API view for marking notifications read in bulk with a single UPDATE
+    """
+    serializer_class = NotificationMarkReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marked = mark_notifications_read(
+            request.user,
+            ids=serializer.validated_data.get('ids'),
+            up_to=serializer.validated_data.get('up_to')
+        )
+        return Response({
+            'marked_read': marked,
+            'unread_count': get_unread_notification_count(request.user)
+        })
@@ -0,0 +1,9 @@
+from .notifications import get_unread_notification_count
+
+
+def notifications(request):
+    """Unread notification count for the navbar badge, read from the cache only when a template uses it"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'unread_notification_count': lambda: get_unread_notification_count(user)}
@@ -0,0 +1,50 @@
+"""
+Denormalized relationship and notification counters on UserProfile.
+
+``followers_count``, ``following_count`` and ``posts_count`` are adjusted with
+atomic ``F()`` updates whenever a Follow is created or deleted or a post is
+created, moderated or deleted, so profile pages and user lists never need to
+count the follows or posts tables. ``unread_notifications_count`` is kept in
+step by users.notifications. ``reconcile_profile_counters`` repairs any drift
+left by bulk updates that bypass signals.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from posts.models import Post, Follow
+from .models import UserProfile
+from .notifications import Notification
+
+COUNTER_FIELDS = ('followers_count', 'following_count', 'posts_count', 'unread_notifications_count')
+
+
+def adjust(user_ids, field, delta):
+    """Atomically add ``delta`` to a counter column on the given users' profiles"""
+    if not user_ids or not delta:
+        return
+    UserProfile.objects.filter(user_id__in=user_ids).update(**{field: F(field) + delta})
+
+
+def bump_cached(user, field, delta):
+    """Keep an in-memory profile in step with a counter update already applied in the database"""
+    if user is None or not delta or not User.profile.is_cached(user):
+        return
+    profile = getattr(user, 'profile', None)
+    if profile is not None:
+        setattr(profile, field, getattr(profile, field) + delta)
+
+
+def _count(queryset, key):
+    rows = queryset.filter(**{key: OuterRef('user_id')}).order_by().values(key).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def actual_counts():
+    """Expressions computing each counter from the source tables, for use on UserProfile querysets"""
+    return {
+        'followers_count': _count(Follow.objects.all(), 'following_id'),
+        'following_count': _count(Follow.objects.all(), 'follower_id'),
+        'posts_count': _count(Post.objects.filter(is_active=True), 'user_id'),
+        'unread_notifications_count': _count(Notification.objects.filter(is_read=False), 'recipient_id'),
+    }
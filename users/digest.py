@@ -0,0 +1,107 @@
+"""
+Notification email digests.
+
+Notifications are never emailed while the request that caused them is
+running. ``send_notification_digests`` collects every recipient whose
+oldest not yet emailed notification is at least
+``NOTIFICATION_DIGEST_WINDOW_MINUTES`` old and sends each of them a single
+email listing everything that piled up. Each digest is rendered once, and a
+run sends them in batches over one SMTP connection that stays open until
+the run ends instead of a connection per email.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .notifications import Notification
+
+DIGEST_BATCH_SIZE = 100
+MAX_DIGEST_ITEMS = 20
+
+
+def get_digest_window():
+    """How long notifications accumulate before a recipient gets a digest"""
+    return timedelta(minutes=getattr(settings, 'NOTIFICATION_DIGEST_WINDOW_MINUTES', 60))
+
+
+def due_recipients(now=None):
+    """Ids of users with a not yet emailed notification older than the digest window"""
+    cutoff = (now or timezone.now()) - get_digest_window()
+    return list(Notification.objects.filter(
+        emailed_at__isnull=True
+    ).values('recipient_id').annotate(
+        oldest=Min('created_at')
+    ).filter(oldest__lte=cutoff).order_by('recipient_id').values_list('recipient_id', flat=True))
+
+
+def render_digest(user, notifications):
+    """The digest email for ``user`` listing ``notifications`` (newest first)"""
+    total = len(notifications)
+    context = {
+        'user': user,
+        'notifications': notifications[:MAX_DIGEST_ITEMS],
+        'more': max(total - MAX_DIGEST_ITEMS, 0),
+    }
+    message = EmailMultiAlternatives(
+        subject=f"You have {total} new notification{'s' if total != 1 else ''} on Instaclone",
+        body=render_to_string('users/emails/notification_digest.txt', context),
+        to=[user.email]
+    )
+    message.attach_alternative(render_to_string('users/emails/notification_digest.html', context), 'text/html')
+    return message
+
+
+def _send_batch(connection, recipient_ids, started):
+    """
+    Send the digests of one batch of recipients with three queries: their
+    users, their pending notifications and the UPDATE marking those emailed.
+    Notifications that were already read, or whose recipient has no email
+    address or turned emails off, are marked without being sent.
+    """
+    users = User.objects.filter(
+        pk__in=recipient_ids, is_active=True
+    ).exclude(email='').exclude(profile__email_notifications=False).in_bulk()
+    pending = Notification.objects.filter(
+        recipient_id__in=recipient_ids,
+        emailed_at__isnull=True,
+        created_at__lte=started  # Rows regrouped since the run started wait for the next one
+    ).only('id', 'recipient_id', 'message', 'is_read', 'created_at').order_by('recipient_id', '-created_at')
+
+    covered = []
+    unread = defaultdict(list)
+    for notification in pending:
+        covered.append(notification.pk)
+        if not notification.is_read and notification.recipient_id in users:
+            unread[notification.recipient_id].append(notification)
+
+    messages = [render_digest(users[recipient_id], items) for recipient_id, items in unread.items()]
+    sent = connection.send_messages(messages) if messages else 0
+    # Only reached when sending succeeded; a failed batch is retried on the next run
+    Notification.objects.filter(
+        id__in=covered, emailed_at__isnull=True, created_at__lte=started
+    ).update(emailed_at=timezone.now())
+    return sent or 0
+
+
+def send_digests(batch_size=DIGEST_BATCH_SIZE, connection=None):
+    """
+    Email a digest to every recipient that is due; returns the number of
+    emails sent. Uses ``connection`` or a new one from ``EMAIL_BACKEND``,
+    opened once for the whole run.
+    """
+    started = timezone.now()
+    recipient_ids = due_recipients(started)
+    if not recipient_ids:
+        return 0
+    sent = 0
+    connection = connection or get_connection()
+    with connection:
+        for start in range(0, len(recipient_ids), batch_size):
+            sent += _send_batch(connection, recipient_ids[start:start + batch_size], started)
+    return sent
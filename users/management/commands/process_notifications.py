@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.notifications import DRAIN_BATCH_SIZE, drain_events
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued like/comment/follow events as notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DRAIN_BATCH_SIZE, help='Events delivered per transaction')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        delivered = 0
+        try:
+            while True:
+                drained = drain_events(batch_size=batch_size)
+                delivered += drained
+                if drained < batch_size:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {delivered} notification events'))
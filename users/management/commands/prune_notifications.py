@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from users.retention import PRUNE_CHUNK_SIZE, get_max_per_user, get_retention_days, prune_notifications
+
+
+class Command(BaseCommand):
+    help = 'Delete old read notifications and notifications past the per-user cap, in small id-range chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help=f'Delete read notifications older than this (default {get_retention_days()}, 0 to skip)')
+        parser.add_argument('--max-per-user', type=int, default=None,
+                            help=f'Notifications kept per user (default {get_max_per_user()}, 0 to skip)')
+        parser.add_argument('--chunk-size', type=int, default=PRUNE_CHUNK_SIZE, help='Ids covered by each DELETE')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def report(rule, first_id, last_id, deleted, elapsed):
+            if verbosity > 1 or deleted:
+                self.stdout.write(f'{rule}: ids {first_id}-{last_id}, removed {deleted} rows in {elapsed * 1000:.1f} ms')
+
+        removed = prune_notifications(
+            days=options['days'],
+            max_per_user=options['max_per_user'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            progress=report
+        )
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} notifications'))
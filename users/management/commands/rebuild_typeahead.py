@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.typeahead import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the user autocomplete prefix index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users indexed per batch')
+
+    def handle(self, *args, **options):
+        indexed = rebuild(
+            chunk_size=options['chunk_size'],
+            progress=lambda count: self.stdout.write(f'Indexed {count} users...')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} users'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from users.counters import COUNTER_FIELDS, actual_counts
+from users.models import UserProfile
+from users.notifications import forget_unread
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized follower, following, post and unread notification counts on user profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Profiles checked per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted profiles without fixing them')
+
+    def handle(self, *args, **options):
+        expressions = actual_counts()
+        checked_annotations = {f'actual_{field}': expression for field, expression in expressions.items()}
+        drifted_filter = Q()
+        for field in COUNTER_FIELDS:
+            drifted_filter |= ~Q(**{field: F(f'actual_{field}')})
+
+        checked = 0
+        repaired = 0
+        last_id = 0
+        while True:
+            chunk = list(UserProfile.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not chunk:
+                break
+            drifted = list(UserProfile.objects.filter(
+                pk__gte=chunk[0], pk__lte=chunk[-1]
+            ).annotate(**checked_annotations).filter(drifted_filter).values_list('pk', flat=True))
+            if drifted and not options['dry_run']:
+                # Recount inside the UPDATE so concurrent follows are not overwritten with stale values
+                UserProfile.objects.filter(pk__in=drifted).update(**expressions)
+                forget_unread(UserProfile.objects.filter(pk__in=drifted).values_list('user_id', flat=True))
+            checked += len(chunk)
+            repaired += len(drifted)
+            last_id = chunk[-1]
+            self.stdout.write(f'Checked {checked} profiles...')
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {repaired} drifted profiles out of {checked}'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.digest import DIGEST_BATCH_SIZE, send_digests
+
+
+class Command(BaseCommand):
+    help = 'Email each recipient one digest of the notifications they have not been emailed about yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DIGEST_BATCH_SIZE, help='Recipients handled per batch')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds to wait between runs')
+        parser.add_argument('--once', action='store_true', help='Send the digests that are due and exit instead of polling')
+
+    def handle(self, *args, **options):
+        sent = 0
+        try:
+            while True:
+                sent += send_digests(batch_size=options['batch_size'])
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} notification digests'))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+
+    def count(queryset, key):
+        rows = queryset.filter(**{key: OuterRef('user_id')}).order_by().values(key).annotate(n=Count('*')).values('n')
+        return Coalesce(Subquery(rows), Value(0))
+
+    UserProfile.objects.update(
+        followers_count=count(Follow.objects.all(), 'following_id'),
+        following_count=count(Follow.objects.all(), 'follower_id'),
+        posts_count=count(Post.objects.filter(is_active=True), 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_like_count_comment_count'),
+        ('users', '0003_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_keys(apps, schema_editor):
+    from users.typeahead import keys_for
+
+    User = apps.get_model('auth', 'User')
+    UserSearchKey = apps.get_model('users', 'UserSearchKey')
+    users = User.objects.annotate(followers_total=Count('followers')).values_list(
+        'id', 'username', 'first_name', 'last_name', 'followers_total'
+    )
+    UserSearchKey.objects.bulk_create(
+        (UserSearchKey(key=key, user_id=user_id, followers_count=followers)
+         for user_id, username, first_name, last_name, followers in users.iterator(chunk_size=1000)
+         for key in keys_for(username, first_name, last_name)),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_userprofile_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=150)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', '-followers_count', 'user'], name='users_users_key_3b8555_idx')],
+                'unique_together': {('key', 'user')},
+            },
+        ),
+        migrations.RunPython(populate_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_unread_counts(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Notification = apps.get_model('users', 'Notification')
+    rows = Notification.objects.filter(
+        recipient_id=OuterRef('user_id'), is_read=False
+    ).order_by().values('recipient_id').annotate(n=Count('*')).values('n')
+    UserProfile.objects.update(unread_notifications_count=Coalesce(Subquery(rows), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_notification_grouping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def rebuild_keys(apps, schema_editor):
+    from users.typeahead import keys_for
+
+    User = apps.get_model('auth', 'User')
+    UserSearchKey = apps.get_model('users', 'UserSearchKey')
+    UserSearchKey.objects.all().delete()
+    users = User.objects.annotate(followers_total=Count('followers')).values_list(
+        'id', 'username', 'first_name', 'last_name', 'followers_total'
+    )
+    UserSearchKey.objects.bulk_create(
+        (UserSearchKey(key=key, user_id=user_id, followers_count=followers)
+         for user_id, username, first_name, last_name, followers in users.iterator(chunk_size=1000)
+         for key in keys_for(username, first_name, last_name)),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_notification_emailed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_keys, migrations.RunPython.noop),
+    ]
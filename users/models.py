@@ -1,8 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
-from PIL import Image
+from contextlib import nullcontext
 import os
 
 def validate_profile_image_size(image):
@@ -38,6 +38,10 @@ class UserProfile(models.Model):
     website = models.URLField(blank=True, help_text='Your website URL (optional)')
     is_private = models.BooleanField(default=False, help_text='Make your account private')
     email_notifications = models.BooleanField(default=True, help_text='Receive email notifications')
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
+    unread_notifications_count = models.PositiveIntegerField(default=0, editable=False)  # Cached in users.notifications
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -47,29 +51,49 @@ class UserProfile(models.Model):
             models.Index(fields=['created_at']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored image so a replaced upload can be released on save"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get('profile_image')
+        return instance
+
     def save(self, *args, **kwargs):
-        """Override save to resize profile images"""
-        super().save(*args, **kwargs)
-        
-        if self.profile_image and self.profile_image.name != 'profiles/default-profile.png':
-            # Resize image if too large
-            img = Image.open(self.profile_image.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size, Image.LANCZOS)
-                img.save(self.profile_image.path)
+        """Override save to count image references and queue newly uploaded profile images for resizing"""
+        from posts import images, storage
+        update_fields = kwargs.get('update_fields')
+        image_uploaded = bool(self.profile_image) and not self.profile_image._committed
+        image_saved = update_fields is None or 'profile_image' in update_fields
+        loaded_image = getattr(self, '_loaded_image', None)
+        image_changed = image_saved and (
+            image_uploaded or (self.profile_image.name or None) != (loaded_image or None)
+        )
+        if self._state.adding:
+            # Profiles are created lazily, so start the counters from what already exists
+            self.followers_count = self.user.followers.count()
+            self.following_count = self.user.following.count()
+            self.posts_count = self.user.posts.filter(is_active=True).count()
+            self.unread_notifications_count = self.user.notifications.filter(is_read=False).count()
+        with transaction.atomic() if image_changed else nullcontext():
+            super().save(*args, **kwargs)
+            if image_changed:
+                storage.replace_reference(loaded_image, self.profile_image.name)
+            if image_uploaded:
+                images.enqueue('profile', self.pk)
+        if image_saved:
+            self._loaded_image = self.profile_image.name
 
     def get_followers_count(self):
         """Get the number of followers"""
-        return self.user.followers.count()
+        return self.followers_count
 
     def get_following_count(self):
         """Get the number of users being followed"""
-        return self.user.following.count()
+        return self.following_count
 
     def get_posts_count(self):
-        """Get the number of posts"""
-        return self.user.posts.filter(is_active=True).count()
+        """Get the number of active posts"""
+        return self.posts_count
 
     def is_following(self, user):
         """Check if this user is following another user"""
@@ -83,6 +107,25 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s profile"
 
 
+class UserSearchKey(models.Model):
+    """
+    Typeahead index row. ``key`` is a normalized prefix of one of the user's
+    names, up to the whole name; see users/typeahead.py.
+    """
+    key = models.CharField(max_length=150)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_keys')
+    followers_count = models.PositiveIntegerField(default=0)  # Copy of profile.followers_count for ranking
+
+    class Meta:
+        unique_together = ('key', 'user')
+        indexes = [
+            models.Index(fields=['key', '-followers_count', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> {self.user_id}"
+
+
 # Import the notification models
-from .notifications import Notification
+from .notifications import Notification, NotificationEvent
 
@@ -1,8 +1,19 @@
-from django.db import models
+import re
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
+from .realtime import publish_notification
+
 
 class Notification(models.Model):
     """Model for user notifications"""
@@ -24,14 +35,24 @@ class Notification(models.Model):
     object_id = models.PositiveIntegerField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
     
+    # Grouped likes/follows: how many people acted and the latest few of them, newest first
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)
+    
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)  # Set once covered by a digest, see users.digest
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # Latest activity for grouped rows
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['recipient', '-created_at']),
             models.Index(fields=['recipient', 'is_read']),
+            models.Index(
+                fields=['recipient', 'created_at'],
+                condition=Q(emailed_at__isnull=True),
+                name='notification_unemailed_idx'
+            ),
         ]
     
     def __str__(self):
@@ -41,7 +62,66 @@ class Notification(models.Model):
         """Mark notification as read"""
         if not self.is_read:
             self.is_read = True
-            self.save(update_fields=['is_read'])
+            # Conditional UPDATE so a concurrent read is only subtracted once
+            if Notification.objects.filter(pk=self.pk, is_read=False).update(is_read=True):
+                adjust_unread({self.recipient_id: -1})
+
+
+class NotificationEvent(models.Model):
+    """
+    Outbox row for a like, comment or follow, written in the same
+    transaction as the action itself and turned into a Notification later
+    by ``process_notifications`` (see ``drain_events``).
+    """
+    
+    EVENT_TYPES = [
+        ('like', 'Like'),
+        ('comment', 'Comment'),
+        ('follow', 'Follow'),
+    ]
+    
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField(null=True, blank=True)  # Liked post or new comment
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.event_type} {self.actor_id} -> {self.recipient_id}"
+
+
+# Notification text and content object model for each event type
+EVENT_VERBS = {
+    'like': 'liked your post',
+    'comment': 'commented on your post',
+    'follow': 'started following you',
+}
+EVENT_TARGETS = {
+    'like': 'posts.Post',
+    'comment': 'posts.Comment',
+}
+# Types folded into one row per recipient and object ("alice and 41 others liked your post")
+GROUPED_TYPES = {'like', 'follow'}
+MAX_RECENT_ACTORS = 3
+DRAIN_BATCH_SIZE = 500
+
+
+def get_group_window():
+    """How long a grouped notification keeps absorbing new actors"""
+    return timedelta(hours=getattr(settings, 'NOTIFICATION_GROUP_WINDOW_HOURS', 24))
+
+
+def grouped_message(event_type, actor, actor_count):
+    """'alice liked your post', 'alice and 1 other ...', 'alice and 41 others ...'"""
+    others = actor_count - 1
+    if others:
+        actor = f"{actor} and {others} other{'s' if others > 1 else ''}"
+    return f"{actor} {EVENT_VERBS[event_type]}"
+
+UNREAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.+-]+)')
+MAX_MENTIONS = 50
 
 
 # Utility functions for creating notifications
@@ -60,55 +140,313 @@ def create_notification(recipient, sender, notification_type, message, content_o
             message=message,
             content_object=content_object
         )
-        
-        # Optionally send email notification here
-        # send_email_notification(notification)
+        adjust_unread({recipient.pk: 1})
+        # Emailed later in a digest, see users.digest
         
         return notification
     
     return None
 
 
-def create_like_notification(post, user):
-    """Create notification for post like"""
-    message = f"{user.username} liked your post"
-    return create_notification(
-        recipient=post.user,
-        sender=user,
-        notification_type='like',
-        message=message,
-        content_object=post
+def enqueue_event(event_type, actor_id, recipient_id, object_id=None):
+    """
+    Queue a notification with a single INSERT; self-actions are dropped.
+
+    Call it inside the transaction that performs the action so the event
+    is committed or rolled back together with it. Nothing else runs on the
+    request path: ``drain_events`` checks the recipient's settings and
+    publishes to their live stream once the notification is written.
+    """
+    if actor_id == recipient_id:
+        return None
+    return NotificationEvent.objects.create(
+        event_type=event_type,
+        actor_id=actor_id,
+        recipient_id=recipient_id,
+        object_id=object_id
     )
 
 
+def create_like_notification(post, user):
+    """Queue notification for post like"""
+    return enqueue_event('like', user.pk, post.user_id, post.pk)
+
+
 def create_comment_notification(comment, user):
-    """Create notification for comment"""
-    message = f"{user.username} commented on your post"
-    return create_notification(
-        recipient=comment.post.user,
-        sender=user,
-        notification_type='comment',
-        message=message,
-        content_object=comment
-    )
+    """Queue notification for comment"""
+    return enqueue_event('comment', user.pk, comment.post.user_id, comment.pk)
 
 
 def create_follow_notification(followed_user, follower):
-    """Create notification for follow"""
-    message = f"{follower.username} started following you"
-    return create_notification(
-        recipient=followed_user,
-        sender=follower,
-        notification_type='follow',
-        message=message
-    )
+    """Queue notification for follow"""
+    return enqueue_event('follow', follower.pk, followed_user.pk)
+
+
+def _group_key(notification_type, recipient_id, object_id):
+    return (notification_type, recipient_id, object_id)
+
+
+def _open_groups(events):
+    """Grouped notifications still inside the window that ``events`` can fold into, by group key"""
+    keys = {
+        _group_key(event.event_type, event.recipient_id, event.object_id)
+        for event in events if event.event_type in GROUPED_TYPES
+    }
+    if not keys:
+        return {}
+    object_ids = {object_id for _, _, object_id in keys if object_id is not None}
+    candidates = Notification.objects.filter(
+        Q(object_id__in=object_ids) | Q(object_id__isnull=True),
+        notification_type__in={notification_type for notification_type, _, _ in keys},
+        recipient_id__in={recipient_id for _, recipient_id, _ in keys},
+        created_at__gte=timezone.now() - get_group_window()
+    ).order_by('created_at')
+    groups = {}
+    for notification in candidates:
+        key = _group_key(notification.notification_type, notification.recipient_id, notification.object_id)
+        if key in keys:
+            groups[key] = notification  # The latest group wins
+    return groups
+
+
+def _fold(group, actor_id, username):
+    """Add an actor to a grouped notification; repeat actors are not counted twice"""
+    recent = list(group.recent_actor_ids) or ([group.sender_id] if group.pk else [])
+    if actor_id in recent:
+        recent.remove(actor_id)
+    elif group.pk or recent:
+        group.actor_count += 1
+    group.recent_actor_ids = [actor_id] + recent[:MAX_RECENT_ACTORS - 1]
+    group.sender_id = actor_id
+    group.message = grouped_message(group.notification_type, username, group.actor_count)
+    group.is_read = False
+
+
+def drain_events(batch_size=DRAIN_BATCH_SIZE):
+    """
+    Turn the oldest ``batch_size`` queued events into notifications.
+
+    Likes of the same post and follows of the same user are folded into
+    one grouped row per recipient while it is younger than
+    ``NOTIFICATION_GROUP_WINDOW_HOURS``; the row is updated in place with
+    the new actor count, the latest actors and a fresh timestamp.
+
+    Each batch costs a fixed number of queries: read the events, look up
+    actor names and muted recipients, check the liked posts and comments
+    still exist, find open groups, then one ``bulk_create``, one
+    ``bulk_update`` and one DELETE. Events whose target was removed in the
+    meantime are dropped. Delivered events are pushed to the recipients'
+    live streams once the batch commits. Concurrent workers skip each
+    other's rows where the database supports SKIP LOCKED. Returns the number
+    of events consumed.
+    """
+    with transaction.atomic():
+        events = NotificationEvent.objects.order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            events = events.select_for_update(skip_locked=True)
+        events = list(events[:batch_size])
+        if not events:
+            return 0
+        
+        actor_ids = {event.actor_id for event in events}
+        recipient_ids = {event.recipient_id for event in events}
+        usernames = dict(User.objects.filter(id__in=actor_ids).values_list('id', 'username'))
+        muted = set(User.objects.filter(
+            id__in=recipient_ids,
+            profile__email_notifications=False
+        ).values_list('id', flat=True))
+        
+        targets = {}
+        for event_type, label in EVENT_TARGETS.items():
+            model = apps.get_model(label)
+            object_ids = {event.object_id for event in events if event.event_type == event_type}
+            live = set()
+            if object_ids:
+                live = set(model.objects.filter(id__in=object_ids, is_active=True).values_list('id', flat=True))
+            targets[event_type] = (ContentType.objects.get_for_model(model), live)
+        
+        groups = _open_groups(events)
+        created = []
+        updated = {}
+        delivered = []
+        unread = defaultdict(int)
+        for event in events:
+            if event.recipient_id in muted or event.actor_id not in usernames:
+                continue
+            content_type = None
+            if event.event_type in targets:
+                content_type, live = targets[event.event_type]
+                if event.object_id not in live:
+                    continue
+            
+            key = _group_key(event.event_type, event.recipient_id, event.object_id)
+            notification = groups.get(key)
+            if notification is None:
+                notification = Notification(
+                    recipient_id=event.recipient_id,
+                    notification_type=event.event_type,
+                    content_type=content_type,
+                    object_id=event.object_id if content_type else None
+                )
+                created.append(notification)
+                unread[event.recipient_id] += 1
+                if event.event_type in GROUPED_TYPES:
+                    groups[key] = notification
+            elif notification.pk:
+                if notification.is_read:
+                    unread[event.recipient_id] += 1  # Reopened by new activity
+                updated[notification.pk] = notification
+            _fold(notification, event.actor_id, usernames[event.actor_id])
+            delivered.append(event)
+        
+        now = timezone.now()
+        for notification in updated.values():
+            notification.created_at = now
+            notification.emailed_at = None  # New activity goes into the next digest
+        Notification.objects.bulk_create(created)
+        Notification.objects.bulk_update(
+            updated.values(),
+            ['sender', 'message', 'actor_count', 'recent_actor_ids', 'is_read', 'created_at', 'emailed_at']
+        )
+        NotificationEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        adjust_unread(unread)
+        # Only events that passed the checks above reach the live streams, after the batch commits
+        for event in delivered:
+            publish_notification(event.recipient_id, event.event_type, event.actor_id, event.object_id)
+    return len(events)
+
+
+def extract_mentions(text, limit=MAX_MENTIONS):
+    """Distinct ``@username`` mentions in ``text``, in order of first use"""
+    usernames = []
+    for match in MENTION_RE.finditer(text or ''):
+        username = match.group(1).rstrip('.')[:150]  # A trailing dot ends the sentence
+        if username and username not in usernames:
+            usernames.append(username)
+            if len(usernames) == limit:
+                break
+    return usernames
+
+
+def create_mention_notifications(sender, text, content_object):
+    """
+    Notify every user mentioned in ``text`` at most once per object.
+
+    All mentioned usernames are resolved with one ``username__in`` query,
+    which also drops the sender, users who turned notifications off and
+    users already notified about ``content_object`` (so edits only reach
+    newly mentioned people). The notifications are written with one
+    ``bulk_create``, so the cost does not grow with the number of mentions.
+    """
+    usernames = extract_mentions(text)
+    if not usernames:
+        return []
+    
+    content_type = ContentType.objects.get_for_model(content_object)
+    already_notified = Notification.objects.filter(
+        notification_type='mention',
+        content_type=content_type,
+        object_id=content_object.pk
+    ).values('recipient_id')
+    recipient_ids = User.objects.filter(
+        username__in=usernames
+    ).exclude(
+        profile__email_notifications=False  # Users without a profile get the default
+    ).exclude(pk=sender.pk).exclude(pk__in=already_notified).values_list('pk', flat=True)
+    
+    message = f"{sender.username} mentioned you in a {content_object._meta.verbose_name}"
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            recipient_id=recipient_id,
+            sender=sender,
+            notification_type='mention',
+            message=message,
+            content_type=content_type,
+            object_id=content_object.pk
+        )
+        for recipient_id in recipient_ids
+    ])
+    adjust_unread({notification.recipient_id: 1 for notification in notifications})
+    for notification in notifications:
+        publish_notification(notification.recipient_id, 'mention', sender.pk, content_object.pk)
+    return notifications
+
+
+def unread_cache_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def adjust_unread(deltas):
+    """
+    Apply per-user unread count changes: one UPDATE of the profile column per
+    distinct delta, then the same change to any cached value once the
+    transaction commits. Uncached users are loaded from the column on read.
+    """
+    UserProfile = apps.get_model('users', 'UserProfile')
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        UserProfile.objects.filter(user_id__in=user_ids).update(
+            unread_notifications_count=F('unread_notifications_count') + delta
+        )
+    
+    def update_cache():
+        for delta, user_ids in by_delta.items():
+            for user_id in user_ids:
+                try:
+                    cache.incr(unread_cache_key(user_id), delta)
+                except ValueError:
+                    pass  # Not cached
+    
+    if by_delta:
+        transaction.on_commit(update_cache)
+
+
+def forget_unread(user_ids):
+    """Drop cached unread counts, e.g. after the profile column was repaired"""
+    cache.delete_many([unread_cache_key(user_id) for user_id in user_ids])
 
 
 def get_unread_notification_count(user):
-    """Get count of unread notifications for user"""
-    return user.notifications.filter(is_read=False).count()
+    """
+    Get count of unread notifications for user, for the bell badge.
+
+    Served from the cache, falling back to the profile's counter column; the
+    notifications table is only counted for users without a profile.
+    """
+    key = unread_cache_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        UserProfile = apps.get_model('users', 'UserProfile')
+        count = UserProfile.objects.filter(user=user).values_list('unread_notifications_count', flat=True).first()
+        if count is None:
+            count = user.notifications.filter(is_read=False).count()
+        cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    return max(count, 0)
+
+
+def mark_notifications_read(user, ids=None, up_to=None):
+    """
+    Mark a user's notifications read with a single UPDATE: the given
+    ``ids``, or the notification ``up_to`` and everything older than it in
+    list order (newer arrivals stay unread). Returns the number marked.
+    """
+    notifications = user.notifications.filter(is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(pk__in=ids)
+    if up_to is not None:
+        marker = Subquery(user.notifications.filter(pk=up_to).values('created_at')[:1])
+        notifications = notifications.filter(Q(created_at__lt=marker) | Q(created_at=marker, pk__lte=up_to))
+    marked = notifications.update(is_read=True)
+    adjust_unread({user.pk: -marked})
+    return marked
 
 
 def mark_all_notifications_read(user):
     """Mark all notifications as read for user"""
-    user.notifications.filter(is_read=False).update(is_read=True)
\ No newline at end of file
+    UserProfile = apps.get_model('users', 'UserProfile')
+    user.notifications.filter(is_read=False).update(is_read=True)
+    UserProfile.objects.filter(user=user).update(unread_notifications_count=0)
+    transaction.on_commit(lambda: cache.set(unread_cache_key(user.pk), 0, UNREAD_CACHE_TIMEOUT))
@@ -0,0 +1,196 @@
+"""
+Live updates over Server-Sent Events.
+
+``/api/users/notifications/stream/`` is an async view: under an ASGI server
+every connected client is a coroutine parked on an ``asyncio.Queue``, so
+idle connections cost a little memory and a heartbeat every
+``SSE_HEARTBEAT_SECONDS`` rather than a worker thread each.
+
+Events go through a broker with two methods, ``publish(channel, message)``
+(callable from any thread) and ``subscribe(channels)``. Channels are
+``user:<id>`` for a user's notifications and ``post:<id>`` for a post's like
+count. The default InProcessBroker only reaches clients connected to the
+same process; ``REALTIME_BROKER`` takes the dotted path of another
+implementation of the same interface for multi-process deployments.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponseForbidden, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+MAX_QUEUED_MESSAGES = 100  # Per connection; the oldest are dropped for clients that stop reading
+MAX_POST_CHANNELS = 100
+
+
+def get_heartbeat_seconds():
+    """Idle time after which a comment line is sent to keep proxies from closing the stream"""
+    return getattr(settings, 'SSE_HEARTBEAT_SECONDS', 20)
+
+
+class Subscription:
+    """One client's queue; fed from any thread, read on the client's event loop"""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=MAX_QUEUED_MESSAGES)
+
+    def __enter__(self):
+        self.broker.add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.broker.discard(self)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    async def get(self, timeout):
+        """The next message, or None after ``timeout`` seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+    """Pub/sub between threads and event loops of a single process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def add(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+
+    def discard(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def subscribe(self, channels):
+        """Context manager yielding a Subscription; must be entered on the client's event loop"""
+        return Subscription(self, set(channels))
+
+    def publish(self, channel, message):
+        """Send ``message`` to every subscriber of ``channel``; returns the number reached"""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def connection_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscriptions.values() for subscription in subscribers})
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker named by ``REALTIME_BROKER``"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'REALTIME_BROKER', 'users.realtime.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def publish(channel, event, data):
+    """Publish once the current transaction commits, so clients never see rolled back changes"""
+    transaction.on_commit(lambda: get_broker().publish(channel, {'event': event, 'data': data}))
+
+
+def publish_notification(recipient_id, event_type, actor_id, object_id=None):
+    publish(user_channel(recipient_id), 'notification', {
+        'type': event_type, 'actor_id': actor_id, 'object_id': object_id,
+    })
+
+
+def publish_like_count(post):
+    publish(post_channel(post.pk), 'like_count', {'post_id': post.pk, 'total_likes': post.total_likes()})
+
+
+def format_event(message):
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+async def _authenticate(request):
+    """Session user, or the user of a ``Bearer`` JWT for API clients"""
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def _post_ids(request):
+    ids = []
+    for value in request.GET.get('posts', '').split(','):
+        if value.strip().isdigit():
+            ids.append(int(value))
+    return ids[:MAX_POST_CHANNELS]
+
+
+async def event_stream(request):
+    """
+    Stream ``notification`` events for the current user and ``like_count``
+    events for the posts listed in ``?posts=1,2,3``.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return HttpResponseForbidden('Authentication required')
+
+    channels = [user_channel(user.pk)] + [post_channel(post_id) for post_id in _post_ids(request)]
+    broker = get_broker()
+    heartbeat = get_heartbeat_seconds()
+
+    async def events():
+        yield 'retry: 5000\n\n'
+        with broker.subscribe(channels) as subscription:
+            while True:
+                message = await subscription.get(timeout=heartbeat)
+                yield format_event(message) if message is not None else ': keep-alive\n\n'
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
@@ -0,0 +1,120 @@
+"""
+Notification retention.
+
+Two rules keep the notifications table (and its per-recipient indexes) from
+growing forever:
+
+* read notifications older than ``NOTIFICATION_RETENTION_DAYS`` are deleted;
+* each user keeps at most their ``NOTIFICATION_MAX_PER_USER`` newest
+  notifications, read or not.
+
+``prune_notifications`` enforces both with short DELETE statements over
+bounded primary-key ranges, each in its own transaction, so no statement
+touches more than ``chunk_size`` ids and locks are released between chunks.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from posts.pagination import keyset_filter
+
+from .notifications import Notification, adjust_unread
+
+PRUNE_CHUNK_SIZE = 5000
+
+
+def get_retention_days():
+    """Age in days after which read notifications are deleted"""
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+
+
+def get_max_per_user():
+    """Number of newest notifications kept per user"""
+    return getattr(settings, 'NOTIFICATION_MAX_PER_USER', 1000)
+
+
+def _delete_range(queryset, low, high, may_be_unread=True):
+    """Delete the rows of ``queryset`` with ids in [low, high]; returns (deleted, seconds)"""
+    started = time.monotonic()
+    with transaction.atomic():
+        chunk = queryset.filter(id__gte=low, id__lte=high)
+        unread = {}
+        if may_be_unread:
+            unread = dict(chunk.filter(is_read=False).values('recipient_id').annotate(
+                n=Count('id')
+            ).order_by().values_list('recipient_id', 'n'))
+        deleted, _ = chunk.delete()
+        adjust_unread({recipient_id: -n for recipient_id, n in unread.items()})
+    return deleted, time.monotonic() - started
+
+
+def prune_expired(days, chunk_size=PRUNE_CHUNK_SIZE, pause=0, progress=None):
+    """
+    Delete read notifications older than ``days``, walking the id range that
+    can hold them in steps of ``chunk_size``. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    # Newer ids can only hold expired rows if they predate the cutoff; stop at the last one that does
+    bounds = Notification.objects.filter(created_at__lt=cutoff).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+    total = 0
+    for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        high = min(low + chunk_size - 1, bounds['high'])
+        deleted, elapsed = _delete_range(expired, low, high, may_be_unread=False)
+        total += deleted
+        if progress:
+            progress('expired', low, high, deleted, elapsed)
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def prune_over_cap(max_per_user, chunk_size=PRUNE_CHUNK_SIZE, pause=0, progress=None):
+    """
+    Delete everything past each user's ``max_per_user`` newest notifications,
+    ``chunk_size`` ids at a time, keeping unread counters in step. Returns
+    the number deleted.
+    """
+    over_cap = list(Notification.objects.values('recipient_id').annotate(
+        total=Count('id')
+    ).filter(total__gt=max_per_user).order_by().values_list('recipient_id', flat=True))
+    total = 0
+    for recipient_id in over_cap:
+        ordering = ['-created_at', '-id']
+        oldest_kept = Notification.objects.filter(
+            recipient_id=recipient_id
+        ).order_by(*ordering).values_list('created_at', 'id')[max_per_user - 1]
+        surplus = Notification.objects.filter(keyset_filter(ordering, oldest_kept), recipient_id=recipient_id)
+        while True:
+            ids = list(surplus.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            deleted, elapsed = _delete_range(surplus, ids[0], ids[-1])
+            total += deleted
+            if progress:
+                progress('over cap', ids[0], ids[-1], deleted, elapsed)
+            if pause:
+                time.sleep(pause)
+    return total
+
+
+def prune_notifications(days=None, max_per_user=None, chunk_size=PRUNE_CHUNK_SIZE, pause=0, progress=None):
+    """
+    Apply both retention rules, defaulting to the configured limits; a limit
+    of 0 turns its rule off. ``progress(rule, first_id, last_id, deleted,
+    seconds)`` is called after every chunk. Returns the number deleted.
+    """
+    days = get_retention_days() if days is None else days
+    max_per_user = get_max_per_user() if max_per_user is None else max_per_user
+    total = 0
+    if days:
+        total += prune_expired(days, chunk_size, pause, progress)
+    if max_per_user:
+        total += prune_over_cap(max_per_user, chunk_size, pause, progress)
+    return total
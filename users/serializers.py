@@ -2,8 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from .models import UserProfile
-from posts.models import Follow
+from .models import UserProfile, Notification
+from posts.models import Post, Comment, Follow
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -32,9 +32,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for UserProfile model"""
     profile_image = serializers.SerializerMethodField()
-    posts_count = serializers.SerializerMethodField()
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+    posts_count = serializers.IntegerField(read_only=True)
+    followers_count = serializers.IntegerField(read_only=True)
+    following_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = UserProfile
@@ -51,15 +51,6 @@ class UserProfileSerializer(serializers.ModelSerializer):
             if request:
                 return request.build_absolute_uri(obj.profile_image.url)
         return None
-    
-    def get_posts_count(self, obj):
-        return obj.get_posts_count()
-    
-    def get_followers_count(self, obj):
-        return obj.get_followers_count()
-    
-    def get_following_count(self, obj):
-        return obj.get_following_count()
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
@@ -141,6 +132,30 @@ class PasswordChangeSerializer(serializers.Serializer):
         return user
 
 
+class TypeaheadUserSerializer(serializers.ModelSerializer):
+    """Minimal user row for autocomplete, no per-user queries"""
+    full_name = serializers.SerializerMethodField()
+    profile_image = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'full_name', 'profile_image', 'followers_count']
+    
+    def get_full_name(self, obj):
+        return f"{obj.first_name} {obj.last_name}".strip()
+    
+    def get_profile_image(self, obj):
+        if hasattr(obj, 'profile') and obj.profile.profile_image:
+            request = self.context.get('request')
+            if request:
+                return request.build_absolute_uri(obj.profile.profile_image.url)
+        return None
+    
+    def get_followers_count(self, obj):
+        return obj.profile.followers_count if hasattr(obj, 'profile') else 0
+
+
 class UserSearchSerializer(serializers.ModelSerializer):
     """Simplified serializer for user search results"""
     profile_image = serializers.SerializerMethodField()
@@ -160,7 +175,7 @@ class UserSearchSerializer(serializers.ModelSerializer):
         return None
     
     def get_followers_count(self, obj):
-        return obj.followers.count()
+        return obj.profile.followers_count if hasattr(obj, 'profile') else 0
     
     def get_is_following(self, obj):
         request = self.context.get('request')
@@ -176,4 +191,38 @@ class FollowersListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Follow
-        fields = ['id', 'follower', 'following', 'created_at']
\ No newline at end of file
+        fields = ['id', 'follower', 'following', 'created_at']
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    """Serializer for notifications; ``target`` relies on the content_object prefetch"""
+    sender = TypeaheadUserSerializer(read_only=True)
+    target = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Notification
+        fields = [
+            'id', 'notification_type', 'message', 'sender', 'actor_count',
+            'recent_actor_ids', 'target', 'is_read', 'created_at'
+        ]
+    
+    def get_target(self, obj):
+        target = obj.content_object
+        if isinstance(target, Post):
+            request = self.context.get('request')
+            image = request.build_absolute_uri(target.image.url) if target.image and request else None
+            return {'type': 'post', 'id': target.id, 'caption': target.caption[:100], 'image': image}
+        if isinstance(target, Comment):
+            return {'type': 'comment', 'id': target.id, 'post_id': target.post_id, 'content': target.content[:100]}
+        return None
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    """Either a list of notification ids or the newest notification to mark read along with everything older"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=500)
+    up_to = serializers.IntegerField(required=False)
+    
+    def validate(self, data):
+        if 'ids' not in data and 'up_to' not in data:
+            raise serializers.ValidationError("Provide 'ids' or 'up_to'.")
+        return data
@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from posts import storage
+from posts.models import Post, Comment, Follow
+from . import counters, notifications, typeahead
+from .models import UserProfile
+
+NAME_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def _cached_user(instance, field):
+    descriptor = getattr(type(instance), field)
+    return getattr(instance, field) if descriptor.is_cached(instance) else None
+
+
+def _adjust_follow_counts(follow, delta):
+    counters.adjust([follow.following_id], 'followers_count', delta)
+    counters.bump_cached(_cached_user(follow, 'following'), 'followers_count', delta)
+    counters.adjust([follow.follower_id], 'following_count', delta)
+    counters.bump_cached(_cached_user(follow, 'follower'), 'following_count', delta)
+    typeahead.adjust_followers([follow.following_id], delta)
+
+
+def _adjust_posts_count(post, delta):
+    counters.adjust([post.user_id], 'posts_count', delta)
+    counters.bump_cached(_cached_user(post, 'user'), 'posts_count', delta)
+
+
+@receiver(post_save, sender=User)
+def index_user_names(sender, instance, created, update_fields=None, **kwargs):
+    """Index new users and re-index renamed ones for typeahead"""
+    if created or update_fields is None or NAME_FIELDS & set(update_fields):
+        typeahead.sync_user(instance)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    """Keep follower/following counts in step with new follows"""
+    if created:
+        _adjust_follow_counts(instance, 1)
+
+
+@receiver(post_save, sender=Follow)
+def queue_follow_notification(sender, instance, created, **kwargs):
+    """Queue a follow notification in the follow's transaction"""
+    if created:
+        notifications.enqueue_event('follow', instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    """Keep follower/following counts in step with unfollows"""
+    _adjust_follow_counts(instance, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_posts(sender, instance, created, **kwargs):
+    """Keep UserProfile.posts_count in step with new and moderated posts"""
+    was_active = False if created else getattr(instance, '_loaded_is_active', None)
+    if was_active is not None and instance.is_active != was_active:
+        _adjust_posts_count(instance, 1 if instance.is_active else -1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender, instance, **kwargs):
+    """Hard-deleted active posts no longer count"""
+    if getattr(instance, '_loaded_is_active', instance.is_active):
+        _adjust_posts_count(instance, -1)
+
+
+@receiver(post_save, sender=Post)
+def notify_post_mentions(sender, instance, update_fields=None, **kwargs):
+    """Notify users @mentioned in a new or edited caption"""
+    if instance.is_active and (update_fields is None or 'caption' in update_fields):
+        notifications.create_mention_notifications(instance.user, instance.caption, instance)
+
+
+@receiver(post_save, sender=Comment)
+def queue_comment_notification(sender, instance, created, **kwargs):
+    """Queue a comment notification for the post's author in the comment's transaction"""
+    if created and instance.is_active:
+        notifications.create_comment_notification(instance, instance.user)
+
+
+@receiver(post_save, sender=Comment)
+def notify_comment_mentions(sender, instance, update_fields=None, **kwargs):
+    """Notify users @mentioned in a new or edited comment"""
+    if instance.is_active and (update_fields is None or 'content' in update_fields):
+        notifications.create_mention_notifications(instance.user, instance.content, instance)
+
+
+@receiver(post_delete, sender=UserProfile)
+def release_deleted_profile_image(sender, instance, **kwargs):
+    """Drop the deleted profile's reference to its image blob"""
+    storage.release(getattr(instance, '_loaded_image', instance.profile_image.name))
@@ -1,13 +1,29 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
 from PIL import Image
+import asyncio
 import io
+from datetime import timedelta
+from django.utils import timezone
 from .models import UserProfile
+from .notifications import (
+    Notification, NotificationEvent, drain_events, extract_mentions,
+    get_unread_notification_count, mark_all_notifications_read
+)
+from .digest import send_digests
+from .retention import prune_notifications
 from .forms import SignUpForm, ProfileForm, UserForm
-from posts.models import Post, Follow
+from posts.models import Post, Comment, Follow
 
 
 class UserProfileModelTest(TestCase):
@@ -109,6 +125,762 @@ class UserProfileModelTest(TestCase):
         self.assertEqual(self.profile.get_absolute_url(), expected_url)
 
 
+class ProfileCounterTest(TestCase):
+    """Test cases for the denormalized profile counters"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        UserProfile.objects.create(user=self.alice)
+        UserProfile.objects.create(user=self.bob)
+
+    def stored(self, user):
+        return UserProfile.objects.values_list(
+            'followers_count', 'following_count', 'posts_count'
+        ).get(user=user)
+
+    def test_follow_and_unfollow_adjust_counts(self):
+        """Following and unfollowing update both sides"""
+        follow = Follow.objects.create(follower=self.alice, following=self.bob)
+        self.assertEqual(self.stored(self.alice), (0, 1, 0))
+        self.assertEqual(self.stored(self.bob), (1, 0, 0))
+
+        follow.delete()
+        self.assertEqual(self.stored(self.alice), (0, 0, 0))
+        self.assertEqual(self.stored(self.bob), (0, 0, 0))
+
+    def test_post_lifecycle_adjusts_posts_count(self):
+        """Posts count tracks creation, soft-delete, restore and hard delete"""
+        post = Post.objects.create(user=self.alice, caption='Hello')
+        self.assertEqual(self.stored(self.alice)[2], 1)
+
+        post = Post.objects.get(pk=post.pk)
+        post.is_active = False
+        post.save()
+        self.assertEqual(self.stored(self.alice)[2], 0)
+
+        post.is_active = True
+        post.save()
+        self.assertEqual(self.stored(self.alice)[2], 1)
+
+        Post.objects.get(pk=post.pk).delete()
+        self.assertEqual(self.stored(self.alice)[2], 0)
+
+    def test_new_profile_starts_from_existing_rows(self):
+        """A lazily created profile counts what already exists"""
+        carol = User.objects.create_user(username='carol', password='testpass123')
+        Follow.objects.create(follower=self.alice, following=carol)
+        Post.objects.create(user=carol, caption='Before profile')
+
+        profile = UserProfile.objects.create(user=carol)
+        self.assertEqual((profile.followers_count, profile.following_count, profile.posts_count), (1, 0, 1))
+
+    def test_counts_read_without_queries(self):
+        """Reading the counters does not count the follows table"""
+        profile = UserProfile.objects.get(user=self.bob)
+        with self.assertNumQueries(0):
+            profile.get_followers_count()
+            profile.get_following_count()
+            profile.get_posts_count()
+
+    def test_reconcile_command_repairs_drift(self):
+        """reconcile_profile_counters recomputes drifted profiles"""
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        Post.objects.create(user=self.bob, caption='Hello')
+        UserProfile.objects.update(followers_count=7, following_count=7, posts_count=7)
+
+        out = io.StringIO()
+        call_command('reconcile_profile_counters', chunk_size=1, stdout=out)
+        self.assertIn('Repaired 2 drifted profiles out of 2', out.getvalue())
+        self.assertEqual(self.stored(self.alice), (0, 1, 0))
+        self.assertEqual(self.stored(self.bob), (1, 0, 1))
+
+    def test_suggested_users_ordered_by_counter_and_capped(self):
+        """Suggestions rank by the follower counter, keep users without a profile and stop at 20"""
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        popular = User.objects.create_user(username='popular', password='testpass123')
+        UserProfile.objects.create(user=popular)
+        Follow.objects.create(follower=self.bob, following=popular)
+        for i in range(25):
+            User.objects.create_user(username=f'quiet{i}', password='testpass123')  # No profile yet
+        self.client.force_login(self.alice)
+
+        data = self.client.get(reverse('suggested-users')).json()
+        usernames = [item['username'] for item in data['results']]
+        self.assertEqual(len(usernames), 20)
+        self.assertIsNone(data['next'])
+        self.assertNotIn('bob', usernames)  # Already followed
+        self.assertEqual(usernames[:3], ['popular', 'quiet24', 'quiet23'])
+
+
+class TypeaheadTest(TestCase):
+    """Test cases for the user autocomplete prefix index"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.anna = User.objects.create_user(username='anna_k', first_name='Anna', last_name='Kowalska', password='testpass123')
+        self.annie = User.objects.create_user(username='annie', first_name='Zoë', last_name='Brown', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', first_name='Bob', last_name='Annandale', password='testpass123')
+        for follower in (self.anna, self.bob):
+            Follow.objects.create(follower=follower, following=self.annie)
+
+    def usernames(self, query, **params):
+        response = self.client.get(reverse('user-typeahead'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['username'] for item in response.json()['results']]
+
+    def test_prefix_matches_ranked_by_followers(self):
+        """Short and long prefixes match any name, most followed first"""
+        self.assertEqual(self.usernames('an'), ['annie', 'anna_k', 'bob'])
+        self.assertEqual(self.usernames('ANNA'), ['anna_k', 'bob'])
+        self.assertEqual(self.usernames('anna k'), ['anna_k'])
+        self.assertEqual(self.usernames('zoe'), ['annie'])
+        self.assertEqual(self.usernames('an', limit=1), ['annie'])
+        self.assertEqual(self.usernames(''), [])
+
+    def test_follows_update_ranking(self):
+        """Follower count copies follow follows and unfollows"""
+        Follow.objects.create(follower=self.annie, following=self.bob)
+        Follow.objects.create(follower=self.anna, following=self.bob)
+        Follow.objects.create(follower=User.objects.create_user(username='zed', password='x'), following=self.bob)
+        self.assertEqual(self.usernames('an')[0], 'bob')
+        Follow.objects.filter(following=self.bob).delete()
+        self.assertEqual(self.usernames('an')[0], 'annie')
+
+    def test_username_change_through_user_form(self):
+        """Renaming through UserForm re-indexes the user"""
+        form = UserForm(data={'username': 'karolina', 'email': 'k@example.com',
+                              'first_name': 'Anna', 'last_name': 'Kowalska'}, instance=self.anna)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(self.usernames('karo'), ['karolina'])
+        self.assertEqual(self.usernames('anna_'), [])
+
+    def test_long_prefix_ranked_by_followers(self):
+        """Longer queries return the most followed match, wherever its name sorts"""
+        for suffix in 'abcd':
+            User.objects.create_user(username=f'annab{suffix}', password='x')
+        popular = User.objects.create_user(username='annabz', password='x')
+        Follow.objects.create(follower=self.bob, following=popular)
+        self.assertEqual(self.usernames('annab', limit=1), ['annabz'])
+        self.assertEqual(self.usernames('annab')[:2], ['annabz', 'annaba'])
+
+    def test_search_pages_fall_back_to_substring_matches(self):
+        """The search pages list prefix matches first, then names that only contain the query"""
+        from .typeahead import search_names
+        self.assertEqual([user.username for user in search_names('nn')], ['anna_k', 'annie', 'bob'])
+        self.assertEqual([user.username for user in search_names('an', limit=3)], ['annie', 'anna_k', 'bob'])
+        response = self.client.get(reverse('search'), {'q': 'nnie'})
+        self.assertEqual([user.username for user in response.context['users']], ['annie'])
+
+    def test_rename_keeps_profile_follower_count(self):
+        """Re-indexing reads the follower count from the profile counter"""
+        from .models import UserSearchKey
+        UserProfile.objects.create(user=self.annie)
+        self.annie.refresh_from_db()
+        self.annie.first_name = 'Zoya'
+        with self.assertNumQueries(4):
+            self.annie.save()
+        counts = set(UserSearchKey.objects.filter(user=self.annie).values_list('followers_count', flat=True))
+        self.assertEqual(counts, {2})
+
+    def test_lookup_uses_index_only(self):
+        """A lookup is one index query plus loading the matched users"""
+        from .typeahead import typeahead
+        with self.assertNumQueries(2):
+            typeahead('an')
+        with self.assertNumQueries(2):
+            typeahead('anna kowal')
+
+    def test_rebuild_command(self):
+        """rebuild_typeahead restores the index"""
+        from .models import UserSearchKey
+        UserSearchKey.objects.all().delete()
+        call_command('rebuild_typeahead', stdout=io.StringIO())
+        self.assertEqual(self.usernames('an'), ['annie', 'anna_k', 'bob'])
+
+
+class MentionNotificationTest(TestCase):
+    """Test cases for @mention notifications"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.friends = [User.objects.create(username=f'friend{i}') for i in range(30)]
+        self.post = Post.objects.create(user=self.author, caption='Hello')
+
+    def mentions(self, count):
+        return ' '.join(f'@friend{i}' for i in range(count))
+
+    def test_extract_mentions(self):
+        """Test username parsing"""
+        self.assertEqual(
+            extract_mentions('Hi @anna.k and @bob. Mail me at me@example.com, @anna.k again'),
+            ['anna.k', 'bob']
+        )
+
+    def test_comment_mentions_cost_constant_queries(self):
+        """Test that 30 mentions cost the same number of queries as 1"""
+        Comment.objects.create(post=self.post, user=self.author, content='warm up @friend0')
+        costs = []
+        for count in (1, 30):
+            with CaptureQueriesContext(connection) as queries:
+                Comment.objects.create(post=self.post, user=self.author, content=self.mentions(count))
+            costs.append(len(queries))
+        self.assertEqual(costs[0], costs[1])
+        self.assertEqual(Notification.objects.filter(notification_type='mention').count(), 1 + 1 + 30)
+
+    def test_deduplicated_per_recipient(self):
+        """Test that repeated mentions and edits notify each user once"""
+        self.post.caption = '@friend1 @friend1 @author @nobody @friend2'
+        self.post.save()
+        self.post.caption = '@friend1 @friend2 @friend3'
+        self.post.save()
+        notified = Notification.objects.filter(notification_type='mention', object_id=self.post.id)
+        self.assertEqual(sorted(notified.values_list('recipient__username', flat=True)), ['friend1', 'friend2', 'friend3'])
+        self.assertEqual(notified.first().message, 'author mentioned you in a post')
+
+    def test_respects_notification_setting(self):
+        """Test that users with notifications off are skipped"""
+        UserProfile.objects.create(user=self.friends[0], email_notifications=False)
+        Comment.objects.create(post=self.post, user=self.author, content=self.mentions(2))
+        self.assertEqual(
+            list(Notification.objects.values_list('recipient__username', flat=True)), ['friend1']
+        )
+
+
+class NotificationOutboxTest(TestCase):
+    """Test cases for queued like/comment/follow notifications"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.fan = User.objects.create_user(username='fan', password='testpass123')
+        self.post = Post.objects.create(user=self.author, caption='Hello')
+        self.client.force_login(self.fan)
+
+    def test_actions_queue_events_only(self):
+        """Test that likes, comments and follows write events, not notifications"""
+        self.client.put(reverse('post-like', kwargs={'pk': self.post.id}))
+        self.client.post(
+            reverse('post-add-comment', kwargs={'pk': self.post.id}),
+            {'post': self.post.id, 'content': 'Nice'}, content_type='application/json'
+        )
+        Follow.objects.create(follower=self.fan, following=self.author)
+        self.post.add_like(self.author)  # Self-actions are not queued
+
+        self.assertEqual(
+            sorted(NotificationEvent.objects.values_list('event_type', flat=True)), ['comment', 'follow', 'like']
+        )
+        self.assertFalse(Notification.objects.exists())
+
+    def test_drain_creates_notifications(self):
+        """Test that draining turns events into notifications in batches"""
+        self.post.add_like(self.fan)
+        comment = Comment.objects.create(post=self.post, user=self.fan, content='Nice')
+        Follow.objects.create(follower=self.fan, following=self.author)
+
+        self.assertEqual(drain_events(batch_size=2), 2)
+        self.assertEqual(drain_events(batch_size=2), 1)
+        self.assertEqual(drain_events(), 0)
+        self.assertFalse(NotificationEvent.objects.exists())
+        messages = dict(self.author.notifications.values_list('notification_type', 'message'))
+        self.assertEqual(messages, {
+            'like': 'fan liked your post',
+            'comment': 'fan commented on your post',
+            'follow': 'fan started following you',
+        })
+        self.assertEqual(self.author.notifications.get(notification_type='comment').content_object, comment)
+
+    def test_drain_cost_is_constant(self):
+        """Test that a batch costs the same queries for 1 or 20 events"""
+        fans = [User.objects.create(username=f'fan{i}') for i in range(20)]
+        other_post = Post.objects.create(user=self.author, caption='Another')
+        Follow.objects.create(follower=self.fan, following=self.author)
+        drain_events()  # Warm the content type cache
+        self.post.add_like(self.fan)
+        with CaptureQueriesContext(connection) as single:
+            drain_events()
+        for fan in fans:
+            other_post.add_like(fan)
+        with CaptureQueriesContext(connection) as many:
+            drain_events()
+        self.assertEqual(len(single), len(many))
+        self.assertEqual(self.author.notifications.get(object_id=other_post.id).actor_count, 20)
+
+    def test_drain_skips_muted_and_removed_targets(self):
+        """Test that muted recipients and removed comments get nothing"""
+        comment = Comment.objects.create(post=self.post, user=self.fan, content='Oops')
+        comment.is_active = False
+        comment.save()
+        other = User.objects.create(username='muted')
+        UserProfile.objects.create(user=other, email_notifications=False)
+        Follow.objects.create(follower=self.fan, following=other)
+
+        call_command('process_notifications', '--once', stdout=io.StringIO())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationEvent.objects.exists())
+
+    def test_only_delivered_events_are_published(self):
+        """Test that live pushes happen at drain time and skip muted recipients"""
+        from unittest import mock
+        muted = User.objects.create(username='muted')
+        UserProfile.objects.create(user=muted, email_notifications=False)
+        with mock.patch('users.notifications.publish_notification') as publish:
+            self.post.add_like(self.fan)
+            Follow.objects.create(follower=self.fan, following=muted)
+            publish.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                drain_events()
+        publish.assert_called_once_with(self.author.id, 'like', self.fan.id, self.post.id)
+
+
+class NotificationGroupingTest(TestCase):
+    """Test cases for folding likes and follows into grouped notifications"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(user=self.author, caption='Popular')
+        self.fans = [User.objects.create(username=f'fan{i}') for i in range(42)]
+
+    def like_all(self, fans):
+        for fan in fans:
+            self.post.add_like(fan)
+        drain_events()
+
+    def test_likes_fold_into_one_row(self):
+        """Test that many likes across batches produce one grouped notification"""
+        self.like_all(self.fans[:10])
+        self.like_all(self.fans[10:])
+        group = self.author.notifications.get()
+        self.assertEqual(group.message, 'fan41 and 41 others liked your post')
+        self.assertEqual(group.actor_count, 42)
+        self.assertEqual(group.recent_actor_ids, [self.fans[41].id, self.fans[40].id, self.fans[39].id])
+        self.assertEqual(group.sender, self.fans[41])
+        self.assertEqual(group.content_object, self.post)
+
+    def test_repeat_actor_counted_once(self):
+        """Test that liking again after unliking does not inflate the count"""
+        self.like_all(self.fans[:2])
+        self.post.remove_like(self.fans[0])
+        self.like_all(self.fans[:1])
+        group = self.author.notifications.get()
+        self.assertEqual(group.actor_count, 2)
+        self.assertEqual(group.message, 'fan0 and 1 other liked your post')
+
+    def test_new_activity_reopens_and_window_closes(self):
+        """Test that grouped rows are marked unread on new activity and stop growing after the window"""
+        self.like_all(self.fans[:1])
+        group = self.author.notifications.get()
+        group.mark_as_read()
+        self.like_all(self.fans[1:2])
+        group.refresh_from_db()
+        self.assertFalse(group.is_read)
+        self.assertEqual(group.actor_count, 2)
+
+        Notification.objects.update(created_at=timezone.now() - timedelta(hours=25))
+        self.like_all(self.fans[2:3])
+        self.assertEqual(self.author.notifications.count(), 2)
+        self.assertEqual(self.author.notifications.first().message, 'fan2 liked your post')
+
+    def test_follows_grouped_comments_not(self):
+        """Test that follows fold per recipient while comments stay separate"""
+        for fan in self.fans[:3]:
+            Follow.objects.create(follower=fan, following=self.author)
+            Comment.objects.create(post=self.post, user=fan, content='Hi')
+        drain_events()
+        self.assertEqual(
+            self.author.notifications.get(notification_type='follow').message,
+            'fan2 and 2 others started following you'
+        )
+        self.assertEqual(self.author.notifications.filter(notification_type='comment').count(), 3)
+
+
+class UnreadNotificationCounterTest(TestCase):
+    """Test cases for the cached unread notification counter"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        UserProfile.objects.create(user=self.author)
+        self.post = Post.objects.create(user=self.author, caption='Hello')
+        self.fans = [User.objects.create(username=f'fan{i}') for i in range(3)]
+        cache.clear()
+
+    def unread(self):
+        return get_unread_notification_count(self.author)
+
+    def test_counter_follows_notifications(self):
+        """Test increments on delivery and resets on read"""
+        self.assertEqual(self.unread(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                Comment.objects.create(post=self.post, user=fan, content='Hi @author')
+            self.post.add_like(self.fans[0])
+            drain_events()
+        self.assertEqual(self.unread(), 7)  # 3 comments, 3 mentions, 1 grouped like
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = self.author.notifications.filter(notification_type='like').get()
+            notification.mark_as_read()
+            notification.mark_as_read()
+        self.assertEqual(self.unread(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.fans[1])  # Reopens the read like group
+            drain_events()
+        self.assertEqual(self.unread(), 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_all_notifications_read(self.author)
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(UserProfile.objects.get(user=self.author).unread_notifications_count, 0)
+
+    def test_navbar_badge(self):
+        """Test that the navbar bell shows the unread count, and no badge at zero"""
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('feed'))
+        self.assertNotContains(response, 'id="unread-notification-count"')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.fans[0])
+            drain_events()
+        response = self.client.get(reverse('feed'))
+        self.assertContains(response, '<span class="badge rounded-pill bg-danger" id="unread-notification-count">1</span>', html=True)
+
+    def test_badge_read_skips_notifications_table(self):
+        """Test that reading the count never queries the notifications table"""
+        self.post.add_like(self.fans[0])
+        drain_events()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.unread(), 1)  # Cache miss: loads the profile column
+            self.assertEqual(self.unread(), 1)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('users_notification', queries[0]['sql'])
+
+    def test_reconcile_repairs_counter(self):
+        """Test that reconcile_profile_counters fixes drift and the cached value"""
+        self.post.add_like(self.fans[0])
+        drain_events()
+        UserProfile.objects.filter(user=self.author).update(unread_notifications_count=5)
+        cache.clear()
+        self.assertEqual(self.unread(), 5)
+        call_command('reconcile_profile_counters', stdout=io.StringIO())
+        self.assertEqual(self.unread(), 1)
+
+
+class NotificationAPITest(TestCase):
+    """Test cases for the notifications API"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        UserProfile.objects.create(user=self.author)
+        self.fans = [User.objects.create(username=f'fan{i}') for i in range(6)]
+        self.posts = [Post.objects.create(user=self.author, caption=f'Post {i}') for i in range(3)]
+        for post, fan in zip(self.posts, self.fans):
+            post.add_like(fan)
+        for fan in self.fans[3:]:
+            Comment.objects.create(post=self.posts[0], user=fan, content='Nice')
+            Follow.objects.create(follower=fan, following=self.author)
+        drain_events()
+        cache.clear()
+        self.client.force_login(self.author)
+        self.url = reverse('notification-list')
+
+    def test_list_pages_and_targets(self):
+        """Test cursor pagination and bulk-loaded targets"""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url, {'page_size': 4}).json()
+        # Targets are prefetched once per content type, not per row
+        self.assertEqual(sum('FROM "posts_post"' in query['sql'] for query in queries), 1)
+        self.assertEqual(sum('FROM "posts_comment"' in query['sql'] for query in queries), 1)
+        self.assertEqual(data['unread_count'], 7)
+
+        results = data['results']
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            results.extend(data['results'])
+        self.assertEqual(len(results), 7)  # 3 likes, 3 comments, 1 grouped follow
+        self.assertEqual(results, sorted(results, key=lambda item: (item['created_at'], item['id']), reverse=True))
+        targets = {item['notification_type']: item['target'] for item in results}
+        self.assertEqual(targets['comment']['post_id'], self.posts[0].id)
+        self.assertEqual(targets['like']['type'], 'post')
+        self.assertIsNone(targets['follow'])
+
+    def test_mark_read_by_ids(self):
+        """Test marking a list of ids read with one UPDATE"""
+        ids = list(self.author.notifications.values_list('id', flat=True)[:2])
+        other = Notification.objects.create(recipient=self.fans[0], sender=self.author, notification_type='follow', message='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('notification-mark-read'), {'ids': ids + [other.id]}, content_type='application/json'
+            )
+        self.assertEqual(response.json(), {'marked_read': 2, 'unread_count': 5})
+        other.refresh_from_db()
+        self.assertFalse(other.is_read)
+
+    def test_mark_read_up_to(self):
+        """Test marking a notification and everything older read"""
+        ordered = list(self.author.notifications.order_by('-created_at', '-id').values_list('id', flat=True))
+        response = self.client.post(
+            reverse('notification-mark-read'), {'up_to': ordered[2]}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['marked_read'], 5)
+        self.assertEqual(
+            list(self.author.notifications.filter(is_read=False).order_by('-created_at', '-id').values_list('id', flat=True)),
+            ordered[:2]
+        )
+        self.assertEqual(self.client.post(reverse('notification-mark-read'), {}).status_code, 400)
+
+
+class NotificationRetentionTest(TestCase):
+    """Test cases for notification pruning"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        UserProfile.objects.create(user=self.reader)
+        cache.clear()
+
+    def notify(self, days_ago, is_read=False):
+        notification = Notification.objects.create(
+            recipient=self.reader, sender=self.sender, notification_type='follow',
+            message='sender started following you', is_read=is_read
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        if not is_read:
+            UserProfile.objects.filter(user=self.reader).update(
+                unread_notifications_count=F('unread_notifications_count') + 1
+            )
+        return notification
+
+    def test_prunes_old_read_notifications_in_chunks(self):
+        """Test that only read notifications past the retention age are removed, chunk by chunk"""
+        old_read = [self.notify(100, is_read=True) for _ in range(5)]
+        old_unread = self.notify(100)
+        recent_read = self.notify(1, is_read=True)
+        chunks = []
+
+        removed = prune_notifications(days=90, max_per_user=0, chunk_size=2, progress=lambda *chunk: chunks.append(chunk))
+
+        self.assertEqual(removed, 5)
+        self.assertEqual(
+            set(Notification.objects.values_list('id', flat=True)), {old_unread.id, recent_read.id}
+        )
+        self.assertEqual(len(chunks), 3)  # Ids of the six old rows, two per chunk
+        self.assertEqual(sum(chunk[3] for chunk in chunks), 5)
+        self.assertTrue(all(chunk[2] - chunk[1] < 2 for chunk in chunks))
+        self.assertEqual(chunks[0][1], old_read[0].id)
+
+    def test_caps_notifications_per_user(self):
+        """Test that only the newest notifications are kept and the unread counter follows"""
+        notifications = [self.notify(days_ago) for days_ago in range(6, 0, -1)]  # Oldest first, all unread
+
+        with self.captureOnCommitCallbacks(execute=True):
+            removed = prune_notifications(days=0, max_per_user=4, chunk_size=1)
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(
+            list(Notification.objects.order_by('id').values_list('id', flat=True)),
+            [notification.id for notification in notifications[2:]]
+        )
+        self.assertEqual(get_unread_notification_count(self.reader), 4)
+        self.assertEqual(UserProfile.objects.get(user=self.reader).unread_notifications_count, 4)
+
+    def test_command_reports_chunks(self):
+        """Test that the command reports rows removed and time per chunk"""
+        self.notify(100, is_read=True)
+        output = io.StringIO()
+        call_command('prune_notifications', '--days', '30', stdout=output)
+        self.assertIn('expired: ids', output.getvalue())
+        self.assertIn('removed 1 rows in', output.getvalue())
+        self.assertIn('Removed 1 notifications', output.getvalue())
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """Locmem backend that counts how often a connection is opened"""
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+
+@override_settings(
+    EMAIL_BACKEND='users.tests.CountingEmailBackend',
+    NOTIFICATION_DIGEST_WINDOW_MINUTES=60
+)
+class NotificationDigestTest(TestCase):
+    """Test cases for batched notification email digests"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.recipients = [
+            User.objects.create_user(username=f'reader{i}', email=f'reader{i}@example.com', password='testpass123')
+            for i in range(3)
+        ]
+        CountingEmailBackend.opened = 0
+
+    def notify(self, recipient, message, minutes_ago=90, **extra):
+        notification = Notification.objects.create(
+            recipient=recipient, sender=self.sender, notification_type='mention', message=message, **extra
+        )
+        Notification.objects.filter(pk=notification.pk).update(
+            created_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        return notification
+
+    def test_one_digest_per_recipient_over_one_connection(self):
+        """Test that each recipient gets one email and the run opens one connection"""
+        for recipient in self.recipients:
+            self.notify(recipient, 'sender mentioned you in a post')
+            self.notify(recipient, 'sender mentioned you in a comment')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(send_digests(batch_size=10), 3)
+        self.assertEqual(len(queries), 4)  # Due recipients, then users, notifications and UPDATE
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [r.email for r in self.recipients])
+        digest = mail.outbox[0]
+        self.assertEqual(digest.subject, 'You have 2 new notifications on Instaclone')
+        self.assertIn('sender mentioned you in a post', digest.body)
+        self.assertIn('sender mentioned you in a comment', digest.alternatives[0][0])
+        self.assertFalse(Notification.objects.filter(emailed_at__isnull=True).exists())
+
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_batches_share_the_connection(self):
+        """Test that several batches are sent over the same open connection"""
+        for recipient in self.recipients:
+            self.notify(recipient, 'sender mentioned you in a post')
+        self.assertEqual(send_digests(batch_size=1), 3)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    def test_waits_for_window(self):
+        """Test that nothing is sent until the oldest unsent notification is old enough"""
+        self.notify(self.recipients[0], 'sender mentioned you in a post', minutes_ago=5)
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(CountingEmailBackend.opened, 0)
+
+        self.notify(self.recipients[0], 'sender mentioned you in a comment', minutes_ago=61)
+        self.assertEqual(send_digests(), 1)
+        self.assertIn('You have 2 new notifications', mail.outbox[0].subject)
+
+    def test_skips_read_and_unreachable(self):
+        """Test that read notifications and users without email or with emails off are marked but not sent"""
+        self.notify(self.recipients[0], 'already seen', is_read=True)
+        UserProfile.objects.create(user=self.recipients[1], email_notifications=False)
+        self.notify(self.recipients[1], 'muted')
+        self.recipients[2].email = ''
+        self.recipients[2].save()
+        self.notify(self.recipients[2], 'no address')
+
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(Notification.objects.filter(emailed_at__isnull=True).exists())
+
+    def test_regrouped_notification_is_emailed_again(self):
+        """Test that new activity on an emailed group puts it back into the next digest"""
+        UserProfile.objects.create(user=self.recipients[0])
+        post = Post.objects.create(user=self.recipients[0], caption='Hello')
+        fan = User.objects.create(username='fan')
+        post.add_like(self.sender)
+        drain_events()
+        Notification.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(send_digests(), 1)
+
+        post.add_like(fan)
+        drain_events()
+        group = Notification.objects.get()
+        self.assertIsNone(group.emailed_at)
+        Notification.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(send_digests(), 1)
+        self.assertIn('fan and 1 other liked your post', mail.outbox[1].body)
+
+
+class EventStreamTest(TestCase):
+    """Test cases for the Server-Sent Events stream"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='viewer', password='testpass123')
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(user=self.author, caption='Live')
+
+    def request(self, user, **params):
+        from django.test import RequestFactory
+
+        async def auser():
+            return user
+
+        request = RequestFactory().get(reverse('notification-stream'), params)
+        request.auser = auser
+        return request
+
+    def like(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.user)
+
+    def follow(self):
+        Follow.objects.create(follower=self.author, following=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            drain_events()
+
+    async def open_stream(self, **params):
+        from .realtime import event_stream
+        response = await event_stream(self.request(self.user, **params))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)  # Let the stream subscribe
+        return stream, pending
+
+    async def test_streams_like_counts_and_notifications(self):
+        """Test that likes and notifications reach a subscribed client"""
+        from asgiref.sync import sync_to_async
+        from .realtime import get_broker
+        stream, pending = await self.open_stream(posts=f'{self.post.id},abc')
+        await sync_to_async(self.like)()
+        message = await asyncio.wait_for(pending, 1)
+        self.assertEqual(message, f'event: like_count\ndata: {{"post_id": {self.post.id}, "total_likes": 1}}\n\n'.encode())
+
+        await sync_to_async(self.follow)()
+        message = await asyncio.wait_for(anext(stream), 1)
+        self.assertTrue(message.startswith(b'event: notification\ndata: {"type": "follow"'))
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        pending.cancel()  # What the ASGI handler does when the client disconnects
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(get_broker().connection_count(), 0)
+
+    @override_settings(SSE_HEARTBEAT_SECONDS=0.01)
+    async def test_heartbeat_when_idle(self):
+        """Test that idle streams send keep-alive comments"""
+        stream, pending = await self.open_stream()
+        self.assertEqual(await asyncio.wait_for(pending, 1), b': keep-alive\n\n')
+        self.assertEqual(await asyncio.wait_for(anext(stream), 1), b': keep-alive\n\n')
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    async def test_requires_authentication(self):
+        """Test that anonymous clients are refused"""
+        from django.contrib.auth.models import AnonymousUser
+        from .realtime import event_stream
+        response = await event_stream(self.request(AnonymousUser()))
+        self.assertEqual(response.status_code, 403)
+
+
 class UserViewTest(TestCase):
     """Test cases for User views"""
     
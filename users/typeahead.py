@@ -0,0 +1,125 @@
+"""
+Prefix index for user autocomplete.
+
+Each user gets UserSearchKey rows for the normalized (lowercase, accent-free)
+username, first name, last name and full name: one row per prefix of each
+name, up to the whole name.
+
+Every query is then an exact lookup on ``key``, and the
+``(key, -followers_count)`` index returns the matches already ranked, so the
+most followed users come first without sorting the thousands of users
+sharing a prefix, however long the query is. Names are a few dozen
+characters at most, so this costs a few dozen small rows per user.
+
+Rows carry a copy of the profile's follower counter, kept in step by the
+follow signals, and are rewritten when a user's names change.
+"""
+import unicodedata
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Q
+
+from .models import UserProfile, UserSearchKey
+
+MAX_KEY_LENGTH = 150
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse whitespace"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())[:MAX_KEY_LENGTH]
+
+
+def keys_for(username, first_name='', last_name=''):
+    """Every index key of a user with these names"""
+    names = {normalize(username), normalize(first_name), normalize(last_name),
+             normalize(f'{first_name} {last_name}')}
+    keys = set()
+    for name in filter(None, names):
+        # Queries are normalized too, so they never end in a space
+        keys.update(name[:length].rstrip() for length in range(1, len(name) + 1))
+    return keys
+
+
+def sync_user(user):
+    """Rewrite a user's index rows from their current names"""
+    try:
+        followers = user.profile.followers_count
+    except UserProfile.DoesNotExist:
+        # Users without a profile have no counter to read
+        followers = user.followers.count()
+    UserSearchKey.objects.filter(user=user).delete()
+    UserSearchKey.objects.bulk_create([
+        UserSearchKey(key=key, user=user, followers_count=followers)
+        for key in keys_for(user.username, user.first_name, user.last_name)
+    ])
+
+
+def adjust_followers(user_ids, delta):
+    """Keep the ranking copy of the follower count in step with UserProfile"""
+    UserSearchKey.objects.filter(user_id__in=user_ids).update(followers_count=F('followers_count') + delta)
+
+
+def matching_user_ids(query, limit=DEFAULT_LIMIT):
+    """Ids of up to ``limit`` users with a name starting with ``query``, most followed first"""
+    query = normalize(query)
+    if not query:
+        return []
+    # Keys are unique per user, so the rows are distinct users in rank order
+    return list(UserSearchKey.objects.filter(key=query).order_by(
+        '-followers_count', 'user_id'
+    ).values_list('user_id', flat=True)[:limit])
+
+
+def typeahead(query, limit=DEFAULT_LIMIT, queryset=None):
+    """Users with a name starting with ``query``, most followed first"""
+    user_ids = matching_user_ids(query, limit)
+    queryset = queryset if queryset is not None else User.objects.select_related('profile')
+    users = queryset.in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def search_names(query, limit=DEFAULT_LIMIT, queryset=None):
+    """
+    Users for the search pages: ``typeahead`` matches first, then, if fewer
+    than ``limit`` names start with ``query``, users whose username, first
+    or last name merely contains it. The substring scan only runs for queries
+    the prefix index cannot fill.
+    """
+    queryset = queryset if queryset is not None else User.objects.select_related('profile')
+    users = typeahead(query, limit, queryset)
+    query = query.strip()
+    if query and len(users) < limit:
+        users += list(queryset.filter(
+            Q(username__icontains=query) |
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query)
+        ).exclude(id__in=[user.id for user in users]).order_by('username')[:limit - len(users)])
+    return users
+
+
+def rebuild(chunk_size=1000, progress=None):
+    """Rebuild every user's index rows; returns the number of users indexed"""
+    indexed = 0
+    last_id = 0
+    while True:
+        chunk = list(User.objects.filter(id__gt=last_id).order_by('id').annotate(
+            followers_total=Count('followers')
+        ).values_list('id', 'username', 'first_name', 'last_name', 'followers_total')[:chunk_size])
+        if not chunk:
+            break
+        ids = [row[0] for row in chunk]
+        UserSearchKey.objects.filter(user_id__in=ids).delete()
+        UserSearchKey.objects.bulk_create([
+            UserSearchKey(key=key, user_id=user_id, followers_count=followers)
+            for user_id, username, first_name, last_name, followers in chunk
+            for key in keys_for(username, first_name, last_name)
+        ], batch_size=chunk_size)
+        indexed += len(chunk)
+        last_id = ids[-1]
+        if progress:
+            progress(indexed)
+    return indexed
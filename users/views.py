@@ -22,7 +22,7 @@ def profile_view(request, username):
         posts = Post.objects.filter(
             user=user, 
             is_active=True
-        ).select_related('user').prefetch_related('likes', 'comments').order_by('-created_at')
+        ).select_related('user').prefetch_related('renditions').order_by('-created_at')
         
         # Safe image handling
         if profile.profile_image and profile.profile_image.name:
@@ -36,9 +36,9 @@ def profile_view(request, username):
             'user_obj': user,  # Add user object for template
             'posts': posts,
             'profile_image_url': image_url,
-            'posts_count': posts.count(),
-            'followers_count': user.followers.count() if hasattr(user, 'followers') else 0,
-            'following_count': user.following.count() if hasattr(user, 'following') else 0,
+            'posts_count': profile.posts_count,
+            'followers_count': profile.followers_count,
+            'following_count': profile.following_count,
         }
         
         return render(request, 'users/profile.html', context)